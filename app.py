@@ -1,10 +1,13 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-import db_manager, db_setup
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context
+import db_manager, update_db_schema, thumbnails, importer, exporter, forecast, mailer, users, metrics, assets, movegen
+import gzip
+import hmac
+import io
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_mail import Mail, Message
-from werkzeug.security import generate_password_hash, check_password_hash
 import random
 import string
+from urllib.parse import quote as url_quote
 import os                     # <--- NUOVO IMPORT
 from dotenv import load_dotenv # <--- NUOVO IMPORT
 
@@ -18,9 +21,10 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'chiave-di-fallback-non-sicura')
 
 # --- CONFIGURAZIONE EMAIL (GMAIL) ---
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+# Server e porta si possono cambiare dal .env (es. un server SMTP locale per i test)
+app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', '1').lower() in ('1', 'true', 'yes')
 
 # Qui leggiamo le credenziali del MITTENTE dal file .env
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
@@ -30,34 +34,48 @@ app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_USERNAME')
 
 mail = Mail(app)
+# Le email partono da un thread in background: il login non aspetta il server SMTP
+mail_queue = mailer.MailQueue(app, mail)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login' # Se non sei loggato, ti manda qui
 
-# --- UTENTE UNICO (Hardcoded per semplicità) ---
-# In futuro potrai metterlo nel DB, ma per ora va bene così per uso personale.
-# Password di esempio: "password_scacchi" (La hash è generata per sicurezza)
-# --- UTENTE UNICO ---
-MY_USER = {
-    "id": "1",
-    "username": "admin",
-    # Puoi anche mettere la password hash nel .env se vuoi, ma per ora va bene qui
-    "password_hash": generate_password_hash("password_scacchi"), 
-    
-    # Qui leggiamo la mail del DESTINATARIO (dove arriva il codice)
-    "email": os.getenv('RECEIVER_EMAIL') 
-}
+# --- METRICHE ---
+# Latenze, SQL, template e json.loads per rotta, esposte su /metrics.
+# Con PROFILE_SLOW_MS nel .env le richieste più lente vengono profilate (vedi metrics.py).
+metrics.init_app(app)
+
+# --- ASSET STATICI ---
+# JS/CSS minificati con l'hash nel nome, precompressi (gzip/brotli) e serviti da /assets
+# con cache immutabile; nei template si usa asset_url('js/chess.js') (vedi assets.py).
+assets.init_app(app)
+
+# --- SCHEMA DEL DATABASE ---
+# Applica solo le migrazioni mancanti (basta leggere PRAGMA user_version se è aggiornato).
+# Eseguito all'import così vale anche sotto gunicorn, non solo con "python app.py".
+_conn = db_manager.create_connection()
+if _conn:
+    update_db_schema.migrate(_conn)
+    _conn.close()
+
+# --- UTENTI (tabella users) ---
+# Al primo avvio si crea l'amministratore (credenziali da .env, vedi users.py);
+# gli altri si aggiungono con "python users.py add <username> --email ...".
+users.ensure_default_user()
 
 # Modello Utente per Flask-Login
 class User(UserMixin):
-    def __init__(self, id):
+    def __init__(self, id, username=None, email=None):
         self.id = id
+        self.username = username
+        self.email = email
 
 @login_manager.user_loader
 def load_user(user_id):
-    if user_id == MY_USER['id']:
-        return User(user_id)
-    return None
+    user = db_manager.get_user(int(user_id)) if str(user_id).isdigit() else None
+    if user is None:
+        return None
+    return User(user['id'], user['username'], user['email'])
 
 # --- ROTTE DI AUTENTICAZIONE ---
 
@@ -68,24 +86,22 @@ def login():
         password = request.form.get('password')
 
         # 1. Verifica Username e Password
-        if username == MY_USER['username'] and check_password_hash(MY_USER['password_hash'], password):
+        user = users.authenticate(username, password)
+        if user is not None:
             
             # 2. Genera Codice OTP (One Time Password)
             otp_code = ''.join(random.choices(string.digits, k=6))
             
             # 3. Salva codice in sessione (temporaneo)
             session['otp'] = otp_code
-            session['temp_user_id'] = MY_USER['id'] # Ricordiamo chi sta cercando di entrare
+            session['temp_user_id'] = user['id'] # Ricordiamo chi sta cercando di entrare
             
-            # 4. Invia Email
-            try:
-                msg = Message('Codice Accesso Scacchi', sender=app.config['MAIL_USERNAME'], recipients=[MY_USER['email']])
-                msg.body = f"Il tuo codice di verifica è: {otp_code}"
-                mail.send(msg)
-                flash('Credenziali corrette. Controlla la mail per il codice!', 'info')
-                return redirect(url_for('verify_2fa'))
-            except Exception as e:
-                return f"Errore invio mail: {e}"
+            # 4. Invia Email (in background: lo stato si segue da /verify_2fa/status)
+            msg = Message('Codice Accesso Scacchi', sender=app.config['MAIL_USERNAME'], recipients=[user['email']])
+            msg.body = f"Il tuo codice di verifica è: {otp_code}"
+            session['mail_job'] = mail_queue.submit(msg)
+            flash('Credenziali corrette. Controlla la mail per il codice!', 'info')
+            return redirect(url_for('verify_2fa'))
         
         flash('Username o Password errati.', 'error')
     
@@ -102,12 +118,17 @@ def verify_2fa():
         # 5. Verifica il codice
         if user_code == session.get('otp'):
             # LOGIN EFFETTIVO
-            user = User(session['temp_user_id'])
+            user = load_user(session['temp_user_id'])
+            if user is None:
+                # Utente eliminato nel frattempo
+                session.pop('otp', None)
+                return redirect(url_for('login'))
             login_user(user)
             
             # Pulizia sessione
             session.pop('otp', None)
             session.pop('temp_user_id', None)
+            session.pop('mail_job', None)
             
             return redirect(url_for('index'))
         else:
@@ -115,10 +136,23 @@ def verify_2fa():
             
     return render_template('verify_2fa.html')
 
+@app.route('/verify_2fa/status')
+def verify_2fa_status():
+    """Stato dell'invio del codice (queued / sending / sent / failed), interrogato dalla pagina di verifica."""
+    if 'otp' not in session:
+        return jsonify({'status': 'expired'}), 404
+    entry = mail_queue.status(session.get('mail_job'))
+    if entry is None:
+        # Invio gestito da un altro processo, o già dimenticato
+        return jsonify({'status': 'unknown'})
+    return jsonify({'status': entry['status'], 'attempts': entry['attempts'], 'error': entry['error']})
+
 @app.route('/logout')
 @login_required
 def logout():
     logout_user()
+    # La coda appartiene all'utente appena uscito
+    session.pop('review_queue', None)
     return redirect(url_for('login'))
 
 # --- ROTTE DELL'APP (ORA PROTETTE) ---
@@ -130,35 +164,133 @@ def index():
     if request.method == 'POST':
         selected_list = request.form.get('active_list')
         session['active_list'] = selected_list # Salva la scelta nella sessione
+        # Tag selezionati: si ripassano solo i problemi che li hanno tutti
+        session['active_tags'] = [t for t in request.form.getlist('active_tags') if t]
     
-    # 2. Recupera la scelta attuale (default: "Tutti")
+    # 2. Recupera la scelta attuale (default: "Tutti", nessun tag)
     current_list_filter = session.get('active_list', 'Tutti')
+    current_tags = session.get('active_tags', [])
 
-    # 3. Recupera i problemi filtrati
-    ready_problems = db_manager.get_problems_for_review(current_list_filter)
+    # 3. Conta i problemi in scadenza (solo conteggi aggregati, nessuna riga caricata)
+    due_counts = db_manager.get_due_counts(current_user.id, current_list_filter, tags=current_tags)
+    due_by_list = db_manager.get_due_counts_by_list(current_user.id)
     
-    # 4. Recupera tutte le liste disponibili per il menu a tendina
-    available_lists = db_manager.get_unique_lists()
+    # 4. Recupera tutte le liste e tutti i tag (con i problemi in scadenza) per i menu
+    available_lists = [entry for entry in db_manager.get_list_catalog(current_user.id) if entry['name']]
+    available_tags = db_manager.get_tags_with_due_counts(current_user.id, current_list_filter)
+
+    # 5. Anteprima del prossimo problema (solo id e FEN)
+    next_preview = (db_manager.get_next_due_preview(current_user.id, current_list_filter, tags=current_tags)
+                    if due_counts['now'] else None)
 
     return render_template('index.html', 
-                           num_ready=len(ready_problems), 
+                           num_ready=due_counts['now'], 
+                           next_preview=next_preview,
+                           due_counts=due_counts,
+                           due_by_list=due_by_list,
                            available_lists=available_lists,
-                           current_filter=current_list_filter)
+                           available_tags=available_tags,
+                           current_filter=current_list_filter,
+                           current_tags=current_tags)
+
+# --- Coda di revisione prefetch (in sessione) ---
+# Teniamo in sessione gli ID dei prossimi REVIEW_QUEUE_SIZE problemi: ogni ciclo
+# valutazione -> problema successivo legge una sola riga, qualunque sia l'arretrato.
+REVIEW_QUEUE_SIZE = 20
+
+def _load_review_queue():
+    """Restituisce la coda della sessione, azzerandola se è cambiato l'utente o il filtro lista o tag."""
+    current_list_filter = session.get('active_list', 'Tutti')
+    current_tags = session.get('active_tags', [])
+    queue = session.get('review_queue')
+    if (not queue or queue.get('user') != current_user.id or queue.get('filter') != current_list_filter
+            or queue.get('tags', []) != current_tags):
+        # new_after: ultimo problema nuovo già messo in coda (vedi db_manager.get_review_queue_ids)
+        queue = {'user': current_user.id, 'filter': current_list_filter, 'tags': current_tags,
+                 'ids': [], 'new_after': None}
+    return queue
+
+def _peek_review_queue(count=1):
+    """
+    Restituisce fino a `count` problemi dalla testa della coda (senza toglierli),
+    scartando quelli non più in scadenza e ricaricando la coda dal DB al massimo
+    una volta, solo quando non basta.
+    """
+    queue = _load_review_queue()
+    problems = []
+    refilled = False
+    i = 0
+    while len(problems) < count:
+        if i >= len(queue['ids']):
+            if refilled:
+                break
+            fresh_ids, queue['new_after'] = db_manager.get_review_queue_ids(
+                current_user.id, queue['filter'], limit=REVIEW_QUEUE_SIZE,
+                tags=queue.get('tags'), after_new_id=queue.get('new_after'))
+            queue['ids'] += [pid for pid in fresh_ids if pid not in queue['ids']]
+            refilled = True
+            continue
+        # Il problema potrebbe essere stato ripassato o eliminato nel frattempo
+        problem = db_manager.get_due_problem(current_user.id, queue['ids'][i])
+        if problem is None:
+            queue['ids'].pop(i)
+        else:
+            problems.append(problem)
+            i += 1
+    session['review_queue'] = queue
+    return problems
+
+def _next_review_problem():
+    """Restituisce il problema in testa alla coda, o None se non c'è nulla da ripassare."""
+    problems = _peek_review_queue(1)
+    return problems[0] if problems else None
+
+def _pop_review_queue(problem_id):
+    """Toglie dalla coda un problema appena valutato."""
+    queue = _load_review_queue()
+    if problem_id in queue['ids']:
+        queue['ids'].remove(problem_id)
+    session['review_queue'] = queue
+
+def _problem_payload(problem):
+    """Dati di un problema necessari alla pagina di revisione (per le risposte JSON)."""
+    if problem is None:
+        return None
+    return {
+        'id': problem['id'],
+        'fen': problem['fen'],
+        'solution_moves': problem['solution_moves'],
+        # Precalcolate da movegen: la pagina non rigioca la linea (None per i problemi non validati)
+        'solution_uci': problem.get('solution_uci'),
+        'solution_fens': problem.get('solution_fens'),
+        'tags': problem['tags'],
+        'white_player': problem['white_player'],
+        'black_player': problem['black_player'],
+        'game_year': problem['game_year'],
+        'tournament': problem['tournament'],
+        'winner': problem['winner'],
+    }
 
 # --- Rotta Review (Usa il filtro) ---
 @app.route('/review')
 @login_required
 def review_problem():
-    # Recupera il filtro dalla sessione
-    current_list_filter = session.get('active_list', 'Tutti')
-    
-    # Chiede al DB i problemi di quella lista
-    ready_problems = db_manager.get_problems_for_review(current_list_filter)
+    # Prende il problema corrente e quello successivo (da precaricare) dalla coda della sessione
+    upcoming = _peek_review_queue(2)
     
-    if not ready_problems:
+    if not upcoming:
         return redirect(url_for('index'))
-    problem = ready_problems[0]
-    return render_template('review.html', problem=problem)
+    problem = upcoming[0]
+    following = upcoming[1] if len(upcoming) > 1 else None
+    return render_template('review.html', problem=problem,
+                           problem_data=_problem_payload(problem),
+                           following_data=_problem_payload(following),
+                           max_batch_reviews=db_manager.MAX_BATCH_REVIEWS)
+
+def _duplicate_policy():
+    """Cosa fare se la posizione inserita esiste già (campo 'on_duplicate' dei form)."""
+    policy = request.form.get('on_duplicate')
+    return policy if policy in db_manager.DUPLICATE_POLICIES else db_manager.DEFAULT_DUPLICATE_POLICY
 
 # --- Rotta 3: Inserimento di un Nuovo Problema (Testuale) ---
 @app.route('/new', methods=['GET', 'POST'])
@@ -192,10 +324,22 @@ def new_problem():
 
         # 4. Inserimento nel database
         if fen and solution_list:
+            # La soluzione deve essere legale: si salvano SAN canonica, mosse UCI e FEN di ogni semimossa
+            try:
+                line = movegen.validate_solution(fen, solution_list)
+            except ValueError as e:
+                return f"Errore: soluzione non valida ({e}).", 400
+            on_duplicate = _duplicate_policy()
+            if on_duplicate == 'reject':
+                existing_id = db_manager.find_duplicate(fen)
+                if existing_id:
+                    return f"Errore: la posizione è già presente (problema #{existing_id}).", 409
             new_id = db_manager.insert_new_problem(
-                fen, solution_list, tags_list,
+                fen, line['solution_moves'], tags_list,
                 white_player=white, black_player=black,
-                game_year=year, tournament=tournament, winner=winner, custom_list=custom_list
+                game_year=year, tournament=tournament, winner=winner, custom_list=custom_list,
+                on_duplicate=on_duplicate,
+                solution_uci=line['solution_uci'], solution_fens=line['solution_fens']
             )
             if new_id:
                 return redirect(url_for('index'))
@@ -229,11 +373,22 @@ def new_problem_graphical():
         tags_list = [t.strip() for t in tags_str.split(',') if t.strip()]
 
         if fen and solution_list:
+            try:
+                line = movegen.validate_solution(fen, solution_list)
+            except ValueError as e:
+                return f"Errore: soluzione non valida ({e}).", 400
+            on_duplicate = _duplicate_policy()
+            if on_duplicate == 'reject':
+                existing_id = db_manager.find_duplicate(fen)
+                if existing_id:
+                    return f"Errore: la posizione è già presente (problema #{existing_id}).", 409
             # Passiamo i nuovi argomenti alla funzione aggiornata
             new_id = db_manager.insert_new_problem(
-                fen, solution_list, tags_list,
+                fen, line['solution_moves'], tags_list,
                 white_player=white, black_player=black,
-                game_year=year, tournament=tournament, winner=winner, custom_list=custom_list
+                game_year=year, tournament=tournament, winner=winner, custom_list=custom_list,
+                on_duplicate=on_duplicate,
+                solution_uci=line['solution_uci'], solution_fens=line['solution_fens']
             )
             if new_id:
                 return redirect(url_for('index'))
@@ -241,24 +396,261 @@ def new_problem_graphical():
         return "Errore: Dati mancanti.", 400
     return render_template('new_graphical.html')
 
+# --- Rotta: Importazione in blocco (PGN / EPD / CSV) ---
+@app.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_problems():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Seleziona un file da importare.', 'error')
+            return redirect(url_for('import_problems'))
+
+        fmt = request.form.get('format') or importer.detect_format(upload.filename)
+        if fmt not in importer.FORMATS:
+            flash('Formato non riconosciuto: usa PGN, EPD o CSV.', 'error')
+            return redirect(url_for('import_problems'))
+
+        # Il file viene letto in streaming, senza caricarlo tutto in memoria
+        raw = upload.stream
+        if upload.filename.lower().endswith('.gz'):
+            raw = gzip.GzipFile(fileobj=raw)
+        text = io.TextIOWrapper(raw, encoding='utf-8', errors='replace', newline='')
+
+        tags_str = request.form.get('tags') or ''
+        # Le soluzioni si validano nel worker stesso (niente pool di processi dentro gunicorn):
+        # per le raccolte molto grandi c'è "python importer.py", che usa tutte le CPU
+        stats = importer.import_stream(
+            text, fmt,
+            custom_list=request.form.get('custom_list') or None,
+            extra_tags=[t.strip() for t in tags_str.split(',') if t.strip()],
+            on_duplicate=_duplicate_policy(),
+        )
+        if stats['error']:
+            flash(f"Importazione interrotta: {stats['error']}. Importati solo {stats['imported']} problemi "
+                  f"prima dell'errore.", 'error')
+            return redirect(url_for('import_problems'))
+        flash(f"Importati {stats['imported']} problemi ({stats['skipped']} scartati, "
+              f"{stats['invalid']} con soluzione non valida, {stats['duplicates']} già presenti) "
+              f"in {stats['seconds']:.1f}s, {stats['rows_per_second']:.0f} righe/s.", 'info')
+        return redirect(url_for('import_problems'))
+
+    return render_template('import_problems.html')
+
+# --- Rotta: Esportazione in streaming ---
+@app.route('/export/<fmt>')
+@login_required
+def export_problems(fmt):
+    """Scarica la banca problemi (?list=... per una sola lista, ?gzip=1 per comprimere)."""
+    if fmt not in exporter.FORMATS:
+        return "Formato non supportato", 404
+
+    custom_list = request.args.get('list') or None
+    compress = request.args.get('gzip') == '1'
+    filename = exporter.export_filename(fmt, custom_list, compress)
+    mimetype = 'application/gzip' if compress else exporter.MIMETYPES[fmt]
+
+    # Il corpo viene generato riga per riga mentre il client scarica
+    response = Response(stream_with_context(exporter.export_chunks(fmt, current_user.id, custom_list, compress)),
+                        mimetype=mimetype)
+    # filename= solo ASCII (gli header vanno in latin-1), il nome completo in filename*= (RFC 5987)
+    full_name = exporter.export_filename(fmt, custom_list, compress, ascii_only=False)
+    response.headers.set('Content-Disposition', 'attachment', filename=filename,
+                         **{'filename*': "UTF-8''" + url_quote(full_name, safe='')})
+    return response
+
+# --- Rotta: Previsione del carico di revisioni ---
+@app.route('/api/forecast')
+@login_required
+def forecast_reviews():
+    """
+    Simulazione Monte Carlo delle revisioni dei prossimi giorni.
+    Parametri: days, new_per_week, trials, ratings (4 probabilità), list.
+    """
+    try:
+        rating_probs = forecast.parse_rating_probs(
+            request.args.get('ratings') or ','.join(str(p) for p in forecast.DEFAULT_RATING_PROBS))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    result = forecast.forecast(
+        current_user.id,
+        custom_list=request.args.get('list') or None,
+        days=request.args.get('days', 90, type=int),
+        new_per_week=max(0, request.args.get('new_per_week', 0, type=int)),
+        trials=request.args.get('trials', 20, type=int),
+        rating_probs=rating_probs,
+    )
+    if result is None:
+        return jsonify({'error': 'Database non disponibile.'}), 500
+    return jsonify(result)
+
+# --- Rotta: Statistiche (solo dai riepiloghi giornalieri) ---
+@app.route('/api/stats')
+@login_required
+def review_stats():
+    days = max(1, min(request.args.get('days', 30, type=int), 3650))
+    return jsonify(db_manager.get_review_stats(current_user.id, days))
+
+RATINGS = ['Facile', 'Medio', 'Difficile', 'Sbagliato']
+
 @app.route('/rate/<int:problem_id>', methods=['POST'])
 @login_required # <--- PROTEZIONE
 def rate_problem(problem_id):
     rating = request.form.get('rating') 
-    if rating in ['Facile', 'Medio', 'Difficile', 'Sbagliato']:
-        success = db_manager.update_problem_review(problem_id, rating)
+    if rating in RATINGS:
+        success = db_manager.update_problem_review(current_user.id, problem_id, rating)
         if success:
+            _pop_review_queue(problem_id)
             return redirect(url_for('review_problem'))
     return "Errore.", 400
 
-# --- Modifica questa rotta esistente ---
+# --- Rotta: Valutazione + problema successivo in un'unica risposta JSON ---
+@app.route('/api/rate/<int:problem_id>', methods=['POST'])
+@login_required
+def rate_problem_json(problem_id):
+    """
+    Salva la valutazione e restituisce subito il prossimo problema ('next')
+    e quello dopo ('following'), che la pagina precarica in memoria.
+    """
+    data = request.get_json(silent=True) or {}
+    rating = data.get('rating')
+    if rating not in RATINGS:
+        return jsonify({'error': 'Valutazione non valida.'}), 400
+
+    time_ms = data.get('time_ms')
+    time_ms = int(time_ms) if isinstance(time_ms, (int, float)) and time_ms >= 0 else None
+
+    if not db_manager.update_problem_review(current_user.id, problem_id, rating, time_to_answer_ms=time_ms):
+        return jsonify({'error': 'Problema non trovato.'}), 404
+
+    _pop_review_queue(problem_id)
+    upcoming = _peek_review_queue(2)
+    return jsonify({
+        'next': _problem_payload(upcoming[0]) if upcoming else None,
+        'following': _problem_payload(upcoming[1]) if len(upcoming) > 1 else None,
+    })
+
+# --- Sessioni offline: scarica un blocco di problemi, valuta senza rete, sincronizza ---
+OFFLINE_BATCH_SIZE = 50
+
+@app.route('/api/review_batch')
+@login_required
+def review_batch_json():
+    """Prossimi problemi da ripassare (con il filtro lista/tag corrente), da risolvere offline."""
+    limit = max(1, min(request.args.get('limit', OFFLINE_BATCH_SIZE, type=int), db_manager.MAX_BATCH_REVIEWS))
+    ids, _ = db_manager.get_review_queue_ids(current_user.id, session.get('active_list', 'Tutti'),
+                                             limit=limit, tags=session.get('active_tags', []))
+    problems = [db_manager.get_problem_by_id(pid) for pid in ids]
+    return jsonify({'problems': [_problem_payload(p) for p in problems if p is not None]})
+
+@app.route('/api/rate_batch', methods=['POST'])
+@login_required
+def rate_batch_json():
+    """
+    Salva in un'unica transazione le valutazioni di una sessione offline:
+    {"reviews": [{"problem_id", "rating", "reviewed_at" (ms), "time_ms"}, ...]}.
+    Reinviare lo stesso blocco è innocuo (stato 'duplicate' per le valutazioni già salvate).
+    """
+    data = request.get_json(silent=True) or {}
+    reviews = data.get('reviews')
+    if not isinstance(reviews, list) or not all(isinstance(r, dict) for r in reviews):
+        return jsonify({'error': 'Formato non valido.'}), 400
+    if len(reviews) > db_manager.MAX_BATCH_REVIEWS:
+        return jsonify({'error': f'Al massimo {db_manager.MAX_BATCH_REVIEWS} valutazioni per invio.'}), 400
+
+    # reviewed_at arriva in millisecondi (Date.now() del browser)
+    batch = [dict(r, reviewed_at=r['reviewed_at'] / 1000.0)
+             if isinstance(r.get('reviewed_at'), (int, float)) else r for r in reviews]
+    statuses = db_manager.apply_review_batch(current_user.id, batch)
+    if statuses is None:
+        return jsonify({'error': 'Valutazioni non salvate, riprova.'}), 500
+
+    for review, status in zip(reviews, statuses):
+        if status == db_manager.BATCH_APPLIED:
+            _pop_review_queue(review['problem_id'])
+    return jsonify({
+        'results': [{'problem_id': r.get('problem_id'), 'reviewed_at': r.get('reviewed_at'), 'status': status}
+                    for r, status in zip(reviews, statuses)],
+        'counts': {status: statuses.count(status) for status in set(statuses)},
+    })
+
+# --- Elenco problemi (paginato) ---
+def _list_filters():
+    """Filtri opzionali dell'elenco presi dalla query string (?list=...&tag=...)."""
+    return request.args.get('list') or None, request.args.get('tag') or None
+
+def _next_page_url(next_cursor, list_filter, tag_filter):
+    if next_cursor is None:
+        return None
+    return url_for('problems_page_json', before=next_cursor, list=list_filter, tag=tag_filter)
+
 @app.route('/list')
 @login_required
 def problems_list():
-    all_problems = db_manager.get_all_problems()
+    list_filter, tag_filter = _list_filters()
+    # Solo la prima pagina: le successive arrivano da /api/problems mentre si scorre
+    problems, next_cursor = db_manager.get_problems_page(current_user.id, custom_list=list_filter, tag=tag_filter)
+    total = db_manager.count_problems(custom_list=list_filter, tag=tag_filter)
     # Recuperiamo anche le liste per il menu a tendina (datalist)
     available_lists = db_manager.get_unique_lists() 
-    return render_template('problems_list.html', problems=all_problems, available_lists=available_lists)
+    return render_template('problems_list.html', problems=problems, total=total,
+                           available_lists=available_lists,
+                           list_filter=list_filter, tag_filter=tag_filter,
+                           next_url=_next_page_url(next_cursor, list_filter, tag_filter))
+
+@app.route('/api/problems')
+@login_required
+def problems_page_json():
+    """Pagina successiva dell'elenco: righe HTML già pronte + URL della pagina dopo."""
+    list_filter, tag_filter = _list_filters()
+    before_id = request.args.get('before', type=int)
+    problems, next_cursor = db_manager.get_problems_page(current_user.id, before_id=before_id,
+                                                         custom_list=list_filter, tag=tag_filter)
+    return jsonify({
+        'html': render_template('problem_rows.html', problems=problems),
+        'next_url': _next_page_url(next_cursor, list_filter, tag_filter),
+    })
+
+# --- Rotta: Ricerca full-text ---
+def _search_filters():
+    """Filtri della ricerca dalla query string (?q=&year_from=&year_to=&due=&list=)."""
+    return {
+        'text': request.args.get('q', '').strip(),
+        'year_from': request.args.get('year_from', type=int),
+        'year_to': request.args.get('year_to', type=int),
+        'due': request.args.get('due') if request.args.get('due') in db_manager.SEARCH_DUE_FILTERS else None,
+        'custom_list': request.args.get('list') or None,
+    }
+
+def _next_search_url(filters, page, has_more):
+    if not has_more:
+        return None
+    return url_for('search_page_json', q=filters['text'] or None, year_from=filters['year_from'],
+                   year_to=filters['year_to'], due=filters['due'], list=filters['custom_list'],
+                   page=page + 1)
+
+@app.route('/search')
+@login_required
+def search_problems():
+    filters = _search_filters()
+    problems, has_more = db_manager.search_problems(current_user.id, **filters)
+    return render_template('problems_list.html', problems=problems, total=None,
+                           available_lists=db_manager.get_unique_lists(),
+                           list_filter=filters['custom_list'], tag_filter=None, search=filters,
+                           next_url=_next_search_url(filters, 0, has_more))
+
+@app.route('/api/search')
+@login_required
+def search_page_json():
+    """Pagina successiva dei risultati di ricerca (stesso formato di /api/problems)."""
+    filters = _search_filters()
+    page = max(0, request.args.get('page', 0, type=int))
+    problems, has_more = db_manager.search_problems(current_user.id, page=page, **filters)
+    return jsonify({
+        'html': render_template('problem_rows.html', problems=problems),
+        'next_url': _next_search_url(filters, page, has_more),
+    })
 
 # --- Aggiungi questa NUOVA rotta ---
 @app.route('/quick_update_list/<int:problem_id>', methods=['POST'])
@@ -269,6 +661,50 @@ def quick_update_list(problem_id):
     # Ricarica la stessa pagina per vedere le modifiche
     return redirect(url_for('problems_list'))
 
+# --- Rotta: Statistiche del pool di connessioni ---
+@app.route('/stats/db')
+@login_required
+def db_stats():
+    return jsonify(db_manager.get_pool_stats())
+
+# --- Rotta: Statistiche della cache (problemi e liste) ---
+@app.route('/stats/cache')
+@login_required
+def cache_stats():
+    return jsonify(db_manager.get_cache_stats())
+
+# --- Rotta: Metriche in formato testo di Prometheus ---
+# Uno scraper si autentica con "Authorization: Bearer <METRICS_TOKEN>" (dal .env);
+# senza token serve il login, come per le altre statistiche.
+@app.route('/metrics')
+def metrics_text():
+    token = os.getenv('METRICS_TOKEN')
+    bearer = request.headers.get('Authorization', '')
+    if not current_user.is_authenticated and not (token and hmac.compare_digest(bearer, f'Bearer {token}')):
+        return login_manager.unauthorized()
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+# --- Rotta: Miniature SVG delle posizioni ---
+# L'URL contiene la disposizione dei pezzi, quindi il contenuto non cambia mai:
+# il browser può tenerlo in cache per un anno senza rivalidarlo.
+@app.route('/thumb/<string:key>.svg')
+@login_required
+def thumbnail(key):
+    placement = thumbnails.placement_from_key(key)
+    if not thumbnails.is_valid_placement(placement):
+        return "Posizione non valida", 404
+
+    svg, etag = thumbnails.get_thumbnail(placement)
+    response = app.response_class(svg, mimetype='image/svg+xml')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response.make_conditional(request)
+
+@app.template_filter('thumb_url')
+def thumb_url(fen):
+    """URL della miniatura SVG di un FEN (usabile in qualsiasi template)."""
+    return url_for('thumbnail', key=thumbnails.thumbnail_key(fen))
+
 @app.template_filter('format_date')
 def format_date(timestamp):
     from datetime import datetime
@@ -312,10 +748,8 @@ def edit_problem(problem_id):
         else:
             flash('Errore durante l\'aggiornamento.', 'error')
 
-    # Prepara i tag per la visualizzazione (da lista JSON a stringa separata da virgole)
-    import json
-    tags_list = json.loads(problem['tags']) if problem['tags'] else []
-    problem['tags_str'] = ", ".join(tags_list)
+    # Prepara i tag per la visualizzazione (lista già decodificata -> stringa separata da virgole)
+    problem['tags_str'] = ", ".join(problem['tags'])
     
     return render_template('edit_problem.html', problem=problem)
 
@@ -331,9 +765,4 @@ def delete_problem_route(problem_id):
     return redirect(url_for('problems_list'))
 
 if __name__ == '__main__':
-    conn = db_manager.create_connection()
-    if conn:
-        db_setup.setup_database(conn)
-        conn.close()
-    
     app.run(host='0.0.0.0', debug=True)
\ No newline at end of file
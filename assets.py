@@ -0,0 +1,379 @@
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+try:
+    import brotli  # Facoltativo: senza, si servono solo le versioni gzip
+except ImportError:
+    brotli = None
+
+# ----------------------------------------------------------------------
+# ASSET STATICI CON IMPRONTA (minificati, precompressi, cache immutabile)
+# Al build ogni file di ASSETS viene minificato e salvato in BUILD_DIR con
+# l'hash del contenuto nel nome (js/chess.3f2a9c1b.js), insieme alle copie
+# .gz (e .br se il modulo brotli è installato). manifest.json collega il
+# nome sorgente al nome con impronta: i template lo risolvono con
+# asset_url(), e siccome l'URL cambia quando cambia il file, il browser
+# può tenerlo in cache per sempre senza rivalidarlo.
+# I pezzi della scacchiera diventano un unico script di data URI
+# (js/pieces.js) invece di dodici PNG richiesti uno per uno.
+# ----------------------------------------------------------------------
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+BUILD_DIR = os.path.join(STATIC_DIR, 'build')
+MANIFEST_NAME = 'manifest.json'
+
+# Percorsi relativi a STATIC_DIR
+ASSETS = (
+    'js/jquery-3.6.0.min.js',
+    'js/chessboard-1.0.0.js',
+    'js/chess.js',
+    'css/chessboard-1.0.0.css',
+)
+PIECE_DIR = 'img/chesspieces/wikipedia'
+PIECES_SCRIPT = 'js/pieces.js'   # Generato: non esiste in static/
+
+HASH_LENGTH = 12
+COMPRESS_MIN_SIZE = 512          # Sotto questa soglia la compressione non conviene
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+# ----------------------------------------------------------------------
+# MINIFICAZIONE
+# ----------------------------------------------------------------------
+
+_WORD = re.compile('[A-Za-z0-9_$\\\\\u0080-\uffff]')
+# Dopo questi caratteri una "/" apre una regex, non una divisione
+_REGEX_PREFIX = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'instanceof',
+                   'new', 'delete', 'void', 'throw', 'yield', 'await'}
+# Un a capo dopo questi caratteri non serve mai all'inserimento automatico dei ";"
+_NO_NEWLINE_AFTER = set('{;,([:')
+
+
+def _is_word(ch):
+    return bool(ch) and _WORD.match(ch) is not None
+
+
+def _is_license(comment):
+    return comment.startswith('/*!') or '@license' in comment or 'Copyright' in comment
+
+
+def minify_js(source):
+    """
+    Minificatore conservativo: toglie commenti e spazi ma tiene gli a capo che
+    contano per l'inserimento automatico dei ";" (chessboard.js non li usa).
+    Stringhe e regex restano intatte; l'intestazione con la licenza resta.
+    """
+    out = []
+    i, n = 0, len(source)
+    last = ''            # Ultimo carattere significativo emesso
+    last_word = ''       # Ultima parola emessa (per "return /regex/")
+    header = True        # Siamo ancora nei commenti iniziali (licenza)
+    pending_space = pending_newline = False
+
+    def emit(text):
+        nonlocal last, pending_space, pending_newline
+        if out:
+            if pending_newline and last not in _NO_NEWLINE_AFTER and text[0] != '}':
+                out.append('\n')
+            elif (pending_space or pending_newline) and (
+                    (_is_word(last) and _is_word(text[0])) or (last in '+-' and text[0] in '+-')):
+                out.append(' ')
+        out.append(text)
+        last = text[-1]
+        pending_space = pending_newline = False
+
+    while i < n:
+        ch = source[i]
+        if ch in ' \t\r\n\f\v\ufeff':
+            if ch == '\n':
+                pending_newline = True
+            else:
+                pending_space = True
+            i += 1
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            end = n if end == -1 else end
+            if header or _is_license(source[i:end]):
+                if out:
+                    out.append('\n')
+                out.append(source[i:end])
+                last = '\n'
+                pending_newline = True
+            i = end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            comment = source[i:end]
+            if header or _is_license(comment):
+                if out:
+                    out.append('\n')
+                out.append(comment)
+                last = '\n'
+            # Un commento su più righe vale come a capo
+            if '\n' in comment:
+                pending_newline = True
+            else:
+                pending_space = True
+            i = end
+        elif ch in '\'"`':
+            header = False
+            j = i + 1
+            while j < n and source[j] != ch:
+                j += 2 if source[j] == '\\' else 1
+            emit(source[i:j + 1])
+            last_word = ''
+            i = j + 1
+        elif ch == '/' and (last in _REGEX_PREFIX or last in ('', '\n') or last_word in _REGEX_KEYWORDS):
+            header = False
+            j, in_class = i + 1, False
+            while j < n and (source[j] != '/' or in_class):
+                if source[j] == '\\':
+                    j += 1
+                elif source[j] == '[':
+                    in_class = True
+                elif source[j] == ']':
+                    in_class = False
+                j += 1
+            j += 1
+            while j < n and _is_word(source[j]):   # Flag (g, i, m...)
+                j += 1
+            emit(source[i:j])
+            last_word = ''
+            i = j
+        elif _is_word(ch):
+            header = False
+            j = i + 1
+            while j < n and _is_word(source[j]):
+                j += 1
+            last_word = source[i:j]
+            emit(last_word)
+            i = j
+        else:
+            header = False
+            emit(ch)
+            last_word = ''
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+
+def minify_css(source):
+    """Toglie commenti (tranne /*! licenza */) e spazi superflui da un foglio di stile."""
+    source = re.sub(r'/\*(?!!).*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{}:;,>])\s*', r'\1', source)
+    return source.replace(';}', '}').strip() + '\n'
+
+
+def _already_minified(path):
+    return '.min.' in os.path.basename(path)
+
+
+def pieces_script(piece_dir=PIECE_DIR):
+    """
+    Script con i pezzi come data URI: window.CHESS_PIECES.theme si passa a
+    Chessboard come pieceTheme al posto del percorso '{piece}.png'.
+    """
+    folder = os.path.join(STATIC_DIR, piece_dir)
+    pieces = {}
+    for filename in sorted(os.listdir(folder)):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() != '.png':
+            continue
+        with open(os.path.join(folder, filename), 'rb') as f:
+            pieces[name] = 'data:image/png;base64,' + base64.b64encode(f.read()).decode('ascii')
+    return ("window.CHESS_PIECES=(function(){var p=" + json.dumps(pieces, separators=(',', ':')) +
+            ";return{images:p,theme:function(piece){return p[piece]}}})();\n")
+
+
+# ----------------------------------------------------------------------
+# BUILD E MANIFEST
+# ----------------------------------------------------------------------
+
+def _fingerprinted_name(name, content):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    base, ext = os.path.splitext(name)
+    if base.endswith('.min'):
+        base = base[:-4]
+    return f"{base}.{digest}{ext}"
+
+
+def _write_atomic(path, content):
+    # Più worker gunicorn possono fare il build insieme: il nome dipende dal
+    # contenuto, quindi basta che nessuno veda mai un file scritto a metà
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _source_fingerprint(names):
+    """Dimensione e data di modifica dei sorgenti: se cambiano il manifest va rifatto."""
+    stamp = {}
+    for name in names:
+        st = os.stat(os.path.join(STATIC_DIR, name))
+        stamp[name] = [st.st_size, int(st.st_mtime)]
+    return stamp
+
+
+def _sources():
+    folder = os.path.join(STATIC_DIR, PIECE_DIR)
+    pieces = [f"{PIECE_DIR}/{f}" for f in sorted(os.listdir(folder)) if f.lower().endswith('.png')]
+    return list(ASSETS) + pieces
+
+
+def build(build_dir=BUILD_DIR, verbose=False):
+    """
+    Minifica, aggiunge l'impronta e precomprime tutti gli asset; scrive il manifest
+    e restituisce il dizionario {nome sorgente: nome con impronta}.
+    I file di build precedenti restano: le pagine già in cache possono ancora chiederli.
+    """
+    outputs = {}
+    for name in ASSETS:
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            raw = f.read()
+        if _already_minified(name):
+            content = raw
+        elif name.endswith('.js'):
+            content = minify_js(raw.decode('utf-8')).encode('utf-8')
+        elif name.endswith('.css'):
+            content = minify_css(raw.decode('utf-8')).encode('utf-8')
+        else:
+            content = raw
+        outputs[name] = content
+    outputs[PIECES_SCRIPT] = pieces_script().encode('ascii')
+
+    files = {}
+    for name, content in outputs.items():
+        hashed = _fingerprinted_name(name, content)
+        path = os.path.join(build_dir, hashed)
+        if not os.path.exists(path):
+            _write_atomic(path, content)
+        sizes = [len(content)]
+        if len(content) >= COMPRESS_MIN_SIZE:
+            if not os.path.exists(path + '.gz'):
+                _write_atomic(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            sizes.append(os.path.getsize(path + '.gz'))
+            if brotli is not None and not os.path.exists(path + '.br'):
+                _write_atomic(path + '.br', brotli.compress(content, quality=11))
+        files[name] = hashed
+        if verbose:
+            print(f"{name:<32} -> {hashed:<40} " + " / ".join(f"{s / 1024:.1f} KB" for s in sizes))
+
+    manifest = {'sources': _source_fingerprint(_sources()), 'files': files}
+    _write_atomic(os.path.join(build_dir, MANIFEST_NAME),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return files
+
+
+def load_manifest(build_dir=BUILD_DIR, rebuild=True):
+    """
+    Legge il manifest; se manca o i sorgenti sono cambiati (e rebuild è vero) rifà il build.
+    In caso di errore restituisce {} e i template ricadono sui file di static/.
+    """
+    path = os.path.join(build_dir, MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('sources') == _source_fingerprint(_sources()):
+            return manifest['files']
+    except (OSError, ValueError, KeyError):
+        pass
+    if not rebuild:
+        return {}
+    try:
+        return build(build_dir)
+    except OSError as e:
+        print(f"Errore nel build degli asset: {e}")
+        return {}
+
+
+# ----------------------------------------------------------------------
+# AGGANCIO A FLASK
+# ----------------------------------------------------------------------
+
+def _accepted_encodings(accept_encoding):
+    """Accept-Encoding -> {codifica: q}. q=0 vuol dire "non accettata"; q non valido vale 0."""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def _negotiate(path, accept_encoding):
+    """
+    Sceglie la variante precompressa con il q più alto tra quelle accettate dal
+    client (a parità br prima di gzip); "*" vale per le codifiche non elencate.
+    Se nessuna è accettata si invia il file non compresso.
+    """
+    accepted = _accepted_encodings(accept_encoding)
+    best, best_q = (path, None), 0.0
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q and os.path.exists(path + suffix):
+            best, best_q = (path + suffix, encoding), q
+    return best
+
+
+def init_app(app, build_dir=BUILD_DIR):
+    """
+    Registra la rotta /assets/<file con impronta> e la funzione asset_url() per i template.
+    asset_url('js/chess.js') restituisce l'URL con impronta, o quello di static/
+    se l'asset non è nel manifest (build fallito).
+    """
+    from flask import abort, request, send_file, url_for
+    from werkzeug.security import safe_join
+
+    manifest = load_manifest(build_dir)
+
+    # Si servono anche i file di build precedenti (pagine ancora in cache nei browser)
+    @app.route('/assets/<path:filename>')
+    def assets(filename):
+        path = safe_join(build_dir, filename)
+        if path is None or filename == MANIFEST_NAME or not os.path.isfile(path):
+            abort(404)
+        path, encoding = _negotiate(path, request.headers.get('Accept-Encoding', ''))
+        # Il tipo è quello del file originale, anche quando si invia il .gz/.br
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_file(path, mimetype=mimetype, conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        return response
+
+    def asset_url(name):
+        hashed = manifest.get(name)
+        if hashed is None:
+            return url_for('static', filename=name)
+        return url_for('assets', filename=hashed)
+
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.extensions['assets_manifest'] = manifest
+    return manifest
+
+
+if __name__ == '__main__':
+    # python assets.py: build esplicito (es. in fase di deploy, prima di avviare gunicorn)
+    files = build(verbose=True)
+    if brotli is None:
+        print("Modulo brotli non installato: generate solo le versioni gzip.")
+    print(f"{len(files)} asset in {os.path.relpath(BUILD_DIR)}.")
@@ -0,0 +1,519 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import db_manager
+import movegen
+import thumbnails
+import update_db_schema
+
+# ----------------------------------------------------------------------
+# BENCHMARK DI db_manager E DELLE ROTTE FLASK
+# Un generatore deterministico costruisce banche problemi realistiche
+# (liste, tag, giocatori, scadenze distribuite tra arretrati e prossimi
+# giorni) da 1k, 100k e 1M problemi. Ogni funzione di db_manager e ogni
+# rotta (tramite il test client di Flask) viene cronometrata su ciascuna
+# dimensione; i risultati vanno in un file JSON confrontabile tra commit:
+#
+#   python benchmark.py run --sizes 1k,100k -o before.json
+#   python benchmark.py run --sizes 1k,100k -o after.json
+#   python benchmark.py compare before.json after.json
+# ----------------------------------------------------------------------
+
+SIZES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+DEFAULT_SIZES = '1k,100k'
+SEED = 1851                     # Stesso seme = stessa banca problemi
+DATA_DIR = 'bench_data'         # Le banche generate vengono riusate tra un'esecuzione e l'altra
+BATCH_SIZE = 5000
+REPEAT = 5
+FULL_SCAN_MAX_SIZE = 100000     # Oltre questa dimensione si saltano le funzioni che leggono tutta la banca
+REGRESSION_THRESHOLD = 1.25     # compare: più lento del 25% = regressione
+
+BENCH_USER_ID = db_manager.DEFAULT_USER_ID
+STARTED_RATIO = 0.7             # Quota di problemi già iniziati dall'utente del benchmark
+OVERDUE_RATIO = 0.15            # ...di cui scaduti (fino a 30 giorni di arretrato)
+SECONDS_PER_DAY = 86400
+
+LISTS = [None, None, None, 'Finali di Torre', 'Capablanca', 'Tattica Base', 'Matti in 2',
+         'Aperture', 'Finali di Pedoni', 'Sacrifici', 'Combinazioni', 'Difesa', 'Studi']
+TAGS = ['matto in 1', 'matto in 2', 'matto in 3', 'forchetta', 'inchiodatura', 'infilata',
+        'attacco di scoperta', 'sacrificio', 'deviazione', 'adescamento', 'finale', 'torre',
+        'pedone', 'donna', 'alfiere', 'cavallo', 'promozione', 'zugzwang', 'stallo', 'difesa',
+        'apertura', 'mediogioco', 'patta', 'scacco perpetuo', 'x-ray']
+PLAYERS = ['José Raúl Capablanca', 'Emanuel Lasker', 'Alexander Alekhine', 'Mikhail Tal',
+           'Bobby Fischer', 'Garry Kasparov', 'Anatoly Karpov', 'Paul Morphy', 'Akiba Rubinstein',
+           'Aron Nimzowitsch', 'Vasily Smyslov', 'Tigran Petrosian', 'Magnus Carlsen']
+TOURNAMENTS = ['Havana', 'St. Petersburg', 'New York', 'Hastings', 'Linares', 'Wijk aan Zee',
+               'Zurich', 'Moscow', 'London', 'Carlsbad']
+RATINGS = list(db_manager.RATING_MAP)
+
+
+# ----------------------------------------------------------------------
+# GENERATORE DELLA BANCA PROBLEMI
+# ----------------------------------------------------------------------
+
+def _random_fen(rng):
+    """Posizione casuale: i due re più 2-8 pezzi (pedoni mai sulla prima o ottava traversa)."""
+    board = [None] * 64
+    squares = rng.sample(range(64), 2 + rng.randint(2, 8))
+    board[squares[0]], board[squares[1]] = 'K', 'k'
+    for square in squares[2:]:
+        piece = rng.choice('PPPNBRQpppnbrq')
+        if piece in 'Pp' and square // 8 in (0, 7):
+            piece = 'R' if piece == 'P' else 'r'
+        board[square] = piece
+
+    ranks = []
+    for rank in range(8):
+        row, empty = '', 0
+        for piece in board[rank * 8:rank * 8 + 8]:
+            if piece is None:
+                empty += 1
+                continue
+            if empty:
+                row, empty = row + str(empty), 0
+            row += piece
+        ranks.append(row + (str(empty) if empty else ''))
+    return f"{'/'.join(ranks)} {rng.choice('wb')} - - 0 1"
+
+
+def _random_solution(rng, fen):
+    """
+    Da 1 a 5 semimosse legali scelte dal generatore di mosse, già nella forma di
+    movegen.validate_solution (SAN, UCI e FEN). None se la posizione non è valida
+    (es. il lato senza il tratto è sotto scacco) o non ha mosse.
+    """
+    try:
+        position = movegen.parse_fen(fen)
+    except ValueError:
+        return None
+    line = {'solution_moves': [], 'solution_uci': [], 'solution_fens': []}
+    for _ in range(rng.randint(1, 5)):
+        # Mossa pseudo-legale a caso finché non se ne trova una legale (più rapido che generarle tutte)
+        moves = list(position.pseudo_moves())
+        rng.shuffle(moves)
+        move = next((m for m in moves if position.is_legal(m)), None)
+        if move is None:
+            break
+        line['solution_moves'].append(position.san(move))
+        line['solution_uci'].append(position.uci(move))
+        position = position.push(move)
+        line['solution_fens'].append(position.fen())
+    return line if line['solution_moves'] else None
+
+
+def _random_problem(rng):
+    while True:
+        fen = _random_fen(rng)
+        line = _random_solution(rng, fen)
+        if line is not None:
+            break
+    problem = {
+        'fen': fen,
+        'tags': rng.sample(TAGS, rng.randint(1, 3)),
+        'custom_list': rng.choice(LISTS),
+    }
+    problem.update(line)
+    # Circa un problema su tre viene da una partita storica
+    if rng.random() < 0.35:
+        white, black = rng.sample(PLAYERS, 2)
+        problem.update(white_player=white, black_player=black, game_year=rng.randint(1850, 2023),
+                       tournament=rng.choice(TOURNAMENTS), winner=rng.choice([0, 1, None]))
+    return problem
+
+
+def bank_path(size, seed=SEED, data_dir=DATA_DIR):
+    """
+    Le scadenze sono relative al giorno di generazione: la banca si rigenera ogni giorno
+    (e a ogni nuova versione dello schema).
+    """
+    return os.path.join(data_dir, f"bank_{size}_{seed}_v{update_db_schema.LATEST_VERSION}_{datetime.now():%Y%m%d}.db")
+
+
+def generate_bank(path, size, seed=SEED):
+    """
+    Costruisce da zero una banca di `size` problemi con lo schema corrente, passando
+    dagli stessi inserimenti in blocco dell'importatore (trigger, FTS e chiavi di
+    posizione inclusi), e lo stato SM-2 dell'utente del benchmark.
+    """
+    rng = random.Random(seed)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    db_manager.DB_NAME = path
+    db_manager.invalidate_problems()
+    db_manager.invalidate_lists()
+    conn = db_manager.create_connection()
+    try:
+        update_db_schema.migrate(conn)
+        start = time.perf_counter()
+        for offset in range(0, size, BATCH_SIZE):
+            batch = [_random_problem(rng) for _ in range(min(BATCH_SIZE, size - offset))]
+            db_manager.insert_problems_batch(conn, batch, on_duplicate='allow')
+
+        # Utente del benchmark: gli iniziati hanno scadenze tra 30 giorni fa e 60 giorni da oggi
+        conn.execute("INSERT OR IGNORE INTO users (id, username, password_hash, created_at) VALUES (?, ?, ?, ?)",
+                     (BENCH_USER_ID, 'bench', '-', time.time()))
+        now = time.time()
+        state = []
+        for problem_id, custom_list in conn.execute("SELECT id, COALESCE(custom_list, '') FROM problems"):
+            if rng.random() >= STARTED_RATIO:
+                continue
+            review_count = rng.randint(1, 8)
+            interval = 1 if review_count == 1 else rng.randint(6, 120)
+            if rng.random() < OVERDUE_RATIO:
+                next_review = now - rng.uniform(0, 30) * SECONDS_PER_DAY
+            else:
+                next_review = now + rng.uniform(0, 60) * SECONDS_PER_DAY
+            state.append((BENCH_USER_ID, problem_id, custom_list, next_review - interval * SECONDS_PER_DAY,
+                          next_review, round(rng.uniform(1.3, 3.0), 2), interval, review_count))
+        conn.executemany("""
+            INSERT INTO user_problem_state (
+                user_id, problem_id, list_name, last_reviewed, next_review, ease_factor, interval_days, review_count
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, state)
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print(f"Generata {path}: {size} problemi, {len(state)} iniziati, "
+              f"{time.perf_counter() - start:.1f}s.", file=sys.stderr)
+    finally:
+        conn.close()
+    return path
+
+
+def prepare_bank(size, seed=SEED, data_dir=DATA_DIR, regenerate=False):
+    """Copia di lavoro di una banca generata (i benchmark di scrittura la modificano)."""
+    path = bank_path(size, seed, data_dir)
+    if regenerate or not os.path.exists(path):
+        generate_bank(path, size, seed)
+    db_manager._pool.close_all()
+    work = os.path.join(data_dir, f"work_{size}.db")
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(work + suffix):
+            os.remove(work + suffix)
+    shutil.copyfile(path, work)
+    return work
+
+
+# ----------------------------------------------------------------------
+# MISURE
+# ----------------------------------------------------------------------
+
+def _summary(samples):
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        'n': n,
+        'min_ms': round(samples[0] * 1000, 3),
+        'median_ms': round(samples[n // 2] * 1000 if n % 2 else (samples[n // 2 - 1] + samples[n // 2]) * 500, 3),
+        'p95_ms': round(samples[min(n - 1, int(n * 0.95))] * 1000, 3),
+        'mean_ms': round(sum(samples) / n * 1000, 3),
+    }
+
+
+def measure(fn, repeat=REPEAT, setup=None):
+    """Esegue `fn` una volta a vuoto (riscaldamento) e poi `repeat` volte cronometrate."""
+    if setup:
+        setup()
+    fn()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return _summary(samples)
+
+
+class Bench:
+    """Una misura: nome, funzione da cronometrare, preparazione esclusa dal tempo."""
+
+    def __init__(self, name, fn, setup=None, full_scan=False):
+        self.name = name
+        self.fn = fn
+        self.setup = setup
+        self.full_scan = full_scan
+
+
+def _sample_context(rng):
+    """Dati reali della banca corrente da usare come argomenti (ID, liste, tag)."""
+    conn = db_manager.create_connection()
+    try:
+        max_id = conn.execute("SELECT MAX(id) FROM problems").fetchone()[0]
+        lists = [row[0] for row in conn.execute("SELECT name FROM lists WHERE name != '' ORDER BY total")]
+        tag = conn.execute("SELECT name FROM tags ORDER BY problem_count DESC LIMIT 1").fetchone()[0]
+    finally:
+        conn.close()
+    return {'ids': lambda: rng.randint(1, max_id), 'max_id': max_id,
+            'list': lists[len(lists) // 2], 'small_list': lists[0], 'tag': tag}
+
+
+def db_benchmarks(ctx, rng):
+    user = BENCH_USER_ID
+    cold = db_manager.invalidate_problems
+
+    def rate():
+        db_manager.update_problem_review(user, ctx['ids'](), rng.choice(RATINGS), time_to_answer_ms=5000)
+
+    def insert():
+        p = _random_problem(rng)
+        db_manager.insert_new_problem(p.pop('fen'), p.pop('solution_moves'), p.pop('tags'),
+                                      on_duplicate='allow', **p)
+
+    lines = [(p['fen'], p['solution_moves']) for p in (_random_problem(rng) for _ in range(200))]
+
+    def validate():
+        for fen, moves in lines:
+            movegen.validate_solution(fen, moves)
+
+    def rate_batch():
+        now = time.time()
+        db_manager.apply_review_batch(user, [
+            {'problem_id': ctx['ids'](), 'rating': rng.choice(RATINGS), 'reviewed_at': now - 200 + i}
+            for i in range(200)])
+
+    return [
+        Bench('get_problems_for_review', lambda: db_manager.get_problems_for_review(user), full_scan=True),
+        Bench('get_all_problems', db_manager.get_all_problems, full_scan=True),
+        Bench('get_unique_lists', db_manager.get_unique_lists, setup=db_manager.invalidate_lists),
+        Bench('get_list_catalog', lambda: db_manager.get_list_catalog(user)),
+        Bench('get_review_queue_ids', lambda: db_manager.get_review_queue_ids(user)),
+        Bench('get_review_queue_ids[list]', lambda: db_manager.get_review_queue_ids(user, ctx['list'])),
+        Bench('get_review_queue_ids[tag]', lambda: db_manager.get_review_queue_ids(user, tags=[ctx['tag']])),
+        Bench('get_next_problem_for_review', lambda: db_manager.get_next_problem_for_review(user), setup=cold),
+        Bench('get_problem_by_id[cold]', lambda: db_manager.get_problem_by_id(ctx['ids']()), setup=cold),
+        Bench('get_due_counts', lambda: db_manager.get_due_counts(user)),
+        Bench('get_due_counts[list]', lambda: db_manager.get_due_counts(user, ctx['list'])),
+        Bench('get_due_counts_by_list', lambda: db_manager.get_due_counts_by_list(user)),
+        Bench('get_tags_with_due_counts', lambda: db_manager.get_tags_with_due_counts(user)),
+        Bench('get_problems_page', lambda: db_manager.get_problems_page(user)),
+        Bench('get_problems_page[deep]', lambda: db_manager.get_problems_page(user, before_id=ctx['max_id'] // 2)),
+        Bench('count_problems', db_manager.count_problems),
+        Bench('search_problems', lambda: db_manager.search_problems(user, 'capa')),
+        Bench('search_problems[due]', lambda: db_manager.search_problems(user, 'finale', due='week')),
+        Bench('get_review_stats', lambda: db_manager.get_review_stats(user)),
+        Bench('update_problem_review', rate),
+        Bench('apply_review_batch[200]', rate_batch),
+        Bench('insert_new_problem', insert),
+        Bench('movegen.validate_solution[200]', validate),
+    ]
+
+
+def route_benchmarks(ctx, rng, client):
+    def get(url):
+        def run():
+            response = client.get(url() if callable(url) else url)
+            response.get_data()  # Consuma anche le risposte in streaming
+            assert response.status_code < 400, (url, response.status_code)
+        return run
+
+    def post_json(url, body):
+        def run():
+            response = client.post(url() if callable(url) else url, json=body())
+            assert response.status_code < 400, (url, response.status_code)
+        return run
+
+    def post_form(url, form):
+        def run():
+            response = client.post(url() if callable(url) else url, data=form())
+            assert response.status_code < 400, (url, response.status_code)
+        return run
+
+    def new_form():
+        p = _random_problem(rng)
+        return {'fen': p['fen'], 'solution': ','.join(p['solution_moves']), 'tags': ','.join(p['tags']),
+                'custom_list': p['custom_list'] or '', 'on_duplicate': 'allow'}
+
+    def batch_body():
+        now = time.time() * 1000
+        return {'reviews': [{'problem_id': ctx['ids'](), 'rating': rng.choice(RATINGS), 'reviewed_at': now - 50000 + i}
+                            for i in range(50)]}
+
+    rating = lambda: {'rating': rng.choice(RATINGS), 'time_ms': 4000}
+    return [
+        Bench('GET /', get('/')),
+        Bench('GET /review', get('/review')),
+        Bench('POST /api/rate/<id>', post_json(lambda: f"/api/rate/{ctx['ids']()}", rating)),
+        Bench('POST /rate/<id>', post_form(lambda: f"/rate/{ctx['ids']()}", rating)),
+        Bench('GET /api/review_batch', get('/api/review_batch?limit=50')),
+        Bench('POST /api/rate_batch[50]', post_json('/api/rate_batch', batch_body)),
+        Bench('GET /list', get('/list')),
+        Bench('GET /list?list=', get(f"/list?list={ctx['list']}")),
+        Bench('GET /api/problems', get(lambda: f"/api/problems?before={ctx['ids']()}")),
+        Bench('GET /search', get('/search?q=capa')),
+        Bench('GET /api/search', get('/api/search?q=finale&due=week')),
+        Bench('GET /edit/<id>', get(lambda: f"/edit/{ctx['ids']()}")),
+        Bench('GET /new', get('/new')),
+        Bench('GET /new_graphical', get('/new_graphical')),
+        Bench('POST /new', post_form('/new', new_form)),
+        Bench('POST /new_graphical', post_form('/new_graphical', new_form)),
+        Bench('GET /import', get('/import')),
+        Bench('GET /api/stats', get('/api/stats')),
+        Bench('GET /api/forecast', get('/api/forecast?days=30&trials=5')),
+        Bench('GET /export/ndjson?list=', get(f"/export/ndjson?list={ctx['small_list']}"), full_scan=True),
+        Bench('GET /thumb/<key>.svg', get(lambda: f"/thumb/{thumbnails.thumbnail_key(_random_fen(rng))}.svg")),
+        Bench('GET /stats/db', get('/stats/db')),
+        Bench('GET /stats/cache', get('/stats/cache')),
+    ]
+
+
+def _flask_client():
+    """Test client già autenticato come utente del benchmark (2FA saltata)."""
+    import app as chess_app
+    chess_app.app.config['TESTING'] = True
+    client = chess_app.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(BENCH_USER_ID)
+        session['_fresh'] = True
+    return client
+
+
+def run(sizes, repeat=REPEAT, data_dir=DATA_DIR, seed=SEED, only=None, skip_routes=False,
+        full_scan_max=FULL_SCAN_MAX_SIZE, regenerate=False):
+    """Esegue tutte le misure su ogni dimensione e restituisce il documento dei risultati."""
+    results = []
+    for label in sizes:
+        size = SIZES[label]
+        db_manager.DB_NAME = prepare_bank(size, seed, data_dir, regenerate)
+        db_manager.invalidate_problems()
+        db_manager.invalidate_lists()
+        rng = random.Random(seed + size)
+        ctx = _sample_context(rng)
+
+        suites = [('db', db_benchmarks(ctx, rng))]
+        if not skip_routes:
+            suites.append(('route', route_benchmarks(ctx, rng, _flask_client())))
+
+        for kind, benches in suites:
+            for bench in benches:
+                if only and only not in bench.name:
+                    continue
+                entry = {'size': label, 'rows': size, 'kind': kind, 'name': bench.name}
+                if bench.full_scan and full_scan_max and size > full_scan_max:
+                    entry['skipped'] = 'full scan'
+                else:
+                    entry.update(measure(bench.fn, repeat, bench.setup))
+                results.append(entry)
+                print(_format_entry(entry), file=sys.stderr, flush=True)
+        db_manager._pool.close_all()
+    return {'meta': _meta(repeat, seed), 'results': results}
+
+
+def _format_entry(entry):
+    head = f"{entry['size']:>5}  {entry['kind']:<5} {entry['name']:<32}"
+    if 'skipped' in entry:
+        return f"{head} saltato ({entry['skipped']})"
+    return f"{head} mediana {entry['median_ms']:>10.3f} ms   p95 {entry['p95_ms']:>10.3f} ms"
+
+
+def _meta(repeat, seed):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'seed': seed,
+    }
+
+
+# ----------------------------------------------------------------------
+# CONFRONTO TRA DUE ESECUZIONI
+# ----------------------------------------------------------------------
+
+def compare(before, after, threshold=REGRESSION_THRESHOLD):
+    """
+    Confronta le mediane di due documenti di risultati. Restituisce le righe
+    (size, kind, name, prima, dopo, rapporto) e il numero di regressioni.
+    """
+    old = {(r['size'], r['kind'], r['name']): r for r in before['results'] if 'median_ms' in r}
+    rows, regressions = [], 0
+    for r in after['results']:
+        key = (r['size'], r['kind'], r['name'])
+        if 'median_ms' not in r or key not in old:
+            continue
+        ratio = r['median_ms'] / old[key]['median_ms'] if old[key]['median_ms'] else float('inf')
+        regressions += ratio > threshold
+        rows.append(key + (old[key]['median_ms'], r['median_ms'], ratio))
+    return rows, regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark di db_manager e delle rotte su banche sintetiche.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="Genera (o rigenera) le banche di prova")
+    generate.add_argument('--sizes', default=DEFAULT_SIZES, help=f"Dimensioni tra {', '.join(SIZES)}")
+    generate.add_argument('--seed', type=int, default=SEED)
+    generate.add_argument('--data-dir', default=DATA_DIR)
+
+    bench = commands.add_parser('run', help="Esegue le misure e salva i risultati in JSON")
+    bench.add_argument('--sizes', default=DEFAULT_SIZES, help=f"Dimensioni tra {', '.join(SIZES)}")
+    bench.add_argument('--repeat', type=int, default=REPEAT)
+    bench.add_argument('--seed', type=int, default=SEED)
+    bench.add_argument('--data-dir', default=DATA_DIR)
+    bench.add_argument('--only', help="Solo le misure il cui nome contiene questo testo")
+    bench.add_argument('--no-routes', action='store_true', help="Solo db_manager, senza le rotte Flask")
+    bench.add_argument('--full-scan-max', type=int, default=FULL_SCAN_MAX_SIZE,
+                       help="Dimensione massima per le funzioni che leggono tutta la banca (0 = sempre)")
+    bench.add_argument('--regenerate', action='store_true', help="Rigenera le banche anche se esistono")
+    bench.add_argument('-o', '--output', help="File JSON dei risultati (default: stampa su stdout)")
+
+    diff = commands.add_parser('compare', help="Confronta due file di risultati")
+    diff.add_argument('before')
+    diff.add_argument('after')
+    diff.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                      help="Rapporto oltre il quale una misura è una regressione (default: %(default)s)")
+
+    args = parser.parse_args()
+
+    if args.command in ('generate', 'run'):
+        sizes = [s.strip().lower() for s in args.sizes.split(',') if s.strip()]
+        unknown = [s for s in sizes if s not in SIZES]
+        if unknown:
+            parser.error(f"Dimensioni sconosciute: {', '.join(unknown)}")
+
+    if args.command == 'generate':
+        for label in sizes:
+            generate_bank(bank_path(SIZES[label], args.seed, args.data_dir), SIZES[label], args.seed)
+    elif args.command == 'run':
+        # Anche quello che stampano le funzioni misurate (migrazioni, errori) va su stderr:
+        # stdout contiene solo il documento JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            document = run(sizes, args.repeat, args.data_dir, args.seed, args.only, args.no_routes,
+                           args.full_scan_max, args.regenerate)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(document, f, indent=1)
+            print(f"Risultati salvati in {args.output}.", file=sys.stderr)
+        else:
+            print(json.dumps(document, indent=1))
+    else:
+        with open(args.before, encoding='utf-8') as f:
+            before = json.load(f)
+        with open(args.after, encoding='utf-8') as f:
+            after = json.load(f)
+        rows, regressions = compare(before, after, args.threshold)
+        for size, kind, name, old_ms, new_ms, ratio in rows:
+            flag = '  <-- REGRESSIONE' if ratio > args.threshold else ''
+            print(f"{size:>5}  {kind:<5} {name:<32} {old_ms:>10.3f} -> {new_ms:>10.3f} ms  x{ratio:.2f}{flag}")
+        print(f"{regressions} regressioni su {len(rows)} misure (soglia x{args.threshold}).")
+        sys.exit(1 if regressions else 0)
@@ -1,61 +1,443 @@
 import sqlite3
 import json
+import re
+import os
+import threading
+from collections import OrderedDict
 import time # Useremo il timestamp Unix (REALE in SQLite) per le date
 from datetime import datetime, timedelta # Useremo timedelta per calcolare la data futura
 
-# Definiamo il nome del file del database
-DB_NAME = 'chess_tutor.db'
+import metrics
+import positions
+
+# Definiamo il nome del file del database (CHESS_TUTOR_DB nell'ambiente per usarne un altro, es. nei test di carico)
+DB_NAME = os.getenv('CHESS_TUTOR_DB', 'chess_tutor.db')
 
 # Costanti iniziali per l'algoritmo SM-2
 INITIAL_EASE_FACTOR = 2.5
 INITIAL_INTERVAL = 0 # Il problema è subito pronto per la prima revisione
 INITIAL_REVIEW_COUNT = 0
 
+# Utente creato al primo avvio: la migrazione v9 gli assegna lo stato SM-2 già presente
+DEFAULT_USER_ID = 1
+
+# --- POOL DI CONNESSIONI ---
+# Numero massimo di connessioni inattive tenute aperte per processo
+POOL_SIZE = 8
+
+# PRAGMA applicati ad ogni nuova connessione.
+# WAL permette ai lettori di non bloccarsi mentre un worker salva una valutazione.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",    # Sicuro con WAL, evita un fsync per ogni commit
+    "PRAGMA cache_size = -20000",     # ~20 MB di cache pagine per connessione
+    "PRAGMA mmap_size = 268435456",   # 256 MB di I/O memory-mapped
+    "PRAGMA busy_timeout = 5000",     # Aspetta fino a 5s invece di 'database is locked'
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+class PooledConnection:
+    """
+    Involucro attorno a sqlite3.Connection: si usa come una connessione normale,
+    ma close() la restituisce al pool invece di chiuderla davvero.
+    """
+
+    def __init__(self, pool, raw_conn, db_name):
+        self._pool = pool
+        self._raw = raw_conn
+        self.db_name = db_name
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    # Durante una richiesta i cursori contano istruzioni e righe (vedi metrics.py)
+    def cursor(self):
+        return metrics.wrap_cursor(self._raw.cursor())
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def __enter__(self):
+        self._raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._raw.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        if self._raw is not None:
+            self._pool.release(self._raw, self.db_name)
+            self._raw = None
+
+
+class ConnectionPool:
+    """
+    Pool di connessioni SQLite riutilizzabili (una per thread/richiesta alla volta).
+    Tiene traccia di hit (connessione riutilizzata) e miss (connessione nuova).
+    """
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._db_name = None
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    def _open(self, db_name):
+        conn = sqlite3.connect(db_name, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _reset_if_stale(self, db_name):
+        # Dopo un fork (es. gunicorn --preload) o un cambio di DB_NAME
+        # le connessioni inattive non sono più utilizzabili.
+        if self._pid != os.getpid() or self._db_name != db_name:
+            stale = self._idle
+            self._idle = []
+            self._pid = os.getpid()
+            self._db_name = db_name
+            for conn in stale:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+
+    def acquire(self, db_name):
+        with self._lock:
+            self._reset_if_stale(db_name)
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop()
+            self.misses += 1
+        return self._open(db_name)
+
+    def release(self, conn, db_name):
+        # Una transazione lasciata aperta non deve finire nella richiesta successiva
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            # Se nel frattempo DB_NAME è cambiato la connessione punta al vecchio DB: si chiude
+            current = db_name == self._db_name and db_name == DB_NAME
+            if current and self._pid == os.getpid() and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+            self.discarded += 1
+        conn.close()
+
+    def close_all(self):
+        """Chiude tutte le connessioni inattive (es. a fine test o allo shutdown)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'discarded': self.discarded,
+                'idle': len(self._idle),
+                'size': self.size,
+                'hit_ratio': (self.hits / total) if total else 0.0,
+            }
+
+
+_pool = ConnectionPool()
+
+
 def create_connection():
-    """Crea una connessione al database SQLite e imposta row_factory."""
-    conn = None
+    """
+    Restituisce una connessione dal pool (o ne apre una nuova se il pool è vuoto).
+    Chiamare close() come sempre: la connessione torna nel pool.
+    """
     try:
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row 
-        return conn
+        db_name = DB_NAME
+        return PooledConnection(_pool, _pool.acquire(db_name), db_name)
     except sqlite3.Error as e:
         print(f"Errore durante la connessione al database: {e}")
         return None
 
+
+def get_pool_stats():
+    """Contatori hit/miss del pool di connessioni del processo corrente."""
+    return _pool.stats()
+
+
+# ----------------------------------------------------------------------
+# CACHE IN MEMORIA (LRU + TTL) PER PROBLEMI DECODIFICATI E ELENCO LISTE
+# Ogni scrittura fatta da questo modulo invalida le voci che tocca; il TTL
+# limita quanto può restare vecchia una voce modificata da un altro processo
+# (altri worker gunicorn, script da riga di comando).
+# ----------------------------------------------------------------------
+
+PROBLEM_CACHE_SIZE = 2048
+PROBLEM_CACHE_TTL = 60     # secondi
+LISTS_CACHE_TTL = 300      # secondi
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Dizionario limitato a `maxsize` voci (scarta le meno usate) con scadenza `ttl` secondi."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Valore in cache oppure _MISSING."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]  # Scaduta
+            self.misses += 1
+            return _MISSING
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hit_ratio': (self.hits / total) if total else 0.0,
+            }
+
+
+_problem_cache = LRUCache(PROBLEM_CACHE_SIZE, PROBLEM_CACHE_TTL)
+_lists_cache = LRUCache(1, LISTS_CACHE_TTL)
+
+
+def _copy_problem(problem):
+    """Copia da restituire ai chiamanti: possono modificarla senza toccare la cache."""
+    p = dict(problem)
+    p['solution_moves'] = list(p['solution_moves'])
+    p['tags'] = list(p['tags'])
+    for key in ('solution_uci', 'solution_fens'):
+        if p.get(key) is not None:
+            p[key] = list(p[key])
+    return p
+
+def invalidate_problems(problem_ids=None):
+    """Toglie dalla cache i problemi indicati (tutti se None), es. dopo scritture in blocco."""
+    if problem_ids is None:
+        _problem_cache.clear()
+        return
+    for problem_id in problem_ids:
+        _problem_cache.invalidate((DB_NAME, problem_id))
+
+def invalidate_lists():
+    """Da chiamare quando cambia l'insieme delle liste (inserimenti, spostamenti, eliminazioni)."""
+    _lists_cache.clear()
+
+def get_cache_stats():
+    """Hit ratio e dimensione delle cache del processo corrente."""
+    return {'problems': _problem_cache.stats(), 'lists': _lists_cache.stats()}
+
+# Query di inserimento condivisa da insert_new_problem e insert_problems_batch.
+# Lo stato SM-2 non sta qui: è per utente (user_problem_state) e nasce alla prima valutazione.
+# solution_uci e solution_fens vengono da movegen.validate_solution (NULL se non validata).
+INSERT_PROBLEM_SQL = """
+INSERT INTO problems (
+    fen, solution_moves, tags, 
+    white_player, black_player, game_year, tournament, winner,
+    custom_list,  -- <--- AGGIUNTO
+    position_key, solution_uci, solution_fens
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _insert_params(fen, solution_moves, tags, white_player=None, black_player=None,
+                   game_year=None, tournament=None, winner=None, custom_list=None,
+                   position_key=None, solution_uci=None, solution_fens=None):
+    """Parametri di INSERT_PROBLEM_SQL per un problema nuovo."""
+    if position_key is None:
+        position_key = positions.position_key(fen)
+    return (
+        fen, json.dumps(solution_moves), json.dumps(tags),
+        white_player, black_player, game_year, tournament, winner,
+        custom_list, # <--- AGGIUNTO
+        position_key,
+        json.dumps(solution_uci) if solution_uci is not None else None,
+        json.dumps(solution_fens) if solution_fens is not None else None,
+    )
+
+
+# --- Duplicati (stessa chiave di posizione, vedi positions.py) ---
+# reject: il nuovo problema viene scartato
+# merge_tags: i tag del nuovo problema vengono aggiunti a quello esistente
+# add_to_list: il problema esistente viene spostato nella lista del nuovo
+# allow: si inserisce comunque una copia
+DUPLICATE_POLICIES = ('reject', 'merge_tags', 'add_to_list', 'allow')
+DEFAULT_DUPLICATE_POLICY = 'reject'
+
+def _existing_positions(cursor, keys):
+    """{position_key: {'id', 'tags', 'custom_list'}} dei problemi già presenti (ricerca sull'indice)."""
+    keys = list(keys)
+    existing = {}
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ", ".join("?" for _ in chunk)
+        cursor.execute(f"""
+            SELECT position_key, id, tags, custom_list FROM problems
+            WHERE position_key IN ({placeholders}) ORDER BY id
+        """, chunk)
+        for row in cursor.fetchall():
+            # Se ci sono già più copie vale la più vecchia
+            if row['position_key'] not in existing:
+                existing[row['position_key']] = {
+                    'id': row['id'],
+                    'tags': json.loads(row['tags']) if row['tags'] else [],
+                    'custom_list': row['custom_list'],
+                }
+    return existing
+
+def _resolve_duplicates(cursor, problems, on_duplicate):
+    """
+    Applica la politica sui duplicati a un blocco di problemi (dizionari con gli
+    argomenti di insert_new_problem), sia rispetto al DB sia all'interno del blocco.
+    Aggiorna i problemi esistenti se richiesto (senza commit) e restituisce
+    (problemi da inserire, id dei problemi esistenti coinvolti).
+    """
+    for p in problems:
+        p['position_key'] = positions.position_key(p['fen'])
+    if on_duplicate == 'allow':
+        return problems, []
+
+    existing = _existing_positions(cursor, {p['position_key'] for p in problems if p['position_key'] is not None})
+    to_insert = []
+    pending = {}  # position_key -> problema nuovo già accettato in questo blocco
+    touched = {}  # id -> problema esistente da aggiornare
+    duplicate_ids = []
+
+    for p in problems:
+        key = p['position_key']
+        in_db = key is not None and key in existing
+        target = existing[key] if in_db else pending.get(key) if key is not None else None
+        if target is None:
+            to_insert.append(p)
+            if key is not None:
+                pending[key] = p
+            continue
+
+        changed = False
+        if on_duplicate == 'merge_tags':
+            tags = list(target.get('tags') or [])
+            new_tags = [t for t in (p.get('tags') or []) if t not in tags]
+            if new_tags:
+                target['tags'] = tags + new_tags
+                changed = True
+        elif on_duplicate == 'add_to_list' and p.get('custom_list') and p['custom_list'] != target.get('custom_list'):
+            target['custom_list'] = p['custom_list']
+            changed = True
+        # I duplicati interni al blocco sono già stati fusi nel problema da inserire
+        if in_db:
+            duplicate_ids.append(target['id'])
+            if changed:
+                touched[target['id']] = target
+
+    if touched:
+        cursor.executemany("UPDATE problems SET tags = ?, custom_list = ? WHERE id = ?", [
+            (json.dumps(t['tags']), t['custom_list'], problem_id) for problem_id, t in touched.items()
+        ])
+    return to_insert, duplicate_ids
+
+def find_duplicate(fen):
+    """ID del problema già presente con la stessa posizione, oppure None."""
+    key = positions.position_key(fen)
+    if key is None:
+        return None
+    conn = create_connection()
+    if conn is None:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM problems WHERE position_key = ? ORDER BY id LIMIT 1", (key,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        print(f"Errore durante la ricerca del duplicato: {e}")
+        return None
+    finally:
+        conn.close()
+
 def insert_new_problem(fen, solution_moves, tags, 
                        white_player=None, black_player=None, 
-                       game_year=None, tournament=None, winner=None, custom_list=None):
+                       game_year=None, tournament=None, winner=None, custom_list=None,
+                       on_duplicate=DEFAULT_DUPLICATE_POLICY, solution_uci=None, solution_fens=None):
     """
-    Inserisce un problema con metadati opzionali sulla partita.
+    Inserisce un problema con metadati opzionali sulla partita e, se già
+    validata (movegen.validate_solution), la soluzione precalcolata.
+    Se la posizione esiste già applica `on_duplicate` (vedi DUPLICATE_POLICIES):
+    restituisce l'ID del problema nuovo, quello del problema esistente
+    (merge_tags / add_to_list) oppure None se il duplicato è stato scartato.
     """
     conn = create_connection()
     if conn is None:
         return None
 
-    solution_json = json.dumps(solution_moves)
-    tags_json = json.dumps(tags)
-    current_timestamp = time.time() 
-
-    # Query aggiornata con i nuovi campi
-    sql = """
-    INSERT INTO problems (
-        fen, solution_moves, tags, 
-        last_reviewed, next_review, ease_factor, interval_days, review_count,
-        white_player, black_player, game_year, tournament, winner,
-        custom_list  -- <--- AGGIUNTO
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    params = (
-        fen, solution_json, tags_json, current_timestamp, current_timestamp,
-        INITIAL_EASE_FACTOR, INITIAL_INTERVAL, INITIAL_REVIEW_COUNT,
-        white_player, black_player, game_year, tournament, winner,
-        custom_list # <--- AGGIUNTO
-    )
+    problem = {
+        'fen': fen, 'solution_moves': solution_moves, 'tags': tags,
+        'white_player': white_player, 'black_player': black_player, 'game_year': game_year,
+        'tournament': tournament, 'winner': winner, 'custom_list': custom_list,
+        'solution_uci': solution_uci, 'solution_fens': solution_fens,
+    }
 
     try:
         cursor = conn.cursor()
-        cursor.execute(sql, params)
+        to_insert, duplicate_ids = _resolve_duplicates(cursor, [problem], on_duplicate)
+        if not to_insert:
+            conn.commit()
+            invalidate_problems(duplicate_ids)
+            invalidate_lists()
+            if on_duplicate == 'reject':
+                print(f"Problema duplicato: la posizione è già presente (ID {duplicate_ids[0]}).")
+                return None
+            return duplicate_ids[0]
+        cursor.execute(INSERT_PROBLEM_SQL, _insert_params(**problem))
         conn.commit()
+        invalidate_lists()
         return cursor.lastrowid
     except sqlite3.Error as e:
         print(f"Errore durante l'inserimento: {e}")
@@ -64,8 +446,39 @@ def insert_new_problem(fen, solution_moves, tags,
         conn.close()
 
 
+def insert_problems_batch(conn, problems, on_duplicate=DEFAULT_DUPLICATE_POLICY):
+    """
+    Inserisce molti problemi in un'unica transazione con executemany.
+    `problems` è una lista di dizionari con le stesse chiavi degli argomenti
+    di insert_new_problem. Restituisce il numero di righe inserite (i duplicati,
+    secondo `on_duplicate`, sono scartati o fusi con i problemi esistenti).
+    La connessione è dell'importatore, che la riusa per tutti i blocchi.
+    """
+    try:
+        cursor = conn.cursor()
+        to_insert, duplicate_ids = _resolve_duplicates(cursor, problems, on_duplicate)
+        rows = [_insert_params(**p) for p in to_insert]
+        cursor.executemany(INSERT_PROBLEM_SQL, rows)
+        conn.commit()
+        invalidate_problems(duplicate_ids)
+        invalidate_lists()
+        return len(rows)
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Errore durante l'inserimento in blocco: {e}")
+        raise
+
+
 def get_problem_by_id(problem_id):
-    """Recupera un singolo problema dal database tramite ID."""
+    """
+    Recupera un singolo problema (con solution_moves e tags già decodificati)
+    tramite ID, passando dalla cache in memoria.
+    """
+    key = (DB_NAME, problem_id)
+    cached = _problem_cache.get(key)
+    if cached is not _MISSING:
+        return _copy_problem(cached)
+
     conn = create_connection()
     if conn is None: return None
     try:
@@ -73,27 +486,80 @@ def get_problem_by_id(problem_id):
         cursor.execute("SELECT * FROM problems WHERE id = ?", (problem_id,))
         row = cursor.fetchone()
         if row:
-            return dict(row)
+            problem = _decode_problem(row)
+            _problem_cache.set(key, problem)
+            return _copy_problem(problem)
+        return None
+    except sqlite3.Error as e:
+        print(f"Errore durante il recupero del problema: {e}")
         return None
     finally:
         conn.close()
 
-def update_problem_details(problem_id, tags, white, black, year, tournament, winner, custom_list):
-    """Aggiorna i metadati (tag e dati storici) di un problema esistente."""
+IDS_CHUNK_SIZE = 500  # ID per query "IN (...)": resta sotto il limite di parametri di SQLite
+
+def get_problems_by_ids(problem_ids):
+    """
+    Recupera più problemi (decodificati come get_problem_by_id) nell'ordine degli ID
+    indicati, saltando quelli che non esistono. Quelli già in cache non vengono
+    riletti, gli altri arrivano a blocchi di IDS_CHUNK_SIZE con "id IN (...)":
+    una query per blocco invece di una per problema, e finiscono in cache.
+    """
+    found = {}
+    missing = []
+    for problem_id in problem_ids:
+        cached = _problem_cache.get((DB_NAME, problem_id))
+        if cached is not _MISSING:
+            found[problem_id] = _copy_problem(cached)
+        else:
+            missing.append(problem_id)
+
+    if missing:
+        conn = create_connection()
+        if conn is None: return []
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(missing), IDS_CHUNK_SIZE):
+                chunk = missing[start:start + IDS_CHUNK_SIZE]
+                placeholders = ", ".join("?" for _ in chunk)
+                cursor.execute(f"SELECT * FROM problems WHERE id IN ({placeholders})", chunk)
+                for row in cursor.fetchall():
+                    problem = _decode_problem(row)
+                    _problem_cache.set((DB_NAME, row['id']), problem)
+                    found[row['id']] = _copy_problem(problem)
+        except sqlite3.Error as e:
+            print(f"Errore durante il recupero dei problemi: {e}")
+            return []
+        finally:
+            conn.close()
+
+    return [found[problem_id] for problem_id in problem_ids if problem_id in found]
+
+def update_problem_details(problem_id, tags, white, black, year, tournament, winner, custom_list=None):
+    """
+    Aggiorna i metadati (tag e dati storici) di un problema esistente.
+    Se custom_list è None la lista non viene toccata (si cambia con update_problem_list_only).
+    L'indice dei tag (problem_tags) viene aggiornato dal trigger su problems.tags.
+    """
     conn = create_connection()
     if conn is None: return False
     
     tags_json = json.dumps(tags)
     
-    sql = """
-    UPDATE problems 
-    SET tags = ?, white_player = ?, black_player = ?, game_year = ?, tournament = ?, winner = ?, custom_list = ?
-    WHERE id = ?
-    """
+    sql = "UPDATE problems SET tags = ?, white_player = ?, black_player = ?, game_year = ?, tournament = ?, winner = ?"
+    params = [tags_json, white, black, year, tournament, winner]
+    if custom_list is not None:
+        sql += ", custom_list = ?"
+        params.append(custom_list)
+    sql += " WHERE id = ?"
+    params.append(problem_id)
     try:
         cursor = conn.cursor()
-        cursor.execute(sql, (tags_json, white, black, year, tournament, winner, problem_id))
+        cursor.execute(sql, params)
         conn.commit()
+        invalidate_problems([problem_id])
+        if custom_list is not None:
+            invalidate_lists()
         return True
     except sqlite3.Error as e:
         print(f"Errore aggiornamento: {e}")
@@ -109,6 +575,8 @@ def delete_problem(problem_id):
         cursor = conn.cursor()
         cursor.execute("DELETE FROM problems WHERE id = ?", (problem_id,))
         conn.commit()
+        invalidate_problems([problem_id])
+        invalidate_lists()
         return True
     except sqlite3.Error as e:
         print(f"Errore eliminazione: {e}")
@@ -118,16 +586,153 @@ def delete_problem(problem_id):
 
 
 # --- 3. NUOVA FUNZIONE: Ottieni liste uniche ---
+# Letta dal catalogo 'lists' (una riga per lista, mantenuto dai trigger), senza toccare problems
+UNIQUE_LISTS_SQL = "SELECT name FROM lists WHERE name != '' ORDER BY name"
+
 def get_unique_lists():
-    """Restituisce l'elenco di tutte le liste presenti nel DB."""
+    """Restituisce l'elenco di tutte le liste presenti nel DB (dalla cache se possibile)."""
+    cached = _lists_cache.get(DB_NAME)
+    if cached is not _MISSING:
+        return list(cached)
+
     conn = create_connection()
     if conn is None: return []
     try:
         cursor = conn.cursor()
         # Prende solo i valori distinti e non nulli
-        cursor.execute("SELECT DISTINCT custom_list FROM problems WHERE custom_list IS NOT NULL AND custom_list != ''")
+        cursor.execute(UNIQUE_LISTS_SQL)
         rows = cursor.fetchall()
-        return [row[0] for row in rows]
+        lists = [row[0] for row in rows]
+        _lists_cache.set(DB_NAME, lists)
+        return list(lists)
+    except sqlite3.Error as e:
+        print(f"Errore durante il recupero delle liste: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+def get_list_catalog(user_id):
+    """
+    Tutte le liste con totale, problemi nuovi (mai valutati dall'utente), in
+    scadenza ora (nuovi compresi) ed ease medio (i nuovi contano con l'ease iniziale):
+    [{'name', 'total', 'new', 'due', 'avg_ease'}, ...] ('' = problemi senza lista).
+    Costo proporzionale al numero di liste: i giorni già passati si sommano
+    dall'istogramma user_list_due_days, solo quelli di oggi si contano sull'indice.
+    """
+    conn = create_connection()
+    if conn is None:
+        return []
+
+    now_ts = time.time()
+    today = int(now_ts // 86400)
+    sql = """
+    SELECT
+        l.name,
+        l.total,
+        l.total - COALESCE(u.started, 0) AS new,
+        (COALESCE(u.ease_sum, 0) + (l.total - COALESCE(u.started, 0)) * :initial_ease) / l.total AS avg_ease,
+        l.total - COALESCE(u.started, 0)
+        + COALESCE((SELECT SUM(d.count) FROM user_list_due_days d
+                    WHERE d.user_id = :user_id AND d.list_name = l.name AND d.day < :today), 0)
+        + (SELECT COUNT(*) FROM user_problem_state s
+           WHERE s.user_id = :user_id AND s.list_name = l.name
+           AND s.next_review >= :day_start AND s.next_review <= :now) AS due
+    FROM lists l
+    LEFT JOIN user_list_stats u ON u.user_id = :user_id AND u.list_name = l.name
+    ORDER BY l.name
+    """
+    params = {'user_id': user_id, 'today': today, 'day_start': today * 86400, 'now': now_ts,
+              'initial_ease': INITIAL_EASE_FACTOR}
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Errore durante la lettura del catalogo delle liste: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+# ----------------------------------------------------------------------
+# UTENTI
+# ----------------------------------------------------------------------
+
+def create_user(username, password_hash, email=None, user_id=None):
+    """Crea un utente e ne restituisce l'ID (None se lo username esiste già)."""
+    conn = create_connection()
+    if conn is None:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO users (id, username, password_hash, email, created_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, username, password_hash, email, time.time()))
+        conn.commit()
+        return cursor.lastrowid
+    except sqlite3.IntegrityError:
+        print(f"Utente '{username}' già esistente.")
+        return None
+    except sqlite3.Error as e:
+        print(f"Errore durante la creazione dell'utente: {e}")
+        return None
+    finally:
+        conn.close()
+
+def _get_user(where, value):
+    conn = create_connection()
+    if conn is None:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT id, username, password_hash, email, created_at FROM users WHERE {where} = ?", (value,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    except sqlite3.Error as e:
+        print(f"Errore durante il recupero dell'utente: {e}")
+        return None
+    finally:
+        conn.close()
+
+def get_user(user_id):
+    """Utente per ID (dizionario con username, password_hash, email), oppure None."""
+    return _get_user("id", user_id)
+
+def get_user_by_username(username):
+    return _get_user("username", username)
+
+def get_users():
+    """Elenco degli utenti (senza hash della password), in ordine di ID."""
+    conn = create_connection()
+    if conn is None:
+        return []
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, username, email, created_at FROM users ORDER BY id")
+        return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Errore durante il recupero degli utenti: {e}")
+        return []
+    finally:
+        conn.close()
+
+def update_user(user_id, password_hash=None, email=None):
+    """Cambia password e/o email di un utente (i valori None restano invariati)."""
+    conn = create_connection()
+    if conn is None:
+        return False
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE users SET password_hash = COALESCE(?, password_hash), email = COALESCE(?, email)
+            WHERE id = ?
+        """, (password_hash, email, user_id))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Errore durante l'aggiornamento dell'utente: {e}")
+        return False
     finally:
         conn.close()
 
@@ -150,48 +755,378 @@ if __name__ == '__main__':
     else:
         print("Inserimento fallito.")
 
-def get_problems_for_review(active_list_filter=None):
+def _tags_clause(tags, column="id"):
     """
-    Recupera i problemi scaduti. Se active_list_filter è impostato,
-    restituisce solo i problemi di quella lista.
+    Condizione "<column> IN (...)" per i problemi che hanno TUTTI i tag indicati,
+    risolta sull'indice problem_tags (nessun json.loads). Restituisce (SQL, parametri).
     """
-    conn = create_connection()
-    if conn is None:
-        return []
+    placeholders = ", ".join("?" for _ in tags)
+    sql = f"""{column} IN (
+        SELECT pt.problem_id FROM tags t JOIN problem_tags pt ON pt.tag_id = t.id
+        WHERE t.name IN ({placeholders})
+        GROUP BY pt.problem_id HAVING COUNT(*) = ?
+    )"""
+    return sql, list(tags) + [len(tags)]
 
-    current_timestamp = time.time()
-    
-    # 1. Query Base: Prendi i problemi scaduti
-    sql = "SELECT * FROM problems WHERE next_review <= ?"
-    params = [current_timestamp]
+# ----------------------------------------------------------------------
+# CODA DI REVISIONE PER UTENTE
+# Un problema che l'utente non ha mai valutato non ha righe in
+# user_problem_state: è "nuovo" e pronto subito. La coda propone prima i
+# problemi già iniziati e scaduti (per scadenza), poi i nuovi (per ID).
+# ----------------------------------------------------------------------
+
+def _review_query(user_id, active_list_filter=None, current_timestamp=None, limit=None, tags=None):
+    """
+    Costruisce la query degli ID dei problemi già iniziati e scaduti (SQL, parametri).
+    Usa idx_state_user_next_review o idx_state_user_list_next_review (vedi update_db_schema).
+    Con `tags` restano solo i problemi che li hanno tutti (intersezione).
+    """
+    if current_timestamp is None:
+        current_timestamp = time.time()
+
+    # 1. Query Base: Prendi i problemi scaduti dell'utente
+    sql = "SELECT s.problem_id FROM user_problem_state s WHERE s.user_id = ? AND s.next_review <= ?"
+    params = [user_id, current_timestamp]
 
     # 2. Filtro Lista
     if active_list_filter and active_list_filter != "Tutti":
-        sql += " AND custom_list = ?"
+        sql += " AND s.list_name = ?"
         params.append(active_list_filter)
 
-    # 3. Ordinamento
-    sql += " ORDER BY next_review ASC"
-    
-    problems = []
-    
+    # 3. Filtro Tag (intersezione)
+    if tags:
+        tags_sql, tags_params = _tags_clause(tags, "s.problem_id")
+        sql += " AND " + tags_sql
+        params += tags_params
+
+    # 4. Ordinamento
+    sql += " ORDER BY s.next_review ASC"
+
+    # 5. Solo la testa della coda, se richiesto
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+def _new_problems_query(user_id, active_list_filter=None, limit=None, tags=None, after_id=None):
+    """
+    Costruisce la query degli ID dei problemi mai valutati dall'utente, in ordine di ID
+    (SQL, parametri). Scorre problems sulla chiave primaria (o su idx_problems_custom_list)
+    e scarta quelli già iniziati con una ricerca sulla chiave di user_problem_state;
+    `after_id` riparte dall'ultimo nuovo già messo in coda.
+    """
+    sql = """SELECT p.id FROM problems p
+    WHERE NOT EXISTS (SELECT 1 FROM user_problem_state s WHERE s.user_id = ? AND s.problem_id = p.id)"""
+    params = [user_id]
+
+    if active_list_filter and active_list_filter != "Tutti":
+        sql += " AND p.custom_list = ?"
+        params.append(active_list_filter)
+    if tags:
+        tags_sql, tags_params = _tags_clause(tags, "p.id")
+        sql += " AND " + tags_sql
+        params += tags_params
+    if after_id is not None:
+        sql += " AND p.id > ?"
+        params.append(after_id)
+
+    sql += " ORDER BY p.id ASC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+def _decode_problem(row):
+    """Converte una riga in dizionario decodificando solution_moves, tags e la soluzione precalcolata."""
+    p = dict(row)
+    p['solution_moves'] = metrics.json_loads(p['solution_moves']) if p['solution_moves'] else []
+    p['tags'] = metrics.json_loads(p['tags']) if p['tags'] else []
+    # NULL = soluzione non ancora validata (problemi precedenti alla v10)
+    for key in ('solution_uci', 'solution_fens'):
+        if key in p:
+            p[key] = metrics.json_loads(p[key]) if p[key] else None
+    return p
+
+def get_review_queue_ids(user_id, active_list_filter=None, limit=20, tags=None, after_new_id=None):
+    """
+    Restituisce (ID dei prossimi `limit` problemi in ordine di coda, ID dell'ultimo
+    problema nuovo incluso). Il secondo valore va ripassato come `after_new_id` alla
+    ricarica successiva, così i nuovi già in coda non vengono riletti.
+    Legge solo gli indici: serve a riempire la coda prefetch della sessione.
+    """
+    conn = create_connection()
+    if conn is None:
+        return [], after_new_id
+
     try:
         cursor = conn.cursor()
+        sql, params = _review_query(user_id, active_list_filter, limit=limit, tags=tags)
         cursor.execute(sql, params)
-        
-        rows = cursor.fetchall()
-        
-        for row in rows:
-            p = dict(row)
-            # Decodifica JSON
-            p['solution_moves'] = json.loads(p['solution_moves'])
-            p['tags'] = json.loads(p['tags'])
-            problems.append(p)
-            
-        return problems
-        
+        ids = [row[0] for row in cursor.fetchall()]
+
+        # Se i ripassi non bastano a riempire la coda, si aggiungono i nuovi
+        if limit is None or len(ids) < limit:
+            remaining = None if limit is None else limit - len(ids)
+            start_after = after_new_id
+            if start_after is None:
+                # I problemi sotto la frontiera sono già tutti iniziati: inutile scorrerli
+                row = cursor.execute("SELECT new_frontier FROM users WHERE id = ?", (user_id,)).fetchone()
+                start_after = row[0] if row and row[0] else None
+            sql, params = _new_problems_query(user_id, active_list_filter, remaining, tags, start_after)
+            cursor.execute(sql, params)
+            new_ids = [row[0] for row in cursor.fetchall()]
+            if new_ids:
+                # Senza filtri, tutti i problemi saltati prima del primo nuovo sono iniziati
+                unfiltered = not tags and (not active_list_filter or active_list_filter == "Tutti")
+                if after_new_id is None and unfiltered and new_ids[0] - 1 > (start_after or 0):
+                    cursor.execute("UPDATE users SET new_frontier = ? WHERE id = ? AND new_frontier < ?",
+                                   (new_ids[0] - 1, user_id, new_ids[0] - 1))
+                    conn.commit()
+                after_new_id = new_ids[-1]
+            ids += new_ids
+        return ids, after_new_id
     except sqlite3.Error as e:
-        print(f"Errore durante il recupero dei problemi: {e}")
+        print(f"Errore durante il recupero della coda: {e}")
+        return [], after_new_id
+    finally:
+        conn.close()
+
+def get_due_problem_ids(user_id, active_list_filter=None, limit=20, tags=None):
+    """ID dei prossimi `limit` problemi da ripassare (scaduti, poi nuovi), in ordine di coda."""
+    return get_review_queue_ids(user_id, active_list_filter, limit, tags)[0]
+
+def get_problems_for_review(user_id, active_list_filter=None):
+    """
+    Recupera tutti i problemi da ripassare (scaduti e nuovi). Se active_list_filter
+    è impostato, restituisce solo i problemi di quella lista.
+    """
+    return get_problems_by_ids(get_due_problem_ids(user_id, active_list_filter, limit=None))
+
+
+def get_next_problem_for_review(user_id, active_list_filter=None):
+    """
+    Restituisce solo il primo problema della coda, già decodificato,
+    oppure None se non c'è nulla da ripassare.
+    """
+    ids = get_due_problem_ids(user_id, active_list_filter, limit=1)
+    return get_problem_by_id(ids[0]) if ids else None
+
+
+def get_next_due_preview(user_id, active_list_filter=None, tags=None):
+    """Restituisce solo id e FEN del prossimo problema da ripassare (per l'anteprima in dashboard)."""
+    ids = get_due_problem_ids(user_id, active_list_filter, limit=1, tags=tags)
+    problem = get_problem_by_id(ids[0]) if ids else None
+    return {'id': problem['id'], 'fen': problem['fen']} if problem else None
+
+
+def get_due_problem(user_id, problem_id):
+    """
+    Recupera un problema (decodificato) solo se è ancora da ripassare per l'utente
+    (nuovo, o iniziato e scaduto). Restituisce None se non esiste o se nel frattempo
+    è già stato ripassato. Il problema arriva dalla cache, lo stato dalla chiave
+    primaria di user_problem_state.
+    """
+    problem = get_problem_by_id(problem_id)
+    if problem is None:
+        return None
+
+    conn = create_connection()
+    if conn is None:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT next_review FROM user_problem_state WHERE user_id = ? AND problem_id = ?",
+                       (user_id, problem_id))
+        row = cursor.fetchone()
+        if row is not None and row[0] > time.time():
+            return None
+        return problem
+    except sqlite3.Error as e:
+        print(f"Errore durante il controllo della scadenza: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+# ----------------------------------------------------------------------
+# CONTEGGI DELLA CODA (solo SQL aggregato, nessun json.loads)
+# ----------------------------------------------------------------------
+
+def _due_boundaries(current_time=None):
+    """Restituisce i timestamp limite per 'ora', 'oggi' (fine giornata) e 'settimana' (7 giorni)."""
+    if current_time is None:
+        current_time = datetime.now()
+    end_of_today = datetime.combine(current_time.date() + timedelta(days=1), datetime.min.time())
+    end_of_week = current_time + timedelta(days=7)
+    return current_time.timestamp(), end_of_today.timestamp(), end_of_week.timestamp()
+
+def get_due_counts(user_id, active_list_filter=None, tags=None):
+    """
+    Conta i problemi in scadenza "ora", "oggi" e "questa settimana" senza caricare
+    le righe, più quelli nuovi (mai valutati, già compresi nei tre conteggi).
+    Restituisce un dizionario {'now', 'today', 'week', 'new'}.
+    """
+    counts = {'now': 0, 'today': 0, 'week': 0, 'new': 0}
+    conn = create_connection()
+    if conn is None:
+        return counts
+
+    now_ts, today_ts, week_ts = _due_boundaries()
+    list_filter = active_list_filter if active_list_filter and active_list_filter != "Tutti" else None
+
+    due_sql = """
+    SELECT
+        COALESCE(SUM(s.next_review <= ?), 0),
+        COALESCE(SUM(s.next_review <= ?), 0),
+        COUNT(*)
+    FROM user_problem_state s
+    WHERE s.user_id = ? AND s.next_review <= ?
+    """
+    due_params = [now_ts, today_ts, user_id, week_ts]
+    if list_filter:
+        due_sql += " AND s.list_name = ?"
+        due_params.append(list_filter)
+
+    # Nuovi = problemi nel filtro - problemi già iniziati nel filtro
+    if tags:
+        tags_sql, tags_params = _tags_clause(tags, "p.id")
+        total_sql = f"SELECT COUNT(*) FROM problems p WHERE {tags_sql}"
+        total_params = list(tags_params)
+        started_sql, started_params = _tags_clause(tags, "s.problem_id")
+        started_sql = f"SELECT COUNT(*) FROM user_problem_state s WHERE s.user_id = ? AND {started_sql}"
+        started_params = [user_id] + started_params
+        due_sql += " AND " + _tags_clause(tags, "s.problem_id")[0]
+        due_params += tags_params
+        if list_filter:
+            total_sql += " AND p.custom_list = ?"
+            total_params.append(list_filter)
+            started_sql += " AND s.list_name = ?"
+            started_params.append(list_filter)
+    else:
+        # Senza tag bastano i contatori del catalogo (una riga per lista)
+        total_sql = "SELECT COALESCE(SUM(total), 0) FROM lists"
+        total_params = []
+        started_sql = "SELECT COALESCE(SUM(started), 0) FROM user_list_stats WHERE user_id = ?"
+        started_params = [user_id]
+        if list_filter:
+            total_sql += " WHERE name = ?"
+            total_params.append(list_filter)
+            started_sql += " AND list_name = ?"
+            started_params.append(list_filter)
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(due_sql, due_params)
+        row = cursor.fetchone()
+        cursor.execute(f"SELECT ({total_sql}) - ({started_sql})", total_params + started_params)
+        counts['new'] = cursor.fetchone()[0]
+        counts['now'] = row[0] + counts['new']
+        counts['today'] = row[1] + counts['new']
+        counts['week'] = row[2] + counts['new']
+        return counts
+    except sqlite3.Error as e:
+        print(f"Errore durante il conteggio dei problemi: {e}")
+        return counts
+    finally:
+        conn.close()
+
+def get_due_counts_by_list(user_id):
+    """
+    Come get_due_counts, ma raggruppato per lista (i problemi senza lista hanno list = None).
+    Gli iniziati si contano sull'indice (user_id, next_review), i nuovi dal catalogo.
+    """
+    conn = create_connection()
+    if conn is None:
+        return []
+
+    now_ts, today_ts, week_ts = _due_boundaries()
+    sql = """
+    SELECT NULLIF(list_name, '') AS list, SUM(now) AS now, SUM(today) AS today, SUM(week) AS week
+    FROM (
+        SELECT list_name,
+               SUM(next_review <= :now) AS now,
+               SUM(next_review <= :today) AS today,
+               COUNT(*) AS week
+        FROM user_problem_state
+        WHERE user_id = :user_id AND next_review <= :week
+        GROUP BY list_name
+        UNION ALL
+        SELECT l.name, l.total - COALESCE(u.started, 0), l.total - COALESCE(u.started, 0), l.total - COALESCE(u.started, 0)
+        FROM lists l LEFT JOIN user_list_stats u ON u.user_id = :user_id AND u.list_name = l.name
+    )
+    GROUP BY list_name
+    HAVING SUM(week) > 0
+    ORDER BY list
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, {'user_id': user_id, 'now': now_ts, 'today': today_ts, 'week': week_ts})
+        return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Errore durante il conteggio per lista: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+def get_tags_with_due_counts(user_id, active_list_filter=None):
+    """
+    Tutti i tag (in ordine alfabetico) con il numero di problemi da ripassare ora
+    (scaduti o nuovi), per il menu della dashboard: [{'name', 'due'}, ...]. I problemi
+    scaduti si trovano con l'indice (user_id, next_review), i loro tag con
+    idx_problem_tags_problem; i nuovi sono tags.problem_count meno i problemi già
+    iniziati, quindi per un utente nuovo non si legge nessun legame tag-problema.
+    """
+    conn = create_connection()
+    if conn is None:
+        return []
+
+    list_filter = active_list_filter if active_list_filter and active_list_filter != "Tutti" else None
+    due_sql = """
+        SELECT pt.tag_id, COUNT(*) AS due
+        FROM user_problem_state s JOIN problem_tags pt ON pt.problem_id = s.problem_id
+        WHERE s.user_id = ? AND s.next_review <= ?
+    """
+    params = [user_id, time.time()]
+    if list_filter:
+        due_sql += " AND s.list_name = ?"
+        params.append(list_filter)
+    due_sql += " GROUP BY pt.tag_id"
+
+    if list_filter:
+        # Problemi della lista (idx_problems_custom_list) senza stato per l'utente
+        new_sql = """
+            SELECT pt.tag_id, COUNT(*) AS new
+            FROM problems p JOIN problem_tags pt ON pt.problem_id = p.id
+            WHERE p.custom_list = ?
+            AND NOT EXISTS (SELECT 1 FROM user_problem_state s WHERE s.user_id = ? AND s.problem_id = p.id)
+            GROUP BY pt.tag_id
+        """
+        params += [list_filter, user_id]
+        new_count = "COALESCE(n.new, 0)"
+    else:
+        new_sql = """
+            SELECT pt.tag_id, COUNT(*) AS started
+            FROM user_problem_state s JOIN problem_tags pt ON pt.problem_id = s.problem_id
+            WHERE s.user_id = ?
+            GROUP BY pt.tag_id
+        """
+        params.append(user_id)
+        new_count = "t.problem_count - COALESCE(n.started, 0)"
+
+    sql = f"""
+    SELECT t.name, COALESCE(d.due, 0) + {new_count} AS due
+    FROM tags t
+    LEFT JOIN ({due_sql}) d ON d.tag_id = t.id
+    LEFT JOIN ({new_sql}) n ON n.tag_id = t.id
+    ORDER BY t.name
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Errore durante il conteggio per tag: {e}")
         return []
     finally:
         conn.close()
@@ -212,6 +1147,8 @@ def update_problem_list_only(problem_id, new_list_name):
         cursor = conn.cursor()
         cursor.execute("UPDATE problems SET custom_list = ? WHERE id = ?", (new_list_name, problem_id))
         conn.commit()
+        invalidate_problems([problem_id])
+        invalidate_lists()
         return True
     except sqlite3.Error as e:
         print(f"Errore aggiornamento lista rapido: {e}")
@@ -230,13 +1167,13 @@ if __name__ == '__main__':
     # insert_new_problem(example_fen, ["Rg8#"], ["matto in 1"])
     
     print("\n--- Problemi pronti per la revisione ---")
-    ready_problems = get_problems_for_review()
+    ready_problems = get_problems_for_review(DEFAULT_USER_ID)
     
     if ready_problems:
         print(f"Trovati {len(ready_problems)} problemi pronti.")
         for p in ready_problems:
             # Stampa solo i campi chiave per la verifica
-            print(f"ID: {p['id']}, FEN: {p['fen'][:20]}..., Prossima Revisione: {p['next_review']}")
+            print(f"ID: {p['id']}, FEN: {p['fen'][:20]}..., Lista: {p['custom_list']}")
     else:
         print("Nessun problema pronto per la revisione.")
 
@@ -250,6 +1187,15 @@ Q_DIFFICULT = 3
 Q_MEDIUM = 4
 Q_EASY = 5
 
+# Feedback dell'utente -> punteggio di qualità (q)
+RATING_MAP = {
+    'Sbagliato': Q_WRONG,
+    'Difficile': Q_DIFFICULT,
+    'Medio': Q_MEDIUM,
+    'Facile': Q_EASY
+}
+
+@metrics.timed('calculate_sm2')
 def calculate_sm2(quality_rating: int, current_ease_factor: float, current_interval: int, review_count: int) -> tuple[int, float, int]:
     """
     Calcola il nuovo intervallo, il nuovo fattore di facilità e il nuovo conteggio
@@ -284,86 +1230,194 @@ def calculate_sm2(quality_rating: int, current_ease_factor: float, current_inter
 # NUOVA FUNZIONE PER L'AGGIORNAMENTO
 # ----------------------------------------------------------------------
 
-def update_problem_review(problem_id: int, user_rating_key: str) -> bool:
+# ----------------------------------------------------------------------
+# STORICO DELLE REVISIONI
+# Ogni valutazione aggiunge una riga a review_log e incrementa il riepilogo
+# giornaliero (review_rollup_daily) nella stessa transazione: le statistiche
+# leggono solo i riepiloghi, mai lo storico completo.
+# ----------------------------------------------------------------------
+
+LOG_REVIEW_SQL = """
+INSERT INTO review_log (
+    user_id, problem_id, reviewed_at, rating, quality,
+    prev_ease_factor, prev_interval_days, prev_review_count, prev_next_review,
+    new_ease_factor, new_interval_days, new_review_count, new_next_review,
+    time_to_answer_ms, custom_list
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+ROLLUP_SQL = """
+INSERT INTO review_rollup_daily (
+    user_id, day, custom_list, reviews, correct, n_wrong, n_difficult, n_medium, n_easy,
+    recall_reviews, recall_correct, timed_reviews, total_time_ms
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id, day, custom_list) DO UPDATE SET
+    reviews = reviews + excluded.reviews,
+    correct = correct + excluded.correct,
+    n_wrong = n_wrong + excluded.n_wrong,
+    n_difficult = n_difficult + excluded.n_difficult,
+    n_medium = n_medium + excluded.n_medium,
+    n_easy = n_easy + excluded.n_easy,
+    recall_reviews = recall_reviews + excluded.recall_reviews,
+    recall_correct = recall_correct + excluded.recall_correct,
+    timed_reviews = timed_reviews + excluded.timed_reviews,
+    total_time_ms = total_time_ms + excluded.total_time_ms
+"""
+
+# Stato SM-2 di un utente su un problema: la prima valutazione crea la riga.
+# list_name non cambia sul conflitto: lo tiene allineato il trigger su problems.custom_list
+SAVE_STATE_SQL = """
+INSERT INTO user_problem_state (
+    user_id, problem_id, list_name, last_reviewed, next_review, ease_factor, interval_days, review_count
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id, problem_id) DO UPDATE SET
+    last_reviewed = excluded.last_reviewed,
+    next_review = excluded.next_review,
+    ease_factor = excluded.ease_factor,
+    interval_days = excluded.interval_days,
+    review_count = excluded.review_count
+"""
+
+_RATING_COUNTER = {Q_WRONG: 'n_wrong', Q_DIFFICULT: 'n_difficult', Q_MEDIUM: 'n_medium', Q_EASY: 'n_easy'}
+_ROLLUP_FIELDS = ('reviews', 'correct', 'n_wrong', 'n_difficult', 'n_medium', 'n_easy',
+                  'recall_reviews', 'recall_correct', 'timed_reviews', 'total_time_ms')
+
+def _record_reviews(cursor, entries):
     """
-    Aggiorna i parametri SM-2 per un problema specifico dopo la revisione dell'utente.
+    Scrive nello storico un blocco di revisioni (dizionari con le colonne di review_log)
+    e aggiorna i riepiloghi giornalieri con un solo UPSERT per (utente, giorno, lista).
+    Non fa commit: viene chiamata dentro la transazione della valutazione.
+    """
+    cursor.executemany(LOG_REVIEW_SQL, [(
+        e['user_id'], e['problem_id'], e['reviewed_at'], e['rating'], e['quality'],
+        e['prev_ease_factor'], e['prev_interval_days'], e['prev_review_count'], e['prev_next_review'],
+        e['new_ease_factor'], e['new_interval_days'], e['new_review_count'], e['new_next_review'],
+        e.get('time_to_answer_ms'), e.get('custom_list'),
+    ) for e in entries])
+
+    rollups = {}
+    for e in entries:
+        day = datetime.fromtimestamp(e['reviewed_at']).strftime('%Y-%m-%d')
+        key = (e['user_id'], day, e.get('custom_list') or '')
+        counters = rollups.setdefault(key, dict.fromkeys(_ROLLUP_FIELDS, 0))
+        correct = e['quality'] >= 3
+        counters['reviews'] += 1
+        counters['correct'] += correct
+        counters[_RATING_COUNTER[e['quality']]] += 1
+        # "Ricordo": revisioni di problemi già imparati almeno una volta
+        if e['prev_review_count']:
+            counters['recall_reviews'] += 1
+            counters['recall_correct'] += correct
+        if e.get('time_to_answer_ms') is not None:
+            counters['timed_reviews'] += 1
+            counters['total_time_ms'] += int(e['time_to_answer_ms'])
 
+    cursor.executemany(ROLLUP_SQL, [
+        key + tuple(counters[field] for field in _ROLLUP_FIELDS)
+        for key, counters in rollups.items()
+    ])
+
+
+def _review_entry(user_id, problem_id, custom_list, current_data, user_rating_key, review_time, time_to_answer_ms=None):
+    """
+    Applica calculate_sm2 allo stato corrente (None = problema nuovo) per una valutazione
+    data all'istante `review_time` (datetime) e restituisce la riga di storico, con i
+    valori precedenti e quelli nuovi, pronta per _record_reviews e _state_params.
+    """
+    if current_data is None or current_data['ease_factor'] is None:
+        current_data = {'ease_factor': INITIAL_EASE_FACTOR, 'interval_days': INITIAL_INTERVAL,
+                        'review_count': INITIAL_REVIEW_COUNT, 'next_review': None}
+
+    # Mappiamo il feedback dell'utente al punteggio di qualità (q)
+    quality_rating = RATING_MAP.get(user_rating_key, Q_WRONG) # Usa 0 se la chiave non è valida
+
+    new_interval, new_ease_factor, new_review_count = calculate_sm2(
+        quality_rating,
+        current_data['ease_factor'],
+        current_data['interval_days'],
+        current_data['review_count']
+    )
+
+    # Se l'intervallo è 0 (Sbagliato) il problema resta subito pronto per la riproposta,
+    # altrimenti la prossima revisione è a `new_interval` giorni dalla valutazione
+    if new_interval == 0:
+        next_review_datetime = review_time
+    else:
+        next_review_datetime = review_time + timedelta(days=new_interval)
+
+    return {
+        'user_id': user_id,
+        'problem_id': problem_id,
+        'reviewed_at': review_time.timestamp(),
+        'rating': user_rating_key,
+        'quality': quality_rating,
+        'prev_ease_factor': current_data['ease_factor'],
+        'prev_interval_days': current_data['interval_days'],
+        'prev_review_count': current_data['review_count'],
+        'prev_next_review': current_data['next_review'],
+        'new_ease_factor': new_ease_factor,
+        'new_interval_days': new_interval,
+        'new_review_count': new_review_count,
+        'new_next_review': next_review_datetime.timestamp(),
+        'time_to_answer_ms': time_to_answer_ms,
+        'custom_list': custom_list,
+    }
+
+def _state_params(entry):
+    """Parametri di SAVE_STATE_SQL per lo stato che risulta da una riga di storico."""
+    return (
+        entry['user_id'],
+        entry['problem_id'],
+        entry['custom_list'] or '',
+        entry['reviewed_at'],       # last_reviewed
+        entry['new_next_review'],
+        entry['new_ease_factor'],
+        entry['new_interval_days'],
+        entry['new_review_count'],
+    )
+
+
+@metrics.timed('update_problem_review')
+def update_problem_review(user_id: int, problem_id: int, user_rating_key: str, time_to_answer_ms: int = None) -> bool:
+    """
+    Aggiorna i parametri SM-2 di un utente per un problema specifico dopo la revisione.
+
+    :param user_id: L'ID dell'utente che ha ripassato il problema.
     :param problem_id: L'ID del problema da aggiornare.
     :param user_rating_key: La valutazione dell'utente ('Sbagliato', 'Difficile', 'Medio', 'Facile').
+    :param time_to_answer_ms: Tempo impiegato per rispondere (opzionale, per le statistiche).
     :return: True se l'aggiornamento ha avuto successo, False altrimenti.
     """
     conn = create_connection()
     if conn is None:
         return False
-    
-    # Mappiamo il feedback dell'utente al punteggio di qualità (q)
-    RATING_MAP = {
-        'Sbagliato': Q_WRONG,
-        'Difficile': Q_DIFFICULT,
-        'Medio': Q_MEDIUM,
-        'Facile': Q_EASY
-    }
-    quality_rating = RATING_MAP.get(user_rating_key, Q_WRONG) # Usa 0 se la chiave non è valida
 
-    # 1. Recupera i dati correnti del problema dal DB
-    fetch_sql = "SELECT ease_factor, interval_days, review_count FROM problems WHERE id = ?"
+    # 1. Recupera il problema e lo stato corrente dell'utente (nessuna riga = problema nuovo)
+    fetch_sql = """
+    SELECT p.custom_list, s.ease_factor, s.interval_days, s.review_count, s.next_review
+    FROM problems p
+    LEFT JOIN user_problem_state s ON s.user_id = ? AND s.problem_id = p.id
+    WHERE p.id = ?
+    """
     
     try:
         cursor = conn.cursor()
-        cursor.execute(fetch_sql, (problem_id,))
+        cursor.execute(fetch_sql, (user_id, problem_id))
         row = cursor.fetchone()
         
         if not row:
             print(f"Errore: Problema con ID {problem_id} non trovato.")
             return False
             
-        current_data = dict(row)
-        
-        # 2. Calcola i nuovi parametri SM-2
-        new_interval, new_ease_factor, new_review_count = calculate_sm2(
-            quality_rating,
-            current_data['ease_factor'],
-            current_data['interval_days'],
-            current_data['review_count']
-        )
-        
-        # 3. Calcola la prossima data di revisione (next_review)
-        # Convertiamo l'intervallo in secondi e lo aggiungiamo al tempo corrente
-        current_time = datetime.now()
-        # Se l'intervallo è 0 (Sbagliato), lo impostiamo al giorno successivo per riproporre
-        # il problema velocemente, o manteniamo l'intervallo calcolato.
-        
-        if new_interval == 0:
-             # Ri-proponi il problema il giorno stesso o il giorno dopo (qui lo teniamo subito pronto)
-             next_review_datetime = current_time 
-        else:
-             next_review_datetime = current_time + timedelta(days=new_interval)
-             
-        # Convertiamo la prossima data di revisione in timestamp Unix
-        next_review_timestamp = next_review_datetime.timestamp()
-        
-        # 4. Aggiorna il DB
-        update_sql = """
-        UPDATE problems 
-        SET 
-            last_reviewed = ?, 
-            next_review = ?, 
-            ease_factor = ?, 
-            interval_days = ?, 
-            review_count = ?
-        WHERE id = ?
-        """
-        
-        update_params = (
-            current_time.timestamp(),  # last_reviewed (ora)
-            next_review_timestamp,     # next_review (la data calcolata)
-            new_ease_factor,
-            new_interval,
-            new_review_count,
-            problem_id
-        )
-        
-        cursor.execute(update_sql, update_params)
+        # 2. Calcola i nuovi parametri SM-2 e la prossima revisione (a partire da adesso)
+        entry = _review_entry(user_id, problem_id, row['custom_list'], dict(row), user_rating_key,
+                              datetime.now(), time_to_answer_ms)
+
+        # 3. Aggiorna (o crea) lo stato dell'utente
+        cursor.execute(SAVE_STATE_SQL, _state_params(entry))
+
+        # 4. Storico + riepilogo giornaliero, nella stessa transazione
+        _record_reviews(cursor, [entry])
         conn.commit()
         return True
         
@@ -374,6 +1428,155 @@ def update_problem_review(problem_id: int, user_rating_key: str) -> bool:
         conn.close()
 
 
+# ----------------------------------------------------------------------
+# VALUTAZIONI IN BLOCCO (SESSIONI OFFLINE)
+# La pagina di revisione può scaricare un blocco di problemi, risolverli
+# senza rete e inviare poi tutte le valutazioni insieme. Ognuna viene
+# applicata con il proprio istante originale, in ordine cronologico, e
+# l'intero blocco è salvato in un'unica transazione. Reinviare lo stesso
+# blocco non cambia nulla: una valutazione già nello storico (stesso
+# utente, problema e reviewed_at) viene riconosciuta e saltata.
+# ----------------------------------------------------------------------
+
+MAX_BATCH_REVIEWS = 500
+MAX_CLOCK_SKEW = 300  # secondi: valutazioni "dal futuro" oltre questo margine sono scartate
+
+BATCH_APPLIED = 'applied'       # Valutazione salvata
+BATCH_DUPLICATE = 'duplicate'   # Già salvata da un invio precedente
+BATCH_CONFLICT = 'conflict'     # Il problema ha già una revisione più recente (es. da un altro dispositivo)
+BATCH_INVALID = 'invalid'       # Valutazione o istante non validi
+BATCH_NOT_FOUND = 'not_found'   # Problema eliminato nel frattempo
+
+def apply_review_batch(user_id, reviews):
+    """
+    Applica un blocco di valutazioni [{'problem_id', 'rating', 'reviewed_at' (timestamp Unix),
+    'time_ms' (opzionale)}, ...] in un'unica transazione.
+    Restituisce una lista di stati (BATCH_*) nello stesso ordine dell'input,
+    oppure None se il DB non è disponibile (in tal caso non viene salvato nulla).
+    """
+    statuses = [None] * len(reviews)
+    if len(reviews) > MAX_BATCH_REVIEWS:
+        raise ValueError(f"Al massimo {MAX_BATCH_REVIEWS} valutazioni per blocco.")
+
+    now = datetime.now().timestamp()
+    valid = []
+    for index, review in enumerate(reviews):
+        reviewed_at = review.get('reviewed_at')
+        if (review.get('rating') not in RATING_MAP or not isinstance(review.get('problem_id'), int)
+                or not isinstance(reviewed_at, (int, float)) or not 0 < reviewed_at <= now + MAX_CLOCK_SKEW):
+            statuses[index] = BATCH_INVALID
+        else:
+            valid.append(index)
+    if not valid:
+        return statuses
+
+    conn = create_connection()
+    if conn is None:
+        return None
+
+    problem_ids = sorted({reviews[i]['problem_id'] for i in valid})
+    placeholders = ','.join('?' * len(problem_ids))
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT p.id, p.custom_list, s.ease_factor, s.interval_days, s.review_count,
+                   s.next_review, s.last_reviewed
+            FROM problems p
+            LEFT JOIN user_problem_state s ON s.user_id = ? AND s.problem_id = p.id
+            WHERE p.id IN ({placeholders})
+        """, (user_id, *problem_ids))
+        current = {row['id']: dict(row) for row in cursor.fetchall()}
+
+        # Valutazioni già nello storico (idx_review_log_problem: problem_id, reviewed_at)
+        earliest = min(float(reviews[i]['reviewed_at']) for i in valid)
+        cursor.execute(f"""
+            SELECT problem_id, reviewed_at FROM review_log
+            WHERE problem_id IN ({placeholders}) AND reviewed_at >= ? AND user_id = ?
+        """, (*problem_ids, earliest, user_id))
+        logged = {(row['problem_id'], row['reviewed_at']) for row in cursor.fetchall()}
+
+        # In ordine cronologico: due valutazioni dello stesso problema si concatenano
+        entries = []
+        for index in sorted(valid, key=lambda i: (float(reviews[i]['reviewed_at']), i)):
+            review = reviews[index]
+            problem_id = review['problem_id']
+            reviewed_at = float(review['reviewed_at'])
+            state = current.get(problem_id)
+            if state is None:
+                statuses[index] = BATCH_NOT_FOUND
+            elif (problem_id, reviewed_at) in logged:
+                statuses[index] = BATCH_DUPLICATE
+            elif state['last_reviewed'] is not None and reviewed_at <= state['last_reviewed']:
+                statuses[index] = BATCH_CONFLICT
+            else:
+                time_ms = review.get('time_ms')
+                time_ms = int(time_ms) if isinstance(time_ms, (int, float)) and time_ms >= 0 else None
+                entry = _review_entry(user_id, problem_id, state['custom_list'], state, review['rating'],
+                                      datetime.fromtimestamp(reviewed_at), time_ms)
+                entries.append(entry)
+                logged.add((problem_id, reviewed_at))
+                # Lo stato aggiornato è il punto di partenza della valutazione successiva
+                state.update(ease_factor=entry['new_ease_factor'], interval_days=entry['new_interval_days'],
+                             review_count=entry['new_review_count'], next_review=entry['new_next_review'],
+                             last_reviewed=reviewed_at)
+                statuses[index] = BATCH_APPLIED
+
+        if entries:
+            # Una sola scrittura dello stato per problema: quello finale
+            final = {entry['problem_id']: entry for entry in entries}
+            cursor.executemany(SAVE_STATE_SQL, [_state_params(entry) for entry in final.values()])
+            _record_reviews(cursor, entries)
+            conn.commit()
+        return statuses
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Errore durante il salvataggio delle valutazioni: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def get_review_stats(user_id, days=30):
+    """
+    Statistiche dell'utente negli ultimi `days` giorni lette solo dai riepiloghi
+    giornalieri: andamento per giorno e precisione/ritenzione per lista.
+    """
+    stats = {'days': [], 'lists': []}
+    conn = create_connection()
+    if conn is None:
+        return stats
+
+    since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    totals = """
+        SUM(reviews) AS reviews,
+        SUM(correct) AS correct,
+        SUM(n_wrong) AS n_wrong, SUM(n_difficult) AS n_difficult,
+        SUM(n_medium) AS n_medium, SUM(n_easy) AS n_easy,
+        SUM(recall_reviews) AS recall_reviews, SUM(recall_correct) AS recall_correct,
+        SUM(timed_reviews) AS timed_reviews, SUM(total_time_ms) AS total_time_ms
+    """
+
+    def with_ratios(row):
+        r = dict(row)
+        r['accuracy'] = r['correct'] / r['reviews'] if r['reviews'] else None
+        r['retention'] = r['recall_correct'] / r['recall_reviews'] if r['recall_reviews'] else None
+        r['avg_time_ms'] = r['total_time_ms'] / r['timed_reviews'] if r['timed_reviews'] else None
+        return r
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT day, {totals} FROM review_rollup_daily WHERE user_id = ? AND day >= ? GROUP BY day ORDER BY day", (user_id, since))
+        stats['days'] = [with_ratios(row) for row in cursor.fetchall()]
+        cursor.execute(f"SELECT custom_list, {totals} FROM review_rollup_daily WHERE user_id = ? AND day >= ? GROUP BY custom_list ORDER BY custom_list", (user_id, since))
+        stats['lists'] = [with_ratios(row) for row in cursor.fetchall()]
+        return stats
+    except sqlite3.Error as e:
+        print(f"Errore nel recupero delle statistiche: {e}")
+        return stats
+    finally:
+        conn.close()
+
+
 def get_all_problems():
     """
     Recupera TUTTI i problemi dal database per l'elenco riepilogativo.
@@ -404,6 +1607,178 @@ def get_all_problems():
         conn.close()
 
 
+# ----------------------------------------------------------------------
+# ELENCO PAGINATO (keyset sull'id, niente OFFSET)
+# ----------------------------------------------------------------------
+
+PAGE_SIZE = 50
+
+# Stato SM-2 dell'utente accanto a ogni problema dell'elenco: i problemi che non ha
+# mai valutato (nessuna riga in user_problem_state) mostrano i valori iniziali
+USER_STATE_JOIN = "LEFT JOIN user_problem_state s ON s.user_id = ? AND s.problem_id = p.id"
+USER_STATE_COLUMNS = f"""
+    s.last_reviewed, s.next_review,
+    COALESCE(s.ease_factor, {INITIAL_EASE_FACTOR}) AS ease_factor,
+    COALESCE(s.interval_days, {INITIAL_INTERVAL}) AS interval_days,
+    COALESCE(s.review_count, {INITIAL_REVIEW_COUNT}) AS review_count
+"""
+
+def _problems_filter(custom_list=None, tag=None):
+    """
+    Clausole WHERE (lista di stringhe) e parametri per i filtri dell'elenco.
+    Le colonne sono qualificate con l'alias p: la tabella problems va letta come "problems p".
+    """
+    clauses = []
+    params = []
+    if custom_list:
+        clauses.append("p.custom_list = ?")
+        params.append(custom_list)
+    if tag:
+        tags_sql, tags_params = _tags_clause([tag], "p.id")
+        clauses.append(tags_sql)
+        params += tags_params
+    return clauses, params
+
+def get_problems_page(user_id, before_id=None, limit=PAGE_SIZE, custom_list=None, tag=None):
+    """
+    Restituisce una pagina di problemi (dal più recente, con lo stato SM-2 dell'utente)
+    e il cursore per la pagina successiva: (problemi, next_cursor). next_cursor è None
+    se non ci sono altre pagine.
+    Il cursore è l'id dell'ultima riga: la pagina successiva parte da "id < cursore",
+    quindi il costo non cresce con il numero di pagine già lette.
+    """
+    conn = create_connection()
+    if conn is None:
+        return [], None
+
+    clauses, params = _problems_filter(custom_list, tag)
+    if before_id is not None:
+        clauses.append("p.id < ?")
+        params.append(before_id)
+
+    sql = f"SELECT p.*, {USER_STATE_COLUMNS} FROM problems p {USER_STATE_JOIN}"
+    params = [user_id] + params
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    # Una riga in più per sapere se esiste una pagina successiva
+    sql += " ORDER BY p.id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+        problems = []
+        for row in rows[:limit]:
+            p = dict(row)
+            # I tag vengono mostrati nell'elenco, la soluzione no
+            p['tags'] = metrics.json_loads(p['tags']) if p['tags'] else []
+            problems.append(p)
+
+        next_cursor = problems[-1]['id'] if len(rows) > limit else None
+        return problems, next_cursor
+    except sqlite3.Error as e:
+        print(f"Errore nel recupero della pagina di problemi: {e}")
+        return [], None
+    finally:
+        conn.close()
+
+def count_problems(custom_list=None, tag=None):
+    """Numero totale di problemi che rispettano i filtri dell'elenco."""
+    conn = create_connection()
+    if conn is None:
+        return 0
+
+    clauses, params = _problems_filter(custom_list, tag)
+    sql = "SELECT COUNT(*) FROM problems p"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"Errore nel conteggio dei problemi: {e}")
+        return 0
+    finally:
+        conn.close()
+
+# ----------------------------------------------------------------------
+# RICERCA FULL-TEXT (FTS5 su giocatori, torneo, tag e lista)
+# ----------------------------------------------------------------------
+
+SEARCH_DUE_FILTERS = ('now', 'today', 'week')
+
+def _fts_query(text):
+    """
+    Trasforma il testo libero in una query FTS5 sicura: ogni parola diventa
+    un prefisso tra virgolette ("capa" trova "Capablanca"), tutte obbligatorie.
+    """
+    words = re.findall(r'\w+', text or '')
+    return ' '.join(f'"{word}"*' for word in words)
+
+def search_problems(user_id, text=None, year_from=None, year_to=None, due=None, custom_list=None,
+                    page=0, limit=PAGE_SIZE):
+    """
+    Cerca i problemi per testo (ordinati per rilevanza bm25), anno della partita
+    e stato di scadenza per l'utente ('now', 'today', 'week'; i nuovi sono sempre
+    in scadenza). Senza testo restituisce i più recenti.
+    Restituisce (problemi, c'è_una_pagina_successiva).
+    """
+    conn = create_connection()
+    if conn is None:
+        return [], False
+
+    match = _fts_query(text)
+    clauses = []
+    params = [user_id]
+    if match:
+        sql = f"""SELECT p.*, {USER_STATE_COLUMNS}
+                  FROM problems_fts JOIN problems p ON p.id = problems_fts.rowid {USER_STATE_JOIN}"""
+        clauses.append("problems_fts MATCH ?")
+        params.append(match)
+    else:
+        sql = f"SELECT p.*, {USER_STATE_COLUMNS} FROM problems p {USER_STATE_JOIN}"
+
+    if year_from is not None:
+        clauses.append("p.game_year >= ?")
+        params.append(year_from)
+    if year_to is not None:
+        clauses.append("p.game_year <= ?")
+        params.append(year_to)
+    if custom_list:
+        clauses.append("p.custom_list = ?")
+        params.append(custom_list)
+    if due in SEARCH_DUE_FILTERS:
+        now_ts, today_ts, week_ts = _due_boundaries()
+        clauses.append("(s.next_review IS NULL OR s.next_review <= ?)")
+        params.append({'now': now_ts, 'today': today_ts, 'week': week_ts}[due])
+
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY problems_fts.rank, p.id DESC" if match else " ORDER BY p.id DESC"
+    # Una riga in più per sapere se esiste una pagina successiva
+    sql += " LIMIT ? OFFSET ?"
+    params += [limit + 1, page * limit]
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        problems = []
+        for row in rows[:limit]:
+            p = dict(row)
+            p['tags'] = metrics.json_loads(p['tags']) if p['tags'] else []
+            problems.append(p)
+        return problems, len(rows) > limit
+    except sqlite3.Error as e:
+        print(f"Errore durante la ricerca: {e}")
+        return [], False
+    finally:
+        conn.close()
+
 # --- Esempio di Utilizzo della Funzione ---
 
 if __name__ == '__main__':
@@ -413,19 +1788,19 @@ if __name__ == '__main__':
     print(f"\n--- Aggiornamento Problema ID {test_id} ---")
     
     # Simula la prima revisione: Utente risponde 'Medio'
-    success = update_problem_review(test_id, 'Medio')
+    success = update_problem_review(DEFAULT_USER_ID, test_id, 'Medio')
     
     if success:
         print("Aggiornamento 1 (Medio) riuscito.")
         # Simula la seconda revisione (dopo 1 giorno): Utente risponde 'Facile'
         # Nota: L'intervallo calcolato sarà basato sul nuovo 'ease_factor'
-        success_2 = update_problem_review(test_id, 'Facile')
+        success_2 = update_problem_review(DEFAULT_USER_ID, test_id, 'Facile')
         if success_2:
             print("Aggiornamento 2 (Facile) riuscito.")
             print("Controlla il DB per i valori aggiornati (next_review, ease_factor).")
         
         # Simula una revisione fallita: Utente risponde 'Sbagliato'
-        success_fail = update_problem_review(test_id, 'Sbagliato')
+        success_fail = update_problem_review(DEFAULT_USER_ID, test_id, 'Sbagliato')
         if success_fail:
             print("Aggiornamento 3 (Sbagliato) riuscito. Il problema è pronto per la riproposta immediata.")
 
@@ -1,6 +1,8 @@
 import sqlite3
 import json
 
+import update_db_schema
+
 # Definiamo il nome del file del database
 DB_NAME = 'chess_tutor.db'
 
@@ -18,25 +20,13 @@ def create_connection():
         return None
 
 def setup_database(conn):
-    """Crea la tabella 'problems' se non esiste."""
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS problems (
-        id INTEGER PRIMARY KEY,
-        fen TEXT NOT NULL,
-        solution_moves TEXT,
-        tags TEXT,
-        last_reviewed REAL,
-        next_review REAL NOT NULL,
-        ease_factor REAL NOT NULL,
-        interval_days INTEGER NOT NULL,
-        review_count INTEGER NOT NULL
-    );
+    """
+    Porta lo schema all'ultima versione applicando le migrazioni mancanti
+    (vedi update_db_schema.MIGRATIONS). Se lo schema è già aggiornato non fa nulla.
     """
     try:
-        cursor = conn.cursor()
-        cursor.execute(create_table_sql)
-        conn.commit()
-        print("Tabella 'problems' creata o già esistente.")
+        version = update_db_schema.migrate(conn)
+        print(f"Schema del database alla versione {version}.")
     except sqlite3.Error as e:
         print(f"Errore durante la creazione della tabella: {e}")
 
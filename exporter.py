@@ -0,0 +1,205 @@
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+import zlib
+
+import db_manager
+import metrics
+
+# ----------------------------------------------------------------------
+# ESPORTAZIONE IN STREAMING DELLA BANCA PROBLEMI (NDJSON / CSV / PGN)
+# Le righe vengono lette dal cursore a blocchi (fetchmany) e trasformate in
+# testo una alla volta: né il DB né il file finale stanno mai interi in memoria.
+# ----------------------------------------------------------------------
+
+FETCH_SIZE = 1000
+FORMATS = ('ndjson', 'csv', 'pgn')
+
+MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'pgn': 'application/x-chess-pgn',
+}
+
+# Colonne esportate (stesso ordine nel CSV); i nomi sono compatibili con importer.CSV_COLUMNS
+PROBLEM_COLUMNS = [
+    'id', 'fen', 'solution_moves', 'tags',
+    'white_player', 'black_player', 'game_year', 'tournament', 'winner', 'custom_list',
+]
+# Stato SM-2 dell'utente che esporta (db_manager.USER_STATE_COLUMNS, stesso ordine)
+STATE_COLUMNS = ['last_reviewed', 'next_review', 'ease_factor', 'interval_days', 'review_count']
+EXPORT_COLUMNS = PROBLEM_COLUMNS + STATE_COLUMNS
+
+
+def iter_problems(user_id, custom_list=None, fetch_size=FETCH_SIZE):
+    """
+    Genera i problemi (dizionari decodificati, con lo stato SM-2 dell'utente)
+    in ordine di id, leggendo il cursore a blocchi di `fetch_size` righe.
+    """
+    conn = db_manager.create_connection()
+    if conn is None:
+        return
+
+    sql = (f"SELECT {', '.join('p.' + c for c in PROBLEM_COLUMNS)}, {db_manager.USER_STATE_COLUMNS}"
+           f" FROM problems p {db_manager.USER_STATE_JOIN}")
+    params = [user_id]
+    if custom_list:
+        sql += " WHERE p.custom_list = ?"
+        params.append(custom_list)
+    sql += " ORDER BY p.id"
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                p = dict(row)
+                p['solution_moves'] = metrics.json_loads(p['solution_moves']) if p['solution_moves'] else []
+                p['tags'] = metrics.json_loads(p['tags']) if p['tags'] else []
+                yield p
+    except sqlite3.Error as e:
+        print(f"Errore durante l'esportazione: {e}")
+    finally:
+        conn.close()
+
+
+# --- NDJSON ---
+
+def iter_ndjson(problems):
+    for p in problems:
+        yield json.dumps(p, ensure_ascii=False) + '\n'
+
+
+# --- CSV ---
+
+def iter_csv(problems):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return chunk
+
+    writer.writerow(EXPORT_COLUMNS)
+    yield take()
+    for p in problems:
+        row = dict(p)
+        # Mosse separate da spazi, tag da virgole (un tag può contenere spazi)
+        row['solution_moves'] = ' '.join(p['solution_moves'])
+        row['tags'] = ', '.join(p['tags'])
+        writer.writerow([row[column] for column in EXPORT_COLUMNS])
+        yield take()
+
+
+# --- PGN ---
+
+def _pgn_escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _pgn_result(winner):
+    return {0: '1-0', 1: '0-1'}.get(winner, '*')
+
+
+def _pgn_movetext(fen, moves):
+    """Numera le mosse partendo dal lato e dal numero di mossa indicati nel FEN."""
+    fields = fen.split()
+    black_to_move = len(fields) > 1 and fields[1] == 'b'
+    move_number = int(fields[5]) if len(fields) > 5 and fields[5].isascii() and fields[5].isdigit() else 1
+
+    tokens = []
+    for i, move in enumerate(moves):
+        if not black_to_move:
+            tokens.append(f"{move_number}.")
+        elif i == 0:
+            tokens.append(f"{move_number}...")
+        tokens.append(move)
+        if black_to_move:
+            move_number += 1
+        black_to_move = not black_to_move
+    return ' '.join(tokens)
+
+
+def iter_pgn(problems):
+    for p in problems:
+        result = _pgn_result(p['winner'])
+        headers = [
+            ('Event', p['tournament'] or '?'),
+            ('Date', f"{p['game_year']}.??.??" if p['game_year'] else '????.??.??'),
+            ('White', p['white_player'] or '?'),
+            ('Black', p['black_player'] or '?'),
+            ('Result', result),
+            ('SetUp', '1'),
+            ('FEN', p['fen']),
+        ]
+        if p['tags']:
+            headers.append(('Tags', ', '.join(p['tags'])))
+        if p['custom_list']:
+            headers.append(('List', p['custom_list']))
+
+        lines = [f'[{name} "{_pgn_escape(value)}"]' for name, value in headers]
+        movetext = _pgn_movetext(p['fen'], p['solution_moves'])
+        yield '\n'.join(lines) + '\n\n' + f"{movetext} {result}".strip() + '\n\n'
+
+
+WRITERS = {'ndjson': iter_ndjson, 'csv': iter_csv, 'pgn': iter_pgn}
+
+
+def gzip_chunks(chunks, level=6):
+    """Comprime al volo (formato gzip) un flusso di blocchi di bytes."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(fmt, user_id, custom_list=None, compress=False):
+    """Generatore dei bytes dell'esportazione nel formato richiesto (eventualmente gzip)."""
+    chunks = (text.encode('utf-8') for text in WRITERS[fmt](iter_problems(user_id, custom_list)))
+    if compress:
+        return gzip_chunks(chunks)
+    return chunks
+
+
+def export_filename(fmt, custom_list=None, compress=False, ascii_only=True):
+    """
+    Nome del file scaricato. Gli header HTTP si codificano in latin-1, quindi
+    per filename= si tengono solo caratteri ASCII; con ascii_only=False si
+    ottiene il nome completo da mettere in filename*= (RFC 5987).
+    """
+    name = 'chess_tutor'
+    if custom_list:
+        name += '_' + ''.join(c if c.isalnum() and (c.isascii() or not ascii_only) else '_'
+                              for c in custom_list)
+    name += '.' + fmt
+    return name + '.gz' if compress else name
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Esporta la banca problemi in NDJSON, CSV o PGN.")
+    parser.add_argument('format', choices=FORMATS)
+    parser.add_argument('-o', '--output', help="File di destinazione (default: stdout). Se finisce in .gz viene compresso.")
+    parser.add_argument('--list', dest='custom_list', help="Esporta solo questa lista")
+    parser.add_argument('--gzip', action='store_true', help="Comprimi con gzip")
+    parser.add_argument('--user', type=int, default=db_manager.DEFAULT_USER_ID,
+                        help="ID dell'utente di cui esportare lo stato SM-2 (default: %(default)s)")
+    args = parser.parse_args()
+
+    compress = args.gzip or bool(args.output and args.output.endswith('.gz'))
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_chunks(args.format, args.user, args.custom_list, compress):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
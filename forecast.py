@@ -0,0 +1,166 @@
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+import db_manager
+import scheduler
+
+# ----------------------------------------------------------------------
+# PREVISIONE DEL CARICO DI REVISIONI (MONTE CARLO SULLO SCHEDULE SM-2)
+# Tutti i problemi di tutte le simulazioni stanno in un unico array piatto
+# (trial * N): ogni giorno si prendono i problemi in scadenza, si estrae una
+# valutazione casuale e si applica scheduler.sm2_batch a tutti insieme.
+# ----------------------------------------------------------------------
+
+# Distribuzione di default delle valutazioni: Sbagliato, Difficile, Medio, Facile
+DEFAULT_RATING_PROBS = (0.10, 0.20, 0.40, 0.30)
+QUALITIES = np.array([db_manager.Q_WRONG, db_manager.Q_DIFFICULT, db_manager.Q_MEDIUM, db_manager.Q_EASY])
+
+MAX_DAYS = 365
+MAX_TRIALS = 200
+
+
+def _initial_due_days(next_review, today_start):
+    """Giorno (da oggi = 0) in cui ogni problema sarà in scadenza; gli arretrati contano oggi."""
+    days = np.floor((next_review - today_start) / scheduler.SECONDS_PER_DAY)
+    return np.maximum(days, 0).astype(np.int32)
+
+
+def simulate(state, days=90, new_per_week=0, trials=20, rating_probs=DEFAULT_RATING_PROBS, seed=None,
+             unstarted=0):
+    """
+    Simula `trials` futuri possibili per `days` giorni a partire dallo stato SM-2
+    (dizionario di array come scheduler.load_state), più `unstarted` problemi mai
+    ripassati (pronti da oggi), aggiungendo `new_per_week` problemi nuovi a
+    settimana. Restituisce un array (trials, days) con il numero di revisioni di
+    ogni giorno.
+
+    Un problema sbagliato torna il giorno dopo (nell'app torna subito in coda,
+    ma conta comunque come una revisione in più nella stessa sessione).
+    """
+    rng = np.random.default_rng(seed)
+    probs = np.asarray(rating_probs, dtype=np.float64)
+    probs = probs / probs.sum()
+
+    today_start = datetime.combine(datetime.now().date(), datetime.min.time()).timestamp()
+    existing_due = _initial_due_days(state['next_review'], today_start)
+
+    # I problemi mai ripassati sono tutti pronti oggi; i nuovi entrano a ritmo
+    # costante (new_per_week / 7 al giorno). Entrambi partono dallo stato iniziale.
+    new_total = int(new_per_week * days / 7)
+    new_due = (np.arange(new_total) * 7 // new_per_week).astype(np.int32) if new_total else np.empty(0, np.int32)
+    new_due = np.concatenate([np.zeros(unstarted, np.int32), new_due])
+    new_total += unstarted
+
+    n = len(existing_due) + new_total
+    due_day = np.tile(np.concatenate([existing_due, new_due]), trials)
+    ease = np.tile(np.concatenate([state['ease_factor'], np.full(new_total, db_manager.INITIAL_EASE_FACTOR)]), trials)
+    interval = np.tile(np.concatenate([state['interval_days'],
+                                       np.full(new_total, db_manager.INITIAL_INTERVAL)]).astype(np.int32), trials)
+    count = np.tile(np.concatenate([state['review_count'],
+                                    np.full(new_total, db_manager.INITIAL_REVIEW_COUNT)]).astype(np.int32), trials)
+
+    reviews = np.zeros((trials, days), dtype=np.int64)
+    for day in range(days):
+        due = np.flatnonzero(due_day == day)
+        if len(due) == 0:
+            continue
+        reviews[:, day] = np.bincount(due // n, minlength=trials) if n else 0
+
+        quality = rng.choice(QUALITIES, size=len(due), p=probs)
+        new_interval, new_ease, new_count = scheduler.sm2_batch(quality, ease[due], interval[due], count[due])
+        ease[due] = new_ease
+        interval[due] = new_interval
+        count[due] = new_count
+        due_day[due] = day + np.maximum(new_interval, 1)
+
+    return reviews
+
+
+def summarize(reviews):
+    """Media e percentili (10/50/90) giorno per giorno, più i totali."""
+    return {
+        'days': reviews.shape[1],
+        'trials': reviews.shape[0],
+        'mean': np.round(reviews.mean(axis=0), 1).tolist(),
+        'p10': np.percentile(reviews, 10, axis=0).tolist(),
+        'p50': np.percentile(reviews, 50, axis=0).tolist(),
+        'p90': np.percentile(reviews, 90, axis=0).tolist(),
+        'peak_mean': float(reviews.mean(axis=0).max()) if reviews.size else 0.0,
+        'total_mean': float(reviews.sum(axis=1).mean()) if reviews.size else 0.0,
+    }
+
+
+def forecast(user_id, custom_list=None, days=90, new_per_week=0, trials=20,
+             rating_probs=DEFAULT_RATING_PROBS, seed=None):
+    """
+    Carica dal DB lo stato dell'utente, simula e restituisce il riepilogo
+    (dizionario serializzabile in JSON).
+    """
+    days = max(1, min(int(days), MAX_DAYS))
+    trials = max(1, min(int(trials), MAX_TRIALS))
+
+    conn = db_manager.create_connection()
+    if conn is None:
+        return None
+    try:
+        state = scheduler.load_state(conn, user_id, custom_list)
+    finally:
+        conn.close()
+    unstarted = db_manager.get_due_counts(user_id, custom_list)['new']
+
+    start = time.perf_counter()
+    reviews = simulate(state, days, new_per_week, trials, rating_probs, seed, unstarted)
+    result = summarize(reviews)
+    result['problems'] = int(len(state['id'])) + unstarted
+    result['unstarted'] = unstarted
+    result['new_per_week'] = new_per_week
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def parse_rating_probs(text):
+    """'0.1,0.2,0.4,0.3' -> tupla di 4 probabilità (Sbagliato, Difficile, Medio, Facile)."""
+    values = tuple(float(v) for v in text.split(','))
+    if len(values) != 4 or any(v < 0 for v in values) or sum(values) <= 0:
+        raise ValueError("Servono 4 probabilità non negative: Sbagliato,Difficile,Medio,Facile")
+    return values
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prevede quante revisioni ci saranno ogni giorno.")
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--new-per-week', type=int, default=0)
+    parser.add_argument('--trials', type=int, default=20)
+    parser.add_argument('--ratings', default=','.join(str(p) for p in DEFAULT_RATING_PROBS),
+                        help="Probabilità Sbagliato,Difficile,Medio,Facile (default: %(default)s)")
+    parser.add_argument('--list', dest='custom_list')
+    parser.add_argument('--user', type=int, default=db_manager.DEFAULT_USER_ID,
+                        help="ID dell'utente (default: %(default)s)")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true', help="Stampa il risultato in JSON")
+    args = parser.parse_args()
+
+    try:
+        probs = parse_rating_probs(args.ratings)
+    except ValueError as e:
+        parser.error(str(e))
+
+    result = forecast(args.user, args.custom_list, args.days, args.new_per_week, args.trials, probs, args.seed)
+    if result is None:
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"{result['problems']} problemi, +{args.new_per_week}/settimana, "
+              f"{result['trials']} simulazioni in {result['seconds']}s")
+        print("Giorno   Media     P10     P90")
+        for day in range(result['days']):
+            print(f"{day:6d} {result['mean'][day]:7.1f} {result['p10'][day]:7.0f} {result['p90'][day]:7.0f}")
+        print(f"Picco medio: {result['peak_mean']:.0f} revisioni/giorno, "
+              f"totale medio: {result['total_mean']:.0f}")
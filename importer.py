@@ -0,0 +1,374 @@
+import argparse
+import csv
+import gzip
+import io
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import db_manager
+import movegen
+
+# ----------------------------------------------------------------------
+# IMPORTAZIONE IN BLOCCO DI RACCOLTE DI PROBLEMI (PGN / EPD / CSV)
+# I file vengono letti riga per riga con generatori e inseriti a blocchi di
+# BATCH_SIZE con executemany (una transazione per blocco): la memoria usata
+# non dipende dalla dimensione del file. Prima dell'inserimento ogni blocco
+# passa dal generatore di mosse (movegen.py), diviso tra i processi di un
+# pool: le soluzioni illegali vengono scartate.
+# ----------------------------------------------------------------------
+
+BATCH_SIZE = 5000
+FORMATS = ('pgn', 'epd', 'csv')
+MAX_INVALID_EXAMPLES = 20   # Soluzioni non valide riportate nelle statistiche
+
+
+def _winner_from_result(result):
+    """Converte il risultato PGN nella convenzione del DB (0 = Bianco, 1 = Nero)."""
+    if result == '1-0':
+        return 0
+    if result == '0-1':
+        return 1
+    return None
+
+
+def _year_from_date(value):
+    """Estrae l'anno da '1927.??.??', '1927' ecc."""
+    match = re.match(r'\s*(\d{4})', value or '')
+    return int(match.group(1)) if match else None
+
+
+def _split_list(value, separator=','):
+    """Divide un campo sul separatore indicato (None = spazi)."""
+    if not value:
+        return []
+    return [item.strip() for item in value.split(separator) if item.strip()]
+
+
+def _split_moves(value):
+    """Le mosse possono essere separate da virgole (come nei form) o da spazi."""
+    return _split_list(value, ',' if value and ',' in value else None)
+
+
+def _split_tags(row, tags_field, themes_field):
+    """I tag sono separati da virgole (possono contenere spazi: "matto in 1"), i temi da spazi."""
+    if row.get(tags_field):
+        return _split_list(row[tags_field])
+    return _split_list(row.get(themes_field), None)
+
+
+# --- PGN ---
+
+_PGN_HEADER = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+_PGN_COMMENT = re.compile(r'\{[^}]*\}|;[^\n]*')
+_PGN_NAG = re.compile(r'\$\d+')
+_PGN_MOVE_NUMBER = re.compile(r'^\d+\.(\.\.)?')
+_PGN_RESULTS = {'1-0', '0-1', '1/2-1/2', '*'}
+
+
+def _strip_variations(text):
+    """Rimuove le varianti (anche annidate) tra parentesi tonde."""
+    depth = 0
+    out = []
+    for char in text:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth = max(0, depth - 1)
+        elif depth == 0:
+            out.append(char)
+    return ''.join(out)
+
+
+def _san_moves(movetext):
+    """Estrae le mosse SAN della linea principale dal testo delle mosse PGN."""
+    text = _strip_variations(_PGN_COMMENT.sub(' ', movetext))
+    text = _PGN_NAG.sub(' ', text)
+    moves = []
+    for token in text.split():
+        token = _PGN_MOVE_NUMBER.sub('', token)
+        if token and token not in _PGN_RESULTS:
+            moves.append(token)
+    return moves
+
+
+def _pgn_value(value):
+    """Valore di un'intestazione PGN: toglie gli escape; '?' significa sconosciuto."""
+    value = value.replace('\\"', '"').replace('\\\\', '\\').strip()
+    return None if value in ('', '?') else value
+
+
+def _pgn_record(headers, movetext_lines):
+    """Trasforma una partita PGN in un problema. None se manca la posizione iniziale."""
+    fen = headers.get('FEN')
+    if not fen:
+        return None
+    return {
+        'fen': fen,
+        'solution_moves': _san_moves('\n'.join(movetext_lines)),
+        'tags': _split_tags(headers, 'Tags', 'Themes'),
+        'white_player': headers.get('White'),
+        'black_player': headers.get('Black'),
+        'game_year': _year_from_date(headers.get('Date') or headers.get('EventDate')),
+        'tournament': headers.get('Event'),
+        'winner': _winner_from_result(headers.get('Result')),
+        'custom_list': headers.get('List'),
+    }
+
+
+def iter_pgn(lines):
+    """
+    Genera un problema per ogni partita PGN con intestazione [FEN "..."]:
+    la linea principale diventa la soluzione, le intestazioni i dati storici.
+    """
+    headers = {}
+    movetext = []
+    for line in lines:
+        line = line.strip()
+        match = _PGN_HEADER.match(line)
+        if match:
+            # Una nuova intestazione dopo le mosse apre una nuova partita
+            if movetext:
+                yield _pgn_record(headers, movetext)
+                headers, movetext = {}, []
+            headers[match.group(1)] = _pgn_value(match.group(2))
+        elif line:
+            movetext.append(line)
+    if headers:
+        yield _pgn_record(headers, movetext)
+
+
+# --- EPD ---
+
+def _epd_operations(text):
+    """Divide le operazioni EPD ('bm Rg8#; id "test 1";') rispettando le virgolette."""
+    operations = {}
+    for op in re.findall(r'(\w+)\s*((?:"[^"]*"|[^;])*);', text):
+        opcode, operand = op
+        operations[opcode] = operand.strip()
+    return operations
+
+
+def iter_epd(lines):
+    """
+    Genera un problema per ogni riga EPD. La soluzione è 'pv' (se presente)
+    o la prima mossa di 'bm'; 'id' diventa un tag.
+    """
+    for line in lines:
+        fields = line.strip().split(None, 4)
+        if len(fields) < 4:
+            continue
+        operations = _epd_operations(fields[4]) if len(fields) > 4 else {}
+        halfmove = operations.get('hmvc', '0')
+        fullmove = operations.get('fmvn', '1')
+        solution = operations.get('pv') or operations.get('bm', '')
+        moves = solution.split()
+        if 'pv' not in operations:
+            moves = moves[:1]
+        tags = []
+        if operations.get('id'):
+            tags.append(operations['id'].strip('"'))
+        yield {
+            'fen': ' '.join(fields[:4] + [halfmove, fullmove]),
+            'solution_moves': moves,
+            'tags': tags,
+        }
+
+
+# --- CSV ---
+
+# Nomi di colonna accettati (minuscolo) -> campo del DB
+CSV_COLUMNS = {
+    'fen': 'fen',
+    'solution': 'solution_moves', 'solution_moves': 'solution_moves', 'moves': 'solution_moves',
+    'tags': 'tags', 'themes': 'themes',
+    'white_player': 'white_player', 'white': 'white_player',
+    'black_player': 'black_player', 'black': 'black_player',
+    'game_year': 'game_year', 'year': 'game_year', 'date': 'game_year',
+    'tournament': 'tournament', 'event': 'tournament',
+    'winner': 'winner', 'result': 'winner',
+    'custom_list': 'custom_list', 'list': 'custom_list',
+}
+
+
+def iter_csv(lines):
+    """Genera un problema per ogni riga CSV (con intestazione, vedi CSV_COLUMNS)."""
+    for raw in csv.DictReader(lines):
+        row = {}
+        for column, value in raw.items():
+            field = CSV_COLUMNS.get((column or '').strip().lower())
+            if field and value is not None and value.strip():
+                row[field] = value.strip()
+
+        winner = row.get('winner')
+        if winner in ('0', '1'):
+            winner = int(winner)
+        else:
+            winner = _winner_from_result(winner)
+
+        yield {
+            'fen': row.get('fen'),
+            'solution_moves': _split_moves(row.get('solution_moves')),
+            'tags': _split_tags(row, 'tags', 'themes'),
+            'white_player': row.get('white_player'),
+            'black_player': row.get('black_player'),
+            'game_year': _year_from_date(row.get('game_year')),
+            'tournament': row.get('tournament'),
+            'winner': winner,
+            'custom_list': row.get('custom_list'),
+        }
+
+
+PARSERS = {'pgn': iter_pgn, 'epd': iter_epd, 'csv': iter_csv}
+
+
+def detect_format(filename):
+    """Ricava il formato dall'estensione (anche compressa .gz)."""
+    name = filename.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    extension = os.path.splitext(name)[1].lstrip('.')
+    return extension if extension in FORMATS else None
+
+
+# ----------------------------------------------------------------------
+# INSERIMENTO A BLOCCHI
+# ----------------------------------------------------------------------
+
+def validate_batch(records, pool=None, errors=None):
+    """
+    Valida le soluzioni di un blocco (con il pool di processi, se indicato) e aggiunge
+    ai record validi SAN canonica, mosse UCI e FEN. Restituisce solo i record validi;
+    i messaggi d'errore finiscono in `errors` (al massimo MAX_INVALID_EXAMPLES).
+    """
+    results = movegen.validate_many([(r['fen'], r['solution_moves']) for r in records], pool)
+    valid = []
+    for record, (line, error) in zip(records, results):
+        if error:
+            if errors is not None and len(errors) < MAX_INVALID_EXAMPLES:
+                errors.append(f"{record['fen']}: {error}")
+            continue
+        record.update(line)
+        valid.append(record)
+    return valid
+
+
+def import_records(records, custom_list=None, extra_tags=(), batch_size=BATCH_SIZE, progress=None,
+                   on_duplicate=db_manager.DEFAULT_DUPLICATE_POLICY, processes=1):
+    """
+    Inserisce i problemi prodotti dal generatore `records` a blocchi.
+    Le posizioni già presenti (anche nello stesso file) seguono `on_duplicate`
+    (vedi db_manager.DUPLICATE_POLICIES). Le soluzioni vengono validate con
+    `processes` processi (None = uno per CPU); quelle illegali sono scartate.
+    `progress`, se indicato, viene chiamato dopo ogni blocco con le statistiche.
+    Restituisce un dizionario con imported, skipped, invalid, duplicates, seconds,
+    rows_per_second, invalid_examples ed error (None, oppure il motivo per cui
+    l'importazione si è interrotta: i conteggi sono allora parziali).
+    """
+    stats = {'imported': 0, 'skipped': 0, 'invalid': 0, 'duplicates': 0, 'seconds': 0.0, 'rows_per_second': 0.0,
+             'invalid_examples': [], 'error': None}
+    conn = db_manager.create_connection()
+    if conn is None:
+        stats['error'] = "connessione al database non riuscita"
+        return stats
+
+    start = time.perf_counter()
+    batch = []
+    pool = movegen.open_pool(processes) if processes != 1 else None
+
+    def flush():
+        valid = validate_batch(batch, pool, stats['invalid_examples'])
+        stats['invalid'] += len(batch) - len(valid)
+        inserted = db_manager.insert_problems_batch(conn, valid, on_duplicate)
+        stats['imported'] += inserted
+        stats['duplicates'] += len(valid) - inserted
+        batch.clear()
+        stats['seconds'] = time.perf_counter() - start
+        stats['rows_per_second'] = stats['imported'] / stats['seconds'] if stats['seconds'] else 0.0
+        if progress:
+            progress(stats)
+
+    try:
+        for record in records:
+            # Come i form di inserimento: FEN e soluzione sono obbligatori
+            if not record or not record.get('fen') or not record.get('solution_moves'):
+                stats['skipped'] += 1
+                continue
+            if extra_tags:
+                tags = list(record.get('tags') or [])
+                record['tags'] = tags + [t for t in extra_tags if t not in tags]
+            if custom_list and not record.get('custom_list'):
+                record['custom_list'] = custom_list
+            batch.append(record)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    except sqlite3.Error as e:
+        print(f"Importazione interrotta: {e}")
+        stats['error'] = str(e)
+    finally:
+        conn.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_second'] = stats['imported'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+def import_stream(text_stream, fmt, **kwargs):
+    """Importa da un flusso di testo già aperto (file o upload) nel formato indicato."""
+    return import_records(PARSERS[fmt](text_stream), **kwargs)
+
+
+def _open_text(path):
+    if path.lower().endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace', newline='')
+    return io.open(path, 'r', encoding='utf-8', errors='replace', newline='')
+
+
+def _print_progress(stats):
+    print(f"  {stats['imported']} problemi importati "
+          f"({stats['rows_per_second']:.0f} righe/s, {stats['skipped']} scartati, "
+          f"{stats['invalid']} non validi, {stats['duplicates']} duplicati)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Importa problemi da file PGN, EPD o CSV (anche .gz).")
+    parser.add_argument('path', help="File da importare")
+    parser.add_argument('--format', choices=FORMATS, help="Formato (default: dall'estensione)")
+    parser.add_argument('--list', dest='custom_list', help="Lista in cui inserire i problemi")
+    parser.add_argument('--tags', default='', help="Tag aggiuntivi separati da virgola")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--on-duplicate', choices=db_manager.DUPLICATE_POLICIES,
+                        default=db_manager.DEFAULT_DUPLICATE_POLICY,
+                        help="Cosa fare con le posizioni già presenti (default: %(default)s)")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Processi per validare le soluzioni (default: uno per CPU)")
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.path)
+    if fmt is None:
+        parser.error("Formato non riconosciuto: usa --format pgn|epd|csv")
+
+    with _open_text(args.path) as stream:
+        result = import_stream(stream, fmt,
+                               custom_list=args.custom_list,
+                               extra_tags=_split_list(args.tags),
+                               batch_size=args.batch_size,
+                               progress=_print_progress,
+                               on_duplicate=args.on_duplicate,
+                               processes=args.processes)
+
+    for example in result['invalid_examples']:
+        print(f"  Soluzione non valida - {example}")
+    print(f"Fatto: {result['imported']} problemi importati, {result['skipped']} scartati, "
+          f"{result['invalid']} non validi, {result['duplicates']} duplicati "
+          f"in {result['seconds']:.1f}s ({result['rows_per_second']:.0f} righe/s).")
+    if result['error']:
+        print(f"ERRORE: importazione interrotta ({result['error']}).")
+        sys.exit(1)
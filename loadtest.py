@@ -0,0 +1,476 @@
+import argparse
+import email
+import http.cookiejar
+import json
+import os
+import random
+import re
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# ----------------------------------------------------------------------
+# TEST DI CARICO HTTP END-TO-END
+# Avvia l'app sotto gunicorn su una banca sintetica (vedi benchmark.py),
+# con un server SMTP locale che riceve i codici 2FA, e fa giocare a N
+# utenti virtuali sessioni realistiche: dashboard -> /review -> /rate
+# in ciclo, sfoglia l'elenco, inserisce problemi nuovi. Per ogni livello
+# di concorrenza riporta latenze p50/p95/p99, throughput ed errori
+# (inclusi i "database is locked") per rotta:
+#
+#   python loadtest.py --size 10k --concurrency 1,8,32 --duration 30
+# ----------------------------------------------------------------------
+
+DEFAULT_CONCURRENCY = '1,4,16'
+DEFAULT_DURATION = 20           # secondi per livello di concorrenza
+DEFAULT_WORKERS = 4
+DEFAULT_SIZE = '10k'
+LOAD_PASSWORD = 'loadtest'
+LOCKED_MESSAGE = 'database is locked'
+REQUEST_TIMEOUT = 30
+
+# Peso degli scenari: quasi tutto il traffico è ripasso
+SCENARIOS = (('review', 0.75), ('browse', 0.2), ('insert', 0.05))
+RATINGS_PER_SESSION = 10
+RATING_WEIGHTS = (('Facile', 0.3), ('Medio', 0.4), ('Difficile', 0.2), ('Sbagliato', 0.1))
+
+_PROBLEM_ID = re.compile(r'Problema #(\d+)')
+_NEXT_URL = re.compile(r'var nextUrl = ("[^"]*"|null);')
+_OTP = re.compile(r'\b(\d{6})\b')
+_NUMERIC_SEGMENT = re.compile(r'/\d+')
+
+
+# ----------------------------------------------------------------------
+# SERVER SMTP LOCALE (riceve i codici 2FA al posto di Gmail)
+# ----------------------------------------------------------------------
+
+class MailSink(socketserver.ThreadingTCPServer):
+    """SMTP minimo in memoria: accetta qualsiasi messaggio e ricorda l'ultimo codice per destinatario."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0)):
+        super().__init__(address, _SMTPHandler)
+        self.codes = {}
+        self.received = 0
+        self._cond = threading.Condition()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def deliver(self, recipients, data):
+        message = email.message_from_bytes(data)
+        body = ''
+        for part in message.walk():
+            if part.get_content_type() == 'text/plain':
+                body += (part.get_payload(decode=True) or b'').decode('utf-8', 'replace')
+        match = _OTP.search(body)
+        with self._cond:
+            self.received += 1
+            if match:
+                for rcpt in recipients:
+                    self.codes[rcpt.lower()] = match.group(1)
+            self._cond.notify_all()
+
+    def wait_code(self, recipient, timeout=15):
+        """Attende (e consuma) il codice inviato a `recipient`; None se non arriva in tempo."""
+        deadline = time.monotonic() + timeout
+        recipient = recipient.lower()
+        with self._cond:
+            while recipient not in self.codes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self.codes.pop(recipient)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='mail-sink', daemon=True).start()
+        return self
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply('220 loadtest ESMTP')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.wfile.write(b'250-loadtest\r\n250 8BITMIME\r\n')
+            elif verb == 'HELO':
+                self.reply('250 loadtest')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                match = re.search(r'<([^>]*)>', command)
+                recipients.append(match.group(1) if match else command[8:])
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                self.server.deliver(recipients, b''.join(lines))
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:  # RSET, NOOP, ...
+                self.reply('250 OK')
+
+
+# ----------------------------------------------------------------------
+# HOOK DI GUNICORN (caricati con "-c python:loadtest")
+# Un worker sync serve una richiesta alla volta: l'output stampato tra
+# pre_request e post_request appartiene a quella richiesta, quindi i
+# "database is locked" si possono attribuire alla rotta che li ha causati.
+# ----------------------------------------------------------------------
+
+class _RequestOutput:
+    """Inoltra le scritture allo stream originale e le tiene per la fine della richiesta."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.text = []
+
+    def write(self, data):
+        self.text.append(data)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def pre_request(worker, req):
+    if os.getenv('LOADTEST_LOCK_LOG'):
+        sys.stdout = _RequestOutput(sys.__stdout__)
+        sys.stderr = _RequestOutput(sys.__stderr__)
+
+
+def post_request(worker, req, environ, resp):
+    out, err = sys.stdout, sys.stderr
+    if not isinstance(out, _RequestOutput):
+        return
+    sys.stdout, sys.stderr = out.stream, err.stream
+    if LOCKED_MESSAGE in ''.join(out.text + err.text):
+        with open(os.environ['LOADTEST_LOCK_LOG'], 'a', encoding='utf-8') as f:
+            f.write(f"{req.method} {req.path}\n")
+
+
+# ----------------------------------------------------------------------
+# PREPARAZIONE: banca, utenti virtuali, gunicorn
+# ----------------------------------------------------------------------
+
+def prepare_database(size_label, users, data_dir):
+    """Copia di lavoro della banca sintetica con gli utenti load1..loadN (tutti i problemi nuovi per loro)."""
+    import benchmark
+    import db_manager
+    from werkzeug.security import generate_password_hash
+
+    path = benchmark.prepare_bank(benchmark.SIZES[size_label], data_dir=data_dir)
+    db_manager.DB_NAME = path
+    # Hash leggero: il login non deve dominare la misura (gli utenti veri entrano di rado)
+    password_hash = generate_password_hash(LOAD_PASSWORD, method='pbkdf2:sha256:1000')
+    for i in range(1, users + 1):
+        db_manager.create_user(f"load{i}", password_hash, f"load{i}@loadtest.local")
+    db_manager._pool.close_all()
+    return os.path.abspath(path)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path, mail_port, workers, lock_log, log_file):
+    """Avvia gunicorn (worker sync) sull'app e attende che risponda. Restituisce (processo, URL)."""
+    port = _free_port()
+    env = dict(os.environ,
+               CHESS_TUTOR_DB=db_path,
+               MAIL_SERVER='127.0.0.1', MAIL_PORT=str(mail_port), MAIL_USE_TLS='0',
+               # Mittente senza password: Flask-Mail non tenta il login SMTP
+               MAIL_USERNAME='loadtest@localhost', MAIL_PASSWORD='',
+               SECRET_KEY='loadtest', LOADTEST_LOCK_LOG=lock_log)
+    here = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'python:loadtest', '--workers', str(workers),
+         '--worker-class', 'sync', '--bind', f'127.0.0.1:{port}', '--timeout', '60', 'app:app'],
+        cwd=here, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn è terminato (codice {process.returncode}): vedi {log_file.name}")
+        try:
+            urllib.request.urlopen(url + '/login', timeout=2).read()
+            return process, url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn non risponde dopo 60 secondi.")
+
+
+# ----------------------------------------------------------------------
+# UTENTE VIRTUALE
+# ----------------------------------------------------------------------
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Ogni richiesta si misura da sola: i redirect non vengono seguiti."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def route_name(method, path):
+    """Nome della rotta per le statistiche: /rate/123?x=1 -> 'POST /rate/<id>'."""
+    path = _NUMERIC_SEGMENT.sub('/<id>', urllib.parse.urlsplit(path).path)
+    return f"{method} {path}"
+
+
+class Recorder:
+    """Latenze ed errori per rotta, condivisi tra i thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, route, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+class VirtualUser:
+    def __init__(self, number, base_url, mail_sink, recorder, rng, think_time):
+        self.username = f"load{number}"
+        self.email = f"load{number}@loadtest.local"
+        self.base_url = base_url
+        self.mail_sink = mail_sink
+        self.recorder = recorder
+        self.rng = rng
+        self.think_time = think_time
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, form=None, json_body=None):
+        """Esegue e cronometra una richiesta. Restituisce (status, corpo) o (None, '') se la connessione fallisce."""
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+        elif json_body is not None:
+            data, headers = json.dumps(json_body).encode(), {'Content-Type': 'application/json'}
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=REQUEST_TIMEOUT) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+        except (urllib.error.URLError, OSError):
+            status, body = None, b''
+        self.recorder.add(route_name(method, path), time.perf_counter() - start,
+                          status is not None and status < 400)
+        return status, body.decode('utf-8', 'replace')
+
+    def think(self):
+        if self.think_time:
+            time.sleep(self.rng.expovariate(1 / self.think_time))
+
+    def login(self):
+        self.request('GET', '/login')
+        status, _ = self.request('POST', '/login', form={'username': self.username, 'password': LOAD_PASSWORD})
+        if status != 302:
+            return False
+        code = self.mail_sink.wait_code(self.email)
+        if code is None:
+            return False
+        status, _ = self.request('POST', '/verify_2fa', form={'code': code})
+        return status == 302
+
+    # --- Scenari ---
+
+    def review(self):
+        self.request('GET', '/')
+        status, body = self.request('GET', '/review')
+        for _ in range(RATINGS_PER_SESSION):
+            match = _PROBLEM_ID.search(body) if status == 200 else None
+            if not match:
+                return
+            self.think()
+            rating = self.rng.choices([r for r, _ in RATING_WEIGHTS], [w for _, w in RATING_WEIGHTS])[0]
+            self.request('POST', f"/rate/{match.group(1)}", form={'rating': rating})
+            status, body = self.request('GET', '/review')
+
+    def browse(self):
+        status, body = self.request('GET', '/list')
+        match = _NEXT_URL.search(body) if status == 200 else None
+        next_url = json.loads(match.group(1)) if match else None
+        for _ in range(self.rng.randint(1, 4)):
+            if not next_url:
+                return
+            self.think()
+            status, body = self.request('GET', next_url)
+            next_url = json.loads(body).get('next_url') if status == 200 else None
+
+    def insert(self):
+        import benchmark
+        self.request('GET', '/new_graphical')
+        self.think()
+        p = benchmark._random_problem(self.rng)
+        self.request('POST', '/new_graphical', form={
+            'fen': p['fen'], 'solution': ','.join(p['solution_moves']), 'tags': ','.join(p['tags']),
+            'custom_list': p['custom_list'] or '', 'on_duplicate': 'allow'})
+
+    def run(self, stop):
+        if not self.login():
+            return
+        names = [name for name, _ in SCENARIOS]
+        weights = [weight for _, weight in SCENARIOS]
+        while not stop.is_set():
+            getattr(self, self.rng.choices(names, weights)[0])()
+            self.think()
+
+
+# ----------------------------------------------------------------------
+# ESECUZIONE E RAPPORTO
+# ----------------------------------------------------------------------
+
+def _percentile(sorted_samples, q):
+    """Percentile con il metodo nearest-rank."""
+    index = max(0, min(len(sorted_samples) - 1, int(round(q / 100 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index]
+
+
+def _read_locks(lock_log):
+    locks = {}
+    if os.path.exists(lock_log):
+        with open(lock_log, encoding='utf-8') as f:
+            for line in f:
+                method, _, path = line.strip().partition(' ')
+                route = route_name(method, path)
+                locks[route] = locks.get(route, 0) + 1
+    return locks
+
+
+def run_level(concurrency, duration, base_url, mail_sink, think_time, lock_log, seed):
+    """Un livello di concorrenza: `concurrency` utenti virtuali per `duration` secondi."""
+    if os.path.exists(lock_log):
+        os.remove(lock_log)
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [threading.Thread(target=VirtualUser(i, base_url, mail_sink, recorder,
+                                                   random.Random(seed * 1000 + i), think_time).run,
+                                args=(stop,), daemon=True)
+               for i in range(1, concurrency + 1)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(REQUEST_TIMEOUT * RATINGS_PER_SESSION)
+    elapsed = time.perf_counter() - start
+
+    locks = _read_locks(lock_log)
+    routes = []
+    for route, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        routes.append({
+            'route': route,
+            'requests': len(samples),
+            'rps': round(len(samples) / elapsed, 2),
+            'p50_ms': round(_percentile(samples, 50) * 1000, 2),
+            'p95_ms': round(_percentile(samples, 95) * 1000, 2),
+            'p99_ms': round(_percentile(samples, 99) * 1000, 2),
+            'error_rate': round(recorder.errors.get(route, 0) / len(samples), 4),
+            'locked_rate': round(locks.get(route, 0) / len(samples), 4),
+        })
+    total = sum(r['requests'] for r in routes)
+    return {
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 2),
+        'requests': total,
+        'rps': round(total / elapsed, 2),
+        'errors': sum(recorder.errors.values()),
+        'locked': sum(locks.values()),
+        'routes': routes,
+    }
+
+
+def print_level(level):
+    print(f"\n=== {level['concurrency']} utenti: {level['requests']} richieste in {level['seconds']}s "
+          f"({level['rps']} req/s), {level['errors']} errori, {level['locked']} 'database is locked' ===")
+    print(f"{'rotta':<28} {'req':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errori':>8} {'locked':>8}")
+    for r in level['routes']:
+        print(f"{r['route']:<28} {r['requests']:>7} {r['rps']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+              f"{r['p99_ms']:>9} {r['error_rate']:>8.2%} {r['locked_rate']:>8.2%}")
+
+
+if __name__ == '__main__':
+    import benchmark
+
+    parser = argparse.ArgumentParser(description="Test di carico HTTP dell'app sotto gunicorn.")
+    parser.add_argument('--size', default=DEFAULT_SIZE, choices=list(benchmark.SIZES),
+                        help="Dimensione della banca sintetica (default: %(default)s)")
+    parser.add_argument('--concurrency', default=DEFAULT_CONCURRENCY,
+                        help="Livelli di utenti simultanei, separati da virgola (default: %(default)s)")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help="Secondi per livello")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Worker gunicorn")
+    parser.add_argument('--think', type=float, default=0.0,
+                        help="Pausa media tra le azioni in secondi (0 = carico massimo)")
+    parser.add_argument('--seed', type=int, default=benchmark.SEED)
+    parser.add_argument('--data-dir', default=benchmark.DATA_DIR)
+    parser.add_argument('-o', '--output', help="Salva i risultati in JSON")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    db_path = prepare_database(args.size, max(levels), args.data_dir)
+    lock_log = os.path.abspath(os.path.join(args.data_dir, 'loadtest_locks.log'))
+    log_path = os.path.join(args.data_dir, 'loadtest_server.log')
+
+    sink = MailSink().start()
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        server, base_url = start_server(db_path, sink.port, args.workers, lock_log, log_file)
+        print(f"gunicorn ({args.workers} worker) su {base_url}, banca {args.size}, log in {log_path}")
+        results = []
+        try:
+            for concurrency in levels:
+                level = run_level(concurrency, args.duration, base_url, sink, args.think, lock_log, args.seed)
+                print_level(level)
+                results.append(level)
+        finally:
+            server.terminate()
+            server.wait(10)
+            sink.shutdown()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'meta': dict(benchmark._meta(1, args.seed), workers=args.workers, size=args.size,
+                                    duration=args.duration, think=args.think),
+                       'levels': results}, f, indent=1)
+        print(f"Risultati salvati in {args.output}.")
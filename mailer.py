@@ -0,0 +1,144 @@
+import os
+import queue
+import smtplib
+import threading
+import time
+import uuid
+
+# ----------------------------------------------------------------------
+# INVIO DELLE EMAIL IN BACKGROUND
+# Le richieste mettono il messaggio in coda e rispondono subito: un thread
+# dedicato lo spedisce riusando la stessa connessione SMTP, riprova con
+# attese crescenti se il server non risponde e registra lo stato di ogni
+# invio, che la pagina di verifica 2FA può interrogare.
+# ----------------------------------------------------------------------
+
+MAX_ATTEMPTS = 4
+RETRY_BASE_SECONDS = 1.0    # Attese tra i tentativi: 1s, 2s, 4s...
+IDLE_CLOSE_SECONDS = 60     # Chiude la connessione SMTP dopo un minuto senza messaggi
+STATUS_TTL_SECONDS = 3600   # Per quanto tempo si ricorda lo stato di un invio
+
+STATUS_QUEUED = 'queued'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+
+class MailQueue:
+    """Coda di invio con un thread di lavoro (avviato al primo messaggio, anche dopo un fork)."""
+
+    def __init__(self, app, mail, max_attempts=MAX_ATTEMPTS, retry_base=RETRY_BASE_SECONDS,
+                 idle_close=IDLE_CLOSE_SECONDS):
+        self.app = app
+        self.mail = mail
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.idle_close = idle_close
+        self._queue = queue.Queue()
+        self._statuses = {}
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+        self._connection = None
+        # Contatori per le statistiche (e per i test di carico)
+        self.connections_opened = 0
+
+    # --- Lato richiesta ---
+
+    def submit(self, message):
+        """Mette in coda un flask_mail.Message e restituisce l'id per seguirne lo stato."""
+        job_id = uuid.uuid4().hex
+        self._set_status(job_id, STATUS_QUEUED, attempts=0)
+        self._ensure_worker()
+        self._queue.put((job_id, message))
+        return job_id
+
+    def status(self, job_id):
+        """Stato di un invio ({'status', 'attempts', 'error'}) oppure None se sconosciuto."""
+        with self._lock:
+            entry = self._statuses.get(job_id)
+            return dict(entry) if entry else None
+
+    def wait(self, job_id, timeout=10.0):
+        """Attende la fine di un invio (utile negli script e nei test). Restituisce lo stato finale."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            entry = self.status(job_id)
+            if entry is None or entry['status'] in (STATUS_SENT, STATUS_FAILED):
+                return entry
+            time.sleep(0.05)
+        return self.status(job_id)
+
+    def _set_status(self, job_id, status, **fields):
+        now = time.time()
+        with self._lock:
+            entry = self._statuses.setdefault(job_id, {'attempts': 0, 'error': None})
+            entry.update(fields, status=status, updated=now)
+            # Dimentica gli invii vecchi
+            if len(self._statuses) > 1000:
+                for old_id in [k for k, v in self._statuses.items() if now - v['updated'] > STATUS_TTL_SECONDS]:
+                    del self._statuses[old_id]
+
+    def _ensure_worker(self):
+        with self._lock:
+            # Dopo un fork (es. gunicorn --preload) il thread del processo padre non esiste più
+            if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._connection = None
+            self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name='mail-queue', daemon=True)
+            self._worker.start()
+
+    # --- Thread di lavoro ---
+
+    def _open(self):
+        if self._connection is None:
+            connection = self.mail.connect()
+            connection.__enter__()
+            self._connection = connection
+            self.connections_opened += 1
+        return self._connection
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass  # La connessione era già caduta
+            self._connection = None
+
+    def _send(self, job_id, message):
+        for attempt in range(1, self.max_attempts + 1):
+            self._set_status(job_id, STATUS_SENDING, attempts=attempt)
+            try:
+                with self.app.app_context():
+                    self._open().send(message)
+                self._set_status(job_id, STATUS_SENT, error=None)
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                # Al prossimo tentativo si riapre la connessione da capo
+                self._close()
+                print(f"Errore invio mail (tentativo {attempt}/{self.max_attempts}): {e}")
+                self._set_status(job_id, STATUS_SENDING, error=str(e))
+                if attempt < self.max_attempts:
+                    time.sleep(self.retry_base * 2 ** (attempt - 1))
+        self._set_status(job_id, STATUS_FAILED)
+
+    def _run(self):
+        work = self._queue
+        while True:
+            try:
+                job_id, message = work.get(timeout=self.idle_close)
+            except queue.Empty:
+                self._close()
+                continue
+            try:
+                self._send(job_id, message)
+            except Exception as e:
+                # Un messaggio malformato non deve fermare il thread
+                print(f"Errore invio mail: {e}")
+                self._set_status(job_id, STATUS_FAILED, error=str(e))
+            finally:
+                work.task_done()
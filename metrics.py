@@ -0,0 +1,324 @@
+import cProfile
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+# ----------------------------------------------------------------------
+# METRICHE DELLE RICHIESTE (FORMATO TESTO DI PROMETHEUS)
+# Per ogni rotta: istogramma delle latenze, istruzioni SQL e righe lette
+# per richiesta, e il tempo speso in SQLite, nel rendering Jinja, in
+# json.loads e nelle funzioni SM-2. Durante una richiesta i contatori
+# sono locali al thread (nessun lock sul percorso caldo) e confluiscono
+# nel registro del processo alla fine; fuori da una richiesta (script da
+# riga di comando) l'instrumentazione non fa nulla.
+# Sotto gunicorn ogni worker ha il proprio registro: /metrics riporta
+# quello del worker che risponde (etichetta pid).
+# ----------------------------------------------------------------------
+
+PREFIX = 'chess_tutor'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Profilazione su richiesta: PROFILE_SLOW_MS=200 salva un .prof per ogni richiesta più lenta
+PROFILE_SLOW_MS = os.getenv('PROFILE_SLOW_MS')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+_local = threading.local()
+
+
+class RequestStats:
+    """Contatori di una singola richiesta (solo il thread che la serve li tocca)."""
+
+    __slots__ = ('statements', 'rows', 'seconds', 'calls', 'template_start')
+
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+        self.seconds = {}   # fase -> secondi (sql, template, json_loads, calculate_sm2, ...)
+        self.calls = {}
+        self.template_start = None
+
+    def add_time(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+
+def current():
+    """Contatori della richiesta in corso nel thread, o None fuori da una richiesta."""
+    return getattr(_local, 'request', None)
+
+
+# ----------------------------------------------------------------------
+# INSTRUMENTAZIONE (cursori SQLite, funzioni cronometrate)
+# ----------------------------------------------------------------------
+
+class CountingCursor:
+    """
+    Involucro di sqlite3.Cursor che conta istruzioni, righe lette e tempo passato
+    in SQLite. Gli attributi (description, rowcount, row_factory...) passano al cursore vero.
+    """
+
+    __slots__ = ('_cursor', '_stats')
+
+    def __init__(self, cursor, stats):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_stats', stats)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._stats.add_time('sql', time.perf_counter() - start)
+
+    def execute(self, sql, parameters=()):
+        self._stats.statements += 1
+        self._timed(self._cursor.execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._stats.statements += 1
+        self._timed(self._cursor.executemany, sql, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._timed(self._cursor.fetchmany, *args)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+
+def wrap_cursor(cursor):
+    """Restituisce un CountingCursor durante una richiesta, altrimenti il cursore così com'è."""
+    stats = current()
+    return cursor if stats is None else CountingCursor(cursor, stats)
+
+
+def timed(phase):
+    """Decoratore: somma il tempo della funzione alla fase `phase` della richiesta in corso."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            stats = current()
+            if stats is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stats.add_time(phase, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+# json.loads cronometrato (decodifica di solution_moves e tags)
+json_loads = timed('json_loads')(json.loads)
+
+
+# ----------------------------------------------------------------------
+# REGISTRO DEL PROCESSO
+# ----------------------------------------------------------------------
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}      # (method, route, status) -> conteggio
+        self.latency = {}       # (method, route) -> Histogram
+        self.statements = {}    # (method, route) -> Histogram
+        self.rows = {}          # (method, route) -> Histogram
+        self.phase_seconds = {}  # (method, route, fase) -> secondi
+        self.phase_calls = {}    # (fase) -> chiamate
+        self.slow_profiles = 0
+
+    def record(self, method, route, status, seconds, stats):
+        key = (method, route)
+        with self._lock:
+            self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.statements.setdefault(key, Histogram(STATEMENT_BUCKETS)).observe(stats.statements)
+            self.rows.setdefault(key, Histogram(ROW_BUCKETS)).observe(stats.rows)
+            for phase, phase_seconds in stats.seconds.items():
+                self.phase_seconds[key + (phase,)] = self.phase_seconds.get(key + (phase,), 0.0) + phase_seconds
+                self.phase_calls[phase] = self.phase_calls.get(phase, 0) + stats.calls[phase]
+
+    def render(self):
+        """Esposizione in formato testo di Prometheus (text/plain; version=0.0.4)."""
+        pid = str(os.getpid())
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        def sample(name, labels, value):
+            text = ','.join(f'{k}="{_escape(v)}"' for k, v in (('pid', pid),) + labels)
+            lines.append(f"{PREFIX}_{name}{{{text}}} {_number(value)}")
+
+        def histogram(name, help_text, series):
+            header(name, 'histogram', help_text)
+            for (method, route), h in sorted(series.items()):
+                labels = (('method', method), ('route', route))
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    sample(name + '_bucket', labels + (('le', _number(bound)),), cumulative)
+                sample(name + '_bucket', labels + (('le', '+Inf'),), h.count)
+                sample(name + '_sum', labels, h.total)
+                sample(name + '_count', labels, h.count)
+
+        with self._lock:
+            header('requests_total', 'counter', 'Richieste servite per rotta e stato HTTP.')
+            for (method, route, status), count in sorted(self.requests.items()):
+                sample('requests_total', (('method', method), ('route', route), ('status', str(status))), count)
+            histogram('request_duration_seconds', 'Latenza delle richieste per rotta.', self.latency)
+            histogram('request_sql_statements', 'Istruzioni SQL eseguite per richiesta.', self.statements)
+            histogram('request_sql_rows', 'Righe lette da SQLite per richiesta.', self.rows)
+            header('request_phase_seconds_total', 'counter',
+                   'Tempo per rotta speso in SQLite, template Jinja, json.loads e SM-2.')
+            for (method, route, phase), seconds in sorted(self.phase_seconds.items()):
+                sample('request_phase_seconds_total', (('method', method), ('route', route), ('phase', phase)), seconds)
+            header('phase_calls_total', 'counter', 'Chiamate cronometrate per fase (istruzioni/fetch SQL, template, funzioni).')
+            for phase, calls in sorted(self.phase_calls.items()):
+                sample('phase_calls_total', (('phase', phase),), calls)
+            header('slow_request_profiles_total', 'counter', 'Profili cProfile salvati per richieste lente.')
+            sample('slow_request_profiles_total', (), self.slow_profiles)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+
+# ----------------------------------------------------------------------
+# AGGANCIO A FLASK
+# ----------------------------------------------------------------------
+
+def _route(request):
+    # La regola (es. /rate/<int:problem_id>) e non il percorso: poche serie, non una per ID
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _profile_path(method, route, elapsed_ms):
+    safe_route = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(PROFILE_DIR, f"{stamp}_{os.getpid()}_{method}_{safe_route}_{elapsed_ms:.0f}ms.prof")
+
+
+def init_app(app, slow_ms=PROFILE_SLOW_MS):
+    """
+    Registra gli hook che misurano ogni richiesta. Con `slow_ms` (o PROFILE_SLOW_MS nel .env)
+    ogni richiesta gira sotto cProfile e quelle più lente della soglia vengono salvate in
+    PROFILE_DIR (.prof, da aprire con snakeviz o da convertire in flamegraph con flameprof).
+    """
+    from flask import g, request, before_render_template, template_rendered
+
+    slow_ms = float(slow_ms) if slow_ms else None
+    if slow_ms is not None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    @app.before_request
+    def _start_request():
+        _local.request = RequestStats()
+        g.metrics_start = time.perf_counter()
+        g.metrics_status = 500  # Se la richiesta solleva un'eccezione after_request non viene chiamato
+        if slow_ms is not None:
+            g.metrics_profiler = cProfile.Profile()
+            g.metrics_profiler.enable()
+
+    @app.after_request
+    def _remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    # Chiamato a contesto chiuso: per le risposte in streaming, dopo l'ultimo blocco
+    @app.teardown_request
+    def _finish_request(exc):
+        stats = current()
+        start = g.pop('metrics_start', None)
+        _local.request = None
+        if stats is None or start is None:
+            return
+        elapsed = time.perf_counter() - start
+        method, route = request.method, _route(request)
+        registry.record(method, route, g.pop('metrics_status', 500), elapsed, stats)
+
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            if elapsed * 1000 >= slow_ms:
+                path = _profile_path(method, route, elapsed * 1000)
+                try:
+                    profiler.dump_stats(path)
+                    with registry._lock:
+                        registry.slow_profiles += 1
+                except OSError as e:
+                    print(f"Errore nel salvataggio del profilo: {e}")
+
+    def _template_start(sender, template, context, **extra):
+        stats = current()
+        if stats is not None:
+            stats.template_start = time.perf_counter()
+
+    def _template_done(sender, template, context, **extra):
+        stats = current()
+        if stats is not None and stats.template_start is not None:
+            stats.add_time('template', time.perf_counter() - stats.template_start)
+            stats.template_start = None
+
+    before_render_template.connect(_template_start, app, weak=False)
+    template_rendered.connect(_template_done, app, weak=False)
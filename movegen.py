@@ -0,0 +1,552 @@
+import argparse
+import json
+import multiprocessing
+import re
+import sqlite3
+import sys
+import time
+
+# ----------------------------------------------------------------------
+# GENERATORE DI MOSSE LEGALI (SCACCHIERA 0x88)
+# La scacchiera è una lista di 128 caselle: la casa (traversa, colonna)
+# sta all'indice traversa * 16 + colonna, e un indice esce dalla
+# scacchiera quando idx & 0x88 != 0, quindi basta un AND per fermare
+# i pezzi sul bordo. Serve a validare le soluzioni (in notazione SAN)
+# quando vengono inserite o importate e a precalcolare, per ogni
+# semimossa, la mossa UCI e il FEN che ne risulta: la pagina di revisione
+# non deve più rigiocare la linea con chess.js.
+# ----------------------------------------------------------------------
+
+WHITE, BLACK = 'w', 'b'
+FILES = 'abcdefgh'
+PROMOTIONS = 'qrbn'
+
+_KNIGHT_STEPS = (33, 31, 18, 14, -14, -18, -31, -33)
+_BISHOP_STEPS = (15, 17, -15, -17)
+_ROOK_STEPS = (1, -1, 16, -16)
+_KING_STEPS = _BISHOP_STEPS + _ROOK_STEPS
+_SLIDER_STEPS = {'b': _BISHOP_STEPS, 'r': _ROOK_STEPS, 'q': _KING_STEPS}
+
+# Case di partenza di re e torri per i diritti di arrocco
+_CASTLING_SQUARES = {
+    # diritto: (casa del re, casa della torre, arrivo del re, arrivo della torre, case da liberare)
+    'K': (0x04, 0x07, 0x06, 0x05, (0x05, 0x06)),
+    'Q': (0x04, 0x00, 0x02, 0x03, (0x01, 0x02, 0x03)),
+    'k': (0x74, 0x77, 0x76, 0x75, (0x75, 0x76)),
+    'q': (0x74, 0x70, 0x72, 0x73, (0x71, 0x72, 0x73)),
+}
+# Una mossa da o verso queste case toglie il diritto di arrocco corrispondente
+_CASTLING_LOST = {0x04: 'KQ', 0x07: 'K', 0x00: 'Q', 0x74: 'kq', 0x77: 'k', 0x70: 'q'}
+
+# Es. Nbd7, exd5, e8=Q, R1a3, Qh4xe1, e2-e4, e7e8q (anche la forma UCI è accettata)
+_SAN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?[x:-]?([a-h][1-8])(?:=?\(?([NBRQnbrq])\)?)?$')
+_SAN_SUFFIX = re.compile(r'(?:[+#!?]|e\.p\.)+$')
+
+
+def square_name(square):
+    return FILES[square & 7] + str((square >> 4) + 1)
+
+
+def parse_square(name):
+    return (int(name[1]) - 1) * 16 + FILES.index(name[0])
+
+
+class Position:
+    """
+    Posizione immutabile: push() restituisce una posizione nuova (copiare 128
+    caselle costa meno che annullare la mossa). Le mosse sono tuple
+    (da, a, promozione) con promozione in 'qrbn' oppure None.
+    """
+
+    __slots__ = ('board', 'turn', 'castling', 'ep', 'halfmove', 'fullmove', 'kings')
+
+    def __init__(self, board, turn, castling, ep, halfmove, fullmove, kings):
+        self.board = board
+        self.turn = turn
+        self.castling = castling
+        self.ep = ep
+        self.halfmove = halfmove
+        self.fullmove = fullmove
+        self.kings = kings
+
+    # --- Attacchi ---
+
+    def attacked(self, square, by):
+        """True se la casa è attaccata da un pezzo del colore `by`."""
+        board = self.board
+        if by == WHITE:
+            pawn, knight, bishop, rook, queen, king = 'P', 'N', 'B', 'R', 'Q', 'K'
+            pawn_from = (square - 15, square - 17)
+        else:
+            pawn, knight, bishop, rook, queen, king = 'p', 'n', 'b', 'r', 'q', 'k'
+            pawn_from = (square + 15, square + 17)
+        for origin in pawn_from:
+            if not origin & 0x88 and board[origin] == pawn:
+                return True
+        for step in _KNIGHT_STEPS:
+            origin = square + step
+            if not origin & 0x88 and board[origin] == knight:
+                return True
+        for step in _KING_STEPS:
+            origin = square + step
+            if not origin & 0x88 and board[origin] == king:
+                return True
+        for steps, slider in ((_BISHOP_STEPS, bishop), (_ROOK_STEPS, rook)):
+            for step in steps:
+                origin = square + step
+                while not origin & 0x88:
+                    piece = board[origin]
+                    if piece is not None:
+                        if piece == slider or piece == queen:
+                            return True
+                        break
+                    origin += step
+        return False
+
+    def in_check(self, color=None):
+        color = color or self.turn
+        return self.attacked(self.kings[color], BLACK if color == WHITE else WHITE)
+
+    # --- Generazione ---
+
+    def pseudo_moves(self):
+        """Mosse che rispettano il movimento dei pezzi (il proprio re può restare sotto scacco)."""
+        board = self.board
+        white = self.turn == WHITE
+        for square in range(128):
+            if square & 0x88:
+                continue
+            piece = board[square]
+            if piece is None or piece.isupper() != white:
+                continue
+            kind = piece.lower()
+            if kind == 'p':
+                yield from self._pawn_moves(square, white)
+            elif kind == 'n' or kind == 'k':
+                for step in (_KNIGHT_STEPS if kind == 'n' else _KING_STEPS):
+                    target = square + step
+                    if not target & 0x88:
+                        other = board[target]
+                        if other is None or other.isupper() != white:
+                            yield (square, target, None)
+            else:
+                for step in _SLIDER_STEPS[kind]:
+                    target = square + step
+                    while not target & 0x88:
+                        other = board[target]
+                        if other is None:
+                            yield (square, target, None)
+                        else:
+                            if other.isupper() != white:
+                                yield (square, target, None)
+                            break
+                        target += step
+        yield from self._castling_moves()
+
+    def _pawn_moves(self, square, white):
+        board = self.board
+        forward = 16 if white else -16
+        start_rank, last_rank = (1, 7) if white else (6, 0)
+        targets = []
+        target = square + forward
+        if not target & 0x88 and board[target] is None:
+            targets.append(target)
+            double = target + forward
+            if square >> 4 == start_rank and board[double] is None:
+                targets.append(double)
+        for target in (square + forward - 1, square + forward + 1):
+            if target & 0x88:
+                continue
+            other = board[target]
+            if (other is not None and other.isupper() != white) or target == self.ep:
+                targets.append(target)
+        for target in targets:
+            if target >> 4 == last_rank:
+                for promotion in PROMOTIONS:
+                    yield (square, target, promotion)
+            else:
+                yield (square, target, None)
+
+    def _castling_moves(self):
+        if not self.castling:
+            return
+        enemy = BLACK if self.turn == WHITE else WHITE
+        rights = 'KQ' if self.turn == WHITE else 'kq'
+        for right in rights:
+            if right not in self.castling:
+                continue
+            king, rook, king_to, _, between = _CASTLING_SQUARES[right]
+            if any(self.board[sq] is not None for sq in between):
+                continue
+            # Il re non può essere sotto scacco né attraversare case attaccate
+            passing = (king, (king + king_to) // 2, king_to)
+            if any(self.attacked(sq, enemy) for sq in passing):
+                continue
+            yield (king, king_to, None)
+
+    def legal_moves(self):
+        for move in self.pseudo_moves():
+            if self.is_legal(move):
+                yield move
+
+    def has_legal_move(self):
+        return any(True for _ in self.legal_moves())
+
+    def is_legal(self, move):
+        """True se la mossa pseudo-legale non lascia il proprio re sotto scacco."""
+        after = self.push(move)
+        return not after.attacked(after.kings[self.turn], after.turn)
+
+    # --- Esecuzione ---
+
+    def push(self, move):
+        """Restituisce la posizione dopo la mossa (che deve essere almeno pseudo-legale)."""
+        origin, target, promotion = move
+        board = self.board[:]
+        piece = board[origin]
+        captured = board[target]
+        kind = piece.lower()
+        white = self.turn == WHITE
+        kings = self.kings
+
+        board[origin] = None
+        board[target] = (promotion.upper() if white else promotion) if promotion else piece
+        if kind == 'p' and target == self.ep and captured is None:
+            board[target - 16 if white else target + 16] = None  # Presa en passant
+            captured = 'p'
+        if kind == 'k':
+            kings = dict(kings)
+            kings[self.turn] = target
+            if abs(target - origin) == 2:  # Arrocco: sposta anche la torre
+                right = ('K' if target > origin else 'Q') if white else ('k' if target > origin else 'q')
+                _, rook, _, rook_to, _ = _CASTLING_SQUARES[right]
+                board[rook_to], board[rook] = board[rook], None
+
+        castling = self.castling
+        if castling:
+            for square in (origin, target):
+                lost = _CASTLING_LOST.get(square)
+                if lost:
+                    castling = ''.join(c for c in castling if c not in lost)
+
+        ep = None
+        if kind == 'p' and abs(target - origin) == 32:
+            ep = (origin + target) // 2
+        halfmove = 0 if kind == 'p' or captured is not None else self.halfmove + 1
+        fullmove = self.fullmove + (0 if white else 1)
+        return Position(board, BLACK if white else WHITE, castling, ep, halfmove, fullmove, kings)
+
+    # --- Notazione ---
+
+    def fen(self):
+        ranks = []
+        for rank in range(7, -1, -1):
+            row, empty = '', 0
+            for file in range(8):
+                piece = self.board[rank * 16 + file]
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    row, empty = row + str(empty), 0
+                row += piece
+            ranks.append(row + (str(empty) if empty else ''))
+        ep = square_name(self.ep) if self.ep is not None else '-'
+        return f"{'/'.join(ranks)} {self.turn} {self.castling or '-'} {ep} {self.halfmove} {self.fullmove}"
+
+    def uci(self, move):
+        origin, target, promotion = move
+        return square_name(origin) + square_name(target) + (promotion or '')
+
+    def san(self, move, candidates=None):
+        """
+        SAN canonica della mossa (legale), con le stesse regole di chess.js:
+        disambiguazione minima, '=' per la promozione, '+' e '#'.
+        `candidates` sono le mosse legali dello stesso tipo di pezzo verso la stessa casa, se già note.
+        """
+        origin, target, promotion = move
+        piece = self.board[origin].lower()
+        capture = self.board[target] is not None or (piece == 'p' and target == self.ep)
+        if piece == 'k' and abs(target - origin) == 2:
+            text = 'O-O' if target > origin else 'O-O-O'
+        elif piece == 'p':
+            text = (FILES[origin & 7] + 'x' if capture else '') + square_name(target)
+            if promotion:
+                text += '=' + promotion.upper()
+        else:
+            if candidates is None:
+                candidates = [m for m in self.pseudo_moves()
+                              if m[1] == target and self.board[m[0]].lower() == piece and self.is_legal(m)]
+            others = [m[0] for m in candidates if m[0] != origin]
+            text = piece.upper()
+            if others:
+                same_file = any(o & 7 == origin & 7 for o in others)
+                same_rank = any(o >> 4 == origin >> 4 for o in others)
+                if same_file and same_rank:
+                    text += square_name(origin)
+                elif same_file:
+                    text += square_name(origin)[1]
+                else:
+                    text += FILES[origin & 7]
+            text += ('x' if capture else '') + square_name(target)
+
+        after = self.push(move)
+        if after.in_check():
+            text += '#' if not after.has_legal_move() else '+'
+        return text
+
+    def parse_san(self, text):
+        """
+        Trova la mossa legale scritta in SAN (anche senza '+'/'#', con 0-0, in forma
+        lunga come e2-e4 o UCI come e7e8q). Restituisce (mossa, SAN canonica);
+        solleva ValueError se la mossa non è valida, illegale o ambigua.
+        """
+        token = _SAN_SUFFIX.sub('', (text or '').strip())
+        if token.replace('0', 'O').upper() in ('O-O', 'O-O-O'):
+            long_side = token.count('-') == 2
+            right = ('Q' if long_side else 'K') if self.turn == WHITE else ('q' if long_side else 'k')
+            king, _, king_to, _, _ = _CASTLING_SQUARES[right]
+            move = (king, king_to, None)
+            if self.board[king] == ('K' if self.turn == WHITE else 'k') and any(
+                    m == move for m in self._castling_moves()) and self.is_legal(move):
+                return move, self.san(move)
+            raise ValueError(f"arrocco '{text}' non consentito")
+
+        match = _SAN.match(token)
+        if not match:
+            raise ValueError(f"notazione '{text}' non valida")
+        piece, from_file, from_rank, target_name, promotion = match.groups()
+        piece = (piece or 'P').lower()
+        target = parse_square(target_name)
+        promotion = promotion.lower() if promotion else None
+
+        # Prima si filtra per pezzo e casa d'arrivo, poi si verifica la legalità (la parte costosa)
+        board = self.board
+        candidates = [m for m in self.pseudo_moves()
+                      if m[1] == target and board[m[0]].lower() == piece and self.is_legal(m)]
+        matches = [m for m in candidates
+                   if (from_file is None or FILES[m[0] & 7] == from_file)
+                   and (from_rank is None or str((m[0] >> 4) + 1) == from_rank)
+                   and m[2] == (promotion if piece == 'p' else None)]
+        if not matches:
+            if piece == 'p' and promotion is None and any(m[2] for m in candidates):
+                raise ValueError(f"'{text}': manca il pezzo della promozione")
+            raise ValueError(f"mossa '{text}' illegale")
+        if len(matches) > 1:
+            raise ValueError(f"mossa '{text}' ambigua")
+        move = matches[0]
+        return move, self.san(move, candidates)
+
+
+def parse_fen(fen):
+    """
+    Posizione da un FEN. Solleva ValueError se la disposizione non è valida,
+    se manca un re o se il giocatore che non ha il tratto è sotto scacco.
+    I diritti di arrocco senza re e torre sulle case iniziali vengono ignorati.
+    """
+    fields = (fen or '').split()
+    if not fields:
+        raise ValueError("FEN vuoto")
+    ranks = fields[0].split('/')
+    if len(ranks) != 8:
+        raise ValueError("il FEN deve avere 8 traverse")
+    board = [None] * 128
+    kings = {}
+    for index, rank_text in enumerate(ranks):
+        rank = 7 - index
+        file = 0
+        for char in rank_text:
+            if char.isdigit():
+                file += int(char)
+            elif char in 'PNBRQKpnbrqk' and file < 8:
+                if char in 'Pp' and rank in (0, 7):
+                    raise ValueError("pedone sulla prima o sull'ottava traversa")
+                board[rank * 16 + file] = char
+                if char in 'Kk':
+                    color = WHITE if char == 'K' else BLACK
+                    if color in kings:
+                        raise ValueError("più di un re dello stesso colore")
+                    kings[color] = rank * 16 + file
+                file += 1
+            else:
+                raise ValueError(f"traversa '{rank_text}' non valida")
+        if file != 8:
+            raise ValueError(f"traversa '{rank_text}' non valida")
+    if len(kings) != 2:
+        raise ValueError("manca un re")
+
+    turn = fields[1] if len(fields) > 1 else WHITE
+    if turn not in (WHITE, BLACK):
+        raise ValueError(f"lato al tratto '{turn}' non valido")
+    castling = ''
+    for right in (fields[2] if len(fields) > 2 else '-'):
+        if right in _CASTLING_SQUARES:
+            king, rook, _, _, _ = _CASTLING_SQUARES[right]
+            king_piece, rook_piece = ('K', 'R') if right.isupper() else ('k', 'r')
+            if board[king] == king_piece and board[rook] == rook_piece:
+                castling += right
+    ep = None
+    if len(fields) > 3 and fields[3] != '-':
+        if not re.match(r'^[a-h][36]$', fields[3]):
+            raise ValueError(f"casa en passant '{fields[3]}' non valida")
+        ep = parse_square(fields[3])
+        # Valida solo se dietro c'è il pedone avversario appena avanzato di due case
+        behind, pawn = (ep - 16, 'p') if turn == WHITE else (ep + 16, 'P')
+        if ep >> 4 != (5 if turn == WHITE else 2) or board[ep] is not None or board[behind] != pawn:
+            ep = None
+    try:
+        halfmove = int(fields[4]) if len(fields) > 4 else 0
+        fullmove = int(fields[5]) if len(fields) > 5 else 1
+    except ValueError:
+        raise ValueError("contatori delle mosse non validi")
+
+    position = Position(board, turn, castling, ep, halfmove, max(1, fullmove), kings)
+    if position.in_check(BLACK if turn == WHITE else WHITE):
+        raise ValueError("il giocatore senza il tratto è sotto scacco")
+    return position
+
+
+# ----------------------------------------------------------------------
+# VALIDAZIONE DELLE SOLUZIONI
+# ----------------------------------------------------------------------
+
+def validate_solution(fen, moves):
+    """
+    Rigioca la soluzione dalla posizione e restituisce
+    {'solution_moves': SAN canoniche, 'solution_uci': mosse UCI, 'solution_fens': FEN dopo ogni semimossa}.
+    Solleva ValueError (con il numero della semimossa) se il FEN o una mossa non sono validi.
+    """
+    try:
+        position = parse_fen(fen)
+    except ValueError as e:
+        raise ValueError(f"FEN non valido: {e}")
+    if not moves:
+        raise ValueError("soluzione vuota")
+    san, uci, fens = [], [], []
+    for ply, text in enumerate(moves, start=1):
+        try:
+            move, canonical = position.parse_san(text)
+        except ValueError as e:
+            raise ValueError(f"semimossa {ply}: {e}")
+        san.append(canonical)
+        uci.append(position.uci(move))
+        position = position.push(move)
+        fens.append(position.fen())
+    return {'solution_moves': san, 'solution_uci': uci, 'solution_fens': fens}
+
+
+def _validate_pair(pair):
+    """Lavoro di un processo del pool: (fen, mosse) -> (risultato, None) oppure (None, errore)."""
+    try:
+        return validate_solution(*pair), None
+    except ValueError as e:
+        return None, str(e)
+
+
+def open_pool(processes=None):
+    """Pool per validate_many (None = un processo per CPU). Va chiuso dal chiamante."""
+    return multiprocessing.Pool(processes)
+
+
+def validate_many(pairs, pool=None, chunksize=256):
+    """
+    Valida molte soluzioni [(fen, mosse), ...]; con `pool` il lavoro è diviso tra i processi.
+    Restituisce una lista [(risultato, errore), ...] nello stesso ordine.
+    """
+    if pool is None:
+        return [_validate_pair(pair) for pair in pairs]
+    return pool.map(_validate_pair, pairs, chunksize)
+
+
+def perft(position, depth):
+    """Numero di posizioni raggiungibili in `depth` semimosse (per verificare il generatore)."""
+    if depth == 0:
+        return 1
+    total = 0
+    for move in position.legal_moves():
+        total += 1 if depth == 1 else perft(position.push(move), depth - 1)
+    return total
+
+
+# ----------------------------------------------------------------------
+# RICALCOLO PER I PROBLEMI GIÀ PRESENTI
+# ----------------------------------------------------------------------
+
+BACKFILL_CHUNK = 5000
+
+
+def backfill(conn, pool=None, chunk=BACKFILL_CHUNK, progress=None):
+    """
+    Valida le soluzioni dei problemi senza solution_uci (inseriti prima della v10) e salva
+    SAN canoniche, mosse UCI e FEN. Un commit per blocco di id: si può interrompere e
+    riprendere. Restituisce (validati, [(id, errore), ...] dei problemi non validi).
+    """
+    cursor = conn.cursor()
+    last_id, done, invalid = 0, 0, []
+    while True:
+        cursor.execute("""
+            SELECT id, fen, solution_moves FROM problems
+            WHERE solution_uci IS NULL AND id > ? ORDER BY id LIMIT ?
+        """, (last_id, chunk))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        pairs = [(fen, json.loads(moves) if moves else []) for _, fen, moves in rows]
+        updates = []
+        for (problem_id, _, _), (result, error) in zip(rows, validate_many(pairs, pool)):
+            if error:
+                invalid.append((problem_id, error))
+                continue
+            updates.append((json.dumps(result['solution_moves']), json.dumps(result['solution_uci']),
+                            json.dumps(result['solution_fens']), problem_id))
+        try:
+            cursor.executemany("""
+                UPDATE problems SET solution_moves = ?, solution_uci = ?, solution_fens = ? WHERE id = ?
+            """, updates)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Errore durante il ricalcolo delle soluzioni: {e}")
+            raise
+        done += len(updates)
+        last_id = rows[-1][0]
+        if progress:
+            progress(done, len(invalid))
+    return done, invalid
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Validazione delle soluzioni con il generatore di mosse.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    fill = commands.add_parser('backfill', help="Valida i problemi esistenti e precalcola UCI e FEN")
+    fill.add_argument('--processes', type=int, default=None, help="Processi del pool (default: uno per CPU)")
+    check = commands.add_parser('perft', help="Conta le posizioni raggiungibili (verifica del generatore)")
+    check.add_argument('depth', type=int)
+    check.add_argument('fen', nargs='?', default='rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
+    args = parser.parse_args()
+
+    if args.command == 'perft':
+        start = time.perf_counter()
+        print(f"perft({args.depth}) = {perft(parse_fen(args.fen), args.depth)} "
+              f"in {time.perf_counter() - start:.1f}s")
+        sys.exit(0)
+
+    import db_manager
+    import update_db_schema
+
+    conn = db_manager.create_connection()
+    if conn is None:
+        sys.exit(1)
+    start = time.perf_counter()
+    with open_pool(args.processes) as pool:
+        try:
+            update_db_schema.migrate(conn)
+            done, invalid = backfill(conn, pool, progress=lambda d, i: print(f"  {d} validati, {i} non validi"))
+        finally:
+            conn.close()
+    db_manager.invalidate_problems()
+    for problem_id, error in invalid:
+        print(f"#{problem_id:<8} {error}")
+    elapsed = time.perf_counter() - start
+    print(f"Fatto: {done} soluzioni validate, {len(invalid)} non valide, in {elapsed:.1f}s "
+          f"({(done + len(invalid)) / elapsed if elapsed else 0:.0f} problemi/s).")
@@ -0,0 +1,158 @@
+import argparse
+import json
+import random
+import sqlite3
+import sys
+
+# ----------------------------------------------------------------------
+# CHIAVE CANONICA DELLA POSIZIONE (HASH ZOBRIST A 64 BIT)
+# Due FEN che differiscono solo per i contatori di mosse, per l'ordine dei
+# diritti di arrocco o per una casa en passant senza catture possibili
+# descrivono la stessa posizione e hanno la stessa chiave.
+# ----------------------------------------------------------------------
+
+PIECES = 'PNBRQKpnbrqk'
+CASTLING = 'KQkq'
+
+# Tabella fissa (seme costante): le chiavi salvate nel DB restano valide tra un avvio e l'altro
+_rng = random.Random(0x5EED_C4E55)
+_PIECE_KEYS = {piece: [_rng.getrandbits(64) for _ in range(64)] for piece in PIECES}
+_BLACK_TO_MOVE_KEY = _rng.getrandbits(64)
+_CASTLING_KEYS = {right: _rng.getrandbits(64) for right in CASTLING}
+_EN_PASSANT_KEYS = [_rng.getrandbits(64) for _ in range(8)]
+
+
+def _parse_placement(placement):
+    """Restituisce {casa (0 = a8 ... 63 = h1): pezzo}, oppure None se la disposizione non è valida."""
+    ranks = placement.split('/')
+    if len(ranks) != 8:
+        return None
+    board = {}
+    for rank_index, rank in enumerate(ranks):
+        file_index = 0
+        for char in rank:
+            if char in '12345678':   # Non isdigit(): '²' passerebbe e int() fallirebbe
+                file_index += int(char)
+            elif char in PIECES:
+                if file_index > 7:
+                    return None
+                board[rank_index * 8 + file_index] = char
+                file_index += 1
+            else:
+                return None
+        if file_index != 8:
+            return None
+    return board
+
+
+def _en_passant_file(board, black_to_move, square):
+    """
+    Colonna della casa en passant solo se una presa è davvero possibile
+    (un pedone del lato al tratto è accanto al pedone appena avanzato).
+    """
+    if len(square) != 2 or square[0] not in 'abcdefgh' or square[1] not in '36':
+        return None
+    file_index = ord(square[0]) - ord('a')
+    # Il pedone che può prendere sta sulla 5a traversa (Bianco) o sulla 4a (Nero)
+    rank_index = 4 if black_to_move else 3
+    capturer = 'p' if black_to_move else 'P'
+    for neighbour in (file_index - 1, file_index + 1):
+        if 0 <= neighbour < 8 and board.get(rank_index * 8 + neighbour) == capturer:
+            return file_index
+    return None
+
+
+def position_key(fen):
+    """
+    Hash Zobrist a 64 bit di disposizione, lato al tratto, arrocchi ed en passant
+    (i contatori di mosse sono ignorati). Restituisce un intero con segno, come
+    lo salva SQLite, oppure None se il FEN non è valido.
+    """
+    fields = (fen or '').split()
+    if not fields:
+        return None
+    board = _parse_placement(fields[0])
+    if board is None:
+        return None
+    black_to_move = len(fields) > 1 and fields[1] == 'b'
+    castling = fields[2] if len(fields) > 2 else '-'
+    en_passant = fields[3] if len(fields) > 3 else '-'
+
+    key = 0
+    for square, piece in board.items():
+        key ^= _PIECE_KEYS[piece][square]
+    if black_to_move:
+        key ^= _BLACK_TO_MOVE_KEY
+    for right in set(castling) & set(CASTLING):
+        key ^= _CASTLING_KEYS[right]
+    ep_file = _en_passant_file(board, black_to_move, en_passant)
+    if ep_file is not None:
+        key ^= _EN_PASSANT_KEYS[ep_file]
+
+    # INTEGER di SQLite è a 64 bit con segno
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+# ----------------------------------------------------------------------
+# RAPPORTO SUI DUPLICATI
+# ----------------------------------------------------------------------
+
+def find_duplicate_clusters(conn, custom_list=None):
+    """
+    Gruppi di problemi con la stessa posizione: [{'position_key', 'problems': [...]}, ...].
+    Il raggruppamento legge solo l'indice idx_problems_position_key.
+    """
+    where = "position_key IS NOT NULL"
+    params = ()
+    if custom_list:
+        where += " AND custom_list = ?"
+        params = (custom_list,)
+    sql = f"SELECT position_key FROM problems WHERE {where} GROUP BY position_key HAVING COUNT(*) > 1"
+
+    try:
+        cursor = conn.cursor()
+        keys = [row[0] for row in cursor.execute(sql, params).fetchall()]
+        clusters = []
+        for key in keys:
+            cursor.execute(f"""
+                SELECT id, fen, tags, custom_list,
+                       (SELECT COUNT(*) FROM user_problem_state s WHERE s.problem_id = problems.id) AS learners
+                FROM problems WHERE position_key = ? AND {where} ORDER BY id
+            """, (key,) + params)
+            problems = [dict(row) for row in cursor.fetchall()]
+            for p in problems:
+                p['tags'] = json.loads(p['tags']) if p['tags'] else []
+            clusters.append({'position_key': key, 'problems': problems})
+        return clusters
+    except sqlite3.Error as e:
+        print(f"Errore durante la ricerca dei duplicati: {e}")
+        return []
+
+
+if __name__ == '__main__':
+    import db_manager
+
+    parser = argparse.ArgumentParser(description="Elenca i gruppi di problemi con la stessa posizione.")
+    parser.add_argument('--list', dest='custom_list', help="Cerca i duplicati solo in questa lista")
+    parser.add_argument('--json', action='store_true', help="Stampa il risultato in JSON")
+    args = parser.parse_args()
+
+    conn = db_manager.create_connection()
+    if conn is None:
+        sys.exit(1)
+    try:
+        clusters = find_duplicate_clusters(conn, args.custom_list)
+    finally:
+        conn.close()
+
+    if args.json:
+        print(json.dumps(clusters, ensure_ascii=False))
+    else:
+        extra = sum(len(c['problems']) - 1 for c in clusters)
+        for cluster in clusters:
+            first = cluster['problems'][0]
+            print(f"{first['fen']}  ({len(cluster['problems'])} copie)")
+            for p in cluster['problems']:
+                print(f"    #{p['id']:<8} lista: {p['custom_list'] or '-':<20} "
+                      f"utenti: {p['learners']:<4} tag: {', '.join(p['tags'])}")
+        print(f"{len(clusters)} posizioni duplicate, {extra} problemi in più del necessario.")
@@ -0,0 +1,277 @@
+import argparse
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import db_manager
+
+# ----------------------------------------------------------------------
+# SCHEDULER SM-2 VETTORIALE
+# Le stesse regole di db_manager.calculate_sm2, applicate con NumPy a interi
+# array di ease_factor / interval_days / review_count / next_review, per
+# ricalcolare o ridistribuire la pianificazione di un utente in una sola
+# transazione.
+# ----------------------------------------------------------------------
+
+SECONDS_PER_DAY = 86400
+FETCH_SIZE = 50000
+
+STATE_COLUMNS = ('id', 'ease_factor', 'interval_days', 'review_count', 'next_review', 'last_reviewed')
+# Le stesse colonne in user_problem_state (l'id del problema è problem_id)
+_STATE_SELECT = "problem_id, ease_factor, interval_days, review_count, next_review, last_reviewed"
+
+
+def sm2_batch(quality, ease_factor, interval_days, review_count):
+    """
+    Versione vettoriale di calculate_sm2: accetta array (o scalari) e restituisce
+    (new_interval, new_ease_factor, new_review_count) come array, con gli stessi
+    risultati della funzione scalare (stesso ordine delle operazioni in virgola
+    mobile e arrotondamento "half to even" come round()).
+    """
+    quality = np.asarray(quality, dtype=np.int64)
+    ease_factor = np.asarray(ease_factor, dtype=np.float64)
+    interval_days = np.asarray(interval_days, dtype=np.int64)
+    review_count = np.asarray(review_count, dtype=np.int64)
+
+    miss = 5 - quality
+    new_ease = ease_factor + (0.1 - miss * (0.08 + miss * 0.02))
+    new_ease = np.maximum(1.3, new_ease)
+
+    correct = quality >= 3
+    grown = np.rint(interval_days * new_ease).astype(np.int64)
+    new_interval = np.where(review_count == 0, db_manager.FIRST_INTERVAL,
+                            np.where(review_count == 1, db_manager.SECOND_INTERVAL, grown))
+    new_interval = np.where(correct, new_interval, 0)
+    new_count = np.where(correct, review_count + 1, 0)
+    return new_interval, new_ease, new_count
+
+
+def next_review_timestamps(intervals, current_time=None):
+    """
+    Calcola next_review come update_problem_review (ora locale + timedelta(days)),
+    una volta per ogni intervallo distinto: gli intervalli diversi sono pochi.
+    """
+    if current_time is None:
+        current_time = datetime.now()
+    intervals = np.asarray(intervals, dtype=np.int64)
+    unique, inverse = np.unique(intervals, return_inverse=True)
+    timestamps = np.array([
+        (current_time if days == 0 else current_time + timedelta(days=int(days))).timestamp()
+        for days in unique
+    ], dtype=np.float64)
+    return timestamps[inverse] if len(unique) else np.empty(0, dtype=np.float64)
+
+
+# ----------------------------------------------------------------------
+# LETTURA / SCRITTURA DELLO STATO
+# ----------------------------------------------------------------------
+
+def load_state(conn, user_id, custom_list=None):
+    """
+    Legge lo stato SM-2 dei problemi già iniziati dall'utente (tutti o di una lista)
+    in un dizionario di array. I problemi nuovi non hanno stato e non compaiono.
+    """
+    where = " WHERE user_id = ?"
+    params = (user_id,)
+    if custom_list:
+        where += " AND list_name = ?"
+        params += (custom_list,)
+
+    cursor = conn.cursor()
+    cursor.row_factory = None  # Tuple semplici: più veloci da convertire in array
+    total = cursor.execute("SELECT COUNT(*) FROM user_problem_state" + where, params).fetchone()[0]
+
+    state = {
+        'id': np.empty(total, dtype=np.int64),
+        'ease_factor': np.empty(total, dtype=np.float64),
+        'interval_days': np.empty(total, dtype=np.int64),
+        'review_count': np.empty(total, dtype=np.int64),
+        'next_review': np.empty(total, dtype=np.float64),
+        'last_reviewed': np.empty(total, dtype=np.float64),
+    }
+    cursor.execute(f"SELECT {_STATE_SELECT} FROM user_problem_state{where} ORDER BY problem_id", params)
+    start = 0
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        # Le righe aggiunte dopo il COUNT(*) vengono ignorate
+        rows = rows[:total - start]
+        if not rows:
+            break
+        chunk = np.array(rows, dtype=np.float64)  # None (last_reviewed) -> nan
+        end = start + len(rows)
+        for i, column in enumerate(STATE_COLUMNS):
+            state[column][start:end] = chunk[:, i]
+        start = end
+    if start < total:
+        for column in STATE_COLUMNS:
+            state[column] = state[column][:start]
+    return state
+
+
+def write_state(conn, user_id, state, mask=None):
+    """
+    Scrive lo stato dell'utente (solo le righe selezionate da `mask`) in un'unica
+    transazione. Restituisce il numero di righe aggiornate.
+    """
+    if mask is None:
+        mask = np.ones(len(state['id']), dtype=bool)
+    last_reviewed = [None if np.isnan(v) else v for v in state['last_reviewed'][mask].tolist()]
+    rows = zip(
+        state['next_review'][mask].tolist(),
+        state['ease_factor'][mask].tolist(),
+        state['interval_days'][mask].tolist(),
+        state['review_count'][mask].tolist(),
+        last_reviewed,
+        [user_id] * int(mask.sum()),
+        state['id'][mask].tolist(),
+    )
+    sql = """
+    UPDATE user_problem_state
+    SET next_review = ?, ease_factor = ?, interval_days = ?, review_count = ?, last_reviewed = ?
+    WHERE user_id = ? AND problem_id = ?
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.executemany(sql, rows)
+        conn.commit()
+        return int(mask.sum())
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Errore durante il salvataggio della pianificazione: {e}")
+        return 0
+
+
+# ----------------------------------------------------------------------
+# OPERAZIONI IN BLOCCO (restituiscono la maschera delle righe modificate)
+# ----------------------------------------------------------------------
+
+def apply_ratings(state, quality, current_time=None):
+    """Applica una valutazione (scalare o array di q) a tutti i problemi, come update_problem_review."""
+    if current_time is None:
+        current_time = datetime.now()
+    new_interval, new_ease, new_count = sm2_batch(
+        quality, state['ease_factor'], state['interval_days'], state['review_count'])
+    state['interval_days'] = new_interval
+    state['ease_factor'] = new_ease
+    state['review_count'] = new_count
+    state['next_review'] = next_review_timestamps(new_interval, current_time)
+    state['last_reviewed'] = np.full(len(state['id']), current_time.timestamp())
+    return np.ones(len(state['id']), dtype=bool)
+
+
+def spread_overdue(state, days, current_time=None):
+    """
+    Distribuisce i problemi scaduti in modo uniforme sui prossimi `days` giorni,
+    mantenendo l'ordine (i più arretrati restano i primi, già oggi).
+    """
+    now_ts = (current_time or datetime.now()).timestamp()
+    overdue = np.flatnonzero(state['next_review'] <= now_ts)
+    if len(overdue) == 0 or days <= 1:
+        return np.zeros(len(state['id']), dtype=bool)
+
+    order = overdue[np.argsort(state['next_review'][overdue], kind='stable')]
+    day_offset = (np.arange(len(order)) * days) // len(order)
+    state['next_review'][order] = now_ts + day_offset * SECONDS_PER_DAY
+
+    mask = np.zeros(len(state['id']), dtype=bool)
+    mask[order[day_offset > 0]] = True
+    return mask
+
+
+def shift_backlog(state, days, only_overdue=False, current_time=None):
+    """Sposta in avanti di `days` giorni le scadenze (es. dopo una vacanza)."""
+    mask = np.ones(len(state['id']), dtype=bool)
+    if only_overdue:
+        mask = state['next_review'] <= (current_time or datetime.now()).timestamp()
+    state['next_review'][mask] += days * SECONDS_PER_DAY
+    return mask
+
+
+def rescale_intervals(state, factor):
+    """
+    Moltiplica per `factor` gli intervalli dei problemi già maturi (review_count >= 2)
+    e ricalcola next_review a partire dall'ultima revisione.
+    """
+    mask = (state['review_count'] >= 2) & ~np.isnan(state['last_reviewed'])
+    new_interval = np.maximum(1, np.rint(state['interval_days'][mask] * factor)).astype(np.int64)
+    state['interval_days'][mask] = new_interval
+    state['next_review'][mask] = state['last_reviewed'][mask] + new_interval * SECONDS_PER_DAY
+    return mask
+
+
+def verify_against_scalar(size=100000, seed=0):
+    """Controlla che sm2_batch dia esattamente gli stessi risultati di calculate_sm2."""
+    rng = np.random.default_rng(seed)
+    quality = rng.choice([db_manager.Q_WRONG, db_manager.Q_DIFFICULT, db_manager.Q_MEDIUM, db_manager.Q_EASY], size)
+    ease = rng.uniform(1.3, 3.0, size)
+    interval = rng.integers(0, 400, size)
+    count = rng.integers(0, 12, size)
+
+    new_interval, new_ease, new_count = sm2_batch(quality, ease, interval, count)
+    for i in range(size):
+        expected = db_manager.calculate_sm2(int(quality[i]), float(ease[i]), int(interval[i]), int(count[i]))
+        if (int(new_interval[i]), float(new_ease[i]), int(new_count[i])) != expected:
+            print(f"Differenza alla riga {i}: {expected} != "
+                  f"{(int(new_interval[i]), float(new_ease[i]), int(new_count[i]))}")
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ripianificazione SM-2 in blocco.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    # Opzioni comuni alle operazioni che modificano il DB
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--user', type=int, default=db_manager.DEFAULT_USER_ID,
+                        help="ID dell'utente di cui ripianificare i ripassi (default: %(default)s)")
+    common.add_argument('--list', dest='custom_list', help="Limita l'operazione a una lista")
+    common.add_argument('--dry-run', action='store_true', help="Calcola senza salvare")
+
+    spread = commands.add_parser('spread', parents=[common], help="Distribuisce gli arretrati su N giorni")
+    spread.add_argument('--days', type=int, required=True)
+
+    shift = commands.add_parser('shift', parents=[common], help="Sposta in avanti le scadenze di N giorni")
+    shift.add_argument('--days', type=int, required=True)
+    shift.add_argument('--only-overdue', action='store_true')
+
+    rescale = commands.add_parser('rescale', parents=[common], help="Moltiplica gli intervalli maturi per un fattore")
+    rescale.add_argument('--factor', type=float, required=True)
+
+    apply = commands.add_parser('apply', parents=[common], help="Applica la stessa valutazione a tutti i problemi")
+    apply.add_argument('--rating', choices=list(db_manager.RATING_MAP), required=True)
+
+    verify = commands.add_parser('verify', help="Confronta sm2_batch con calculate_sm2")
+    verify.add_argument('--size', type=int, default=100000)
+
+    args = parser.parse_args()
+
+    if args.command == 'verify':
+        ok = verify_against_scalar(args.size)
+        print("OK: risultati identici a calculate_sm2." if ok else "ERRORE: risultati diversi.")
+        sys.exit(0 if ok else 1)
+
+    conn = db_manager.create_connection()
+    if conn is None:
+        sys.exit(1)
+    try:
+        state = load_state(conn, args.user, args.custom_list)
+        if args.command == 'apply':
+            changed = apply_ratings(state, db_manager.RATING_MAP[args.rating])
+        elif args.command == 'spread':
+            changed = spread_overdue(state, args.days)
+        elif args.command == 'shift':
+            changed = shift_backlog(state, args.days, args.only_overdue)
+        else:
+            changed = rescale_intervals(state, args.factor)
+
+        print(f"{int(changed.sum())} problemi su {len(state['id'])} da aggiornare.")
+        if not args.dry_run:
+            written = write_state(conn, args.user, state, changed)
+            print(f"{written} problemi aggiornati in un'unica transazione.")
+    finally:
+        conn.close()
@@ -0,0 +1,111 @@
+import hashlib
+from functools import lru_cache
+
+# ----------------------------------------------------------------------
+# MINIATURE SVG DELLE POSIZIONI
+# Una miniatura dipende solo dalla disposizione dei pezzi (primo campo del FEN):
+# la usiamo come chiave del cache e come parte dell'URL, quindi lo stesso
+# URL restituisce sempre la stessa immagine e il browser può tenerla per sempre.
+# ----------------------------------------------------------------------
+
+SQUARE_SIZE = 20          # Lato di una casa in unità SVG (scacchiera 160x160)
+LIGHT_SQUARE = "#f0d9b5"  # Stessi colori di chessboard-1.0.0.css
+DARK_SQUARE = "#b58863"
+THUMB_CACHE_SIZE = 4096   # Numero massimo di miniature tenute in memoria (LRU)
+
+# Usiamo i glifi "pieni" per entrambi i colori e cambiamo solo il riempimento
+PIECE_GLYPHS = {
+    'k': '♚', 'q': '♛', 'r': '♜',
+    'b': '♝', 'n': '♞', 'p': '♟',
+}
+
+
+def placement_from_fen(fen):
+    """Restituisce la disposizione dei pezzi (primo campo) di un FEN."""
+    return fen.split()[0] if fen else ""
+
+
+def thumbnail_key(fen):
+    """Chiave usata nell'URL: la disposizione dei pezzi con '/' sostituito da '-'."""
+    return placement_from_fen(fen).replace('/', '-')
+
+
+def placement_from_key(key):
+    """Chiave dell'URL -> disposizione; None se contiene caratteri non ASCII."""
+    if not key.isascii():
+        return None
+    return key.replace('-', '/')
+
+
+def is_valid_placement(placement):
+    """Controlla che la disposizione abbia 8 traverse da 8 case ciascuna."""
+    if not placement:
+        return False
+    ranks = placement.split('/')
+    if len(ranks) != 8:
+        return False
+    for rank in ranks:
+        width = 0
+        for char in rank:
+            if char in '12345678':   # Non isdigit(): accetta anche '²' e simili
+                width += int(char)
+            elif char.lower() in PIECE_GLYPHS:
+                width += 1
+            else:
+                return False
+        if width != 8:
+            return False
+    return True
+
+
+def render_svg(placement):
+    """Disegna la scacchiera come SVG compatto (case + glifi Unicode dei pezzi)."""
+    board_size = SQUARE_SIZE * 8
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {board_size} {board_size}" '
+        f'width="{board_size}" height="{board_size}">',
+        # Sfondo chiaro + solo le case scure: metà degli elementi
+        f'<rect width="{board_size}" height="{board_size}" fill="{LIGHT_SQUARE}"/>',
+    ]
+    for row in range(8):
+        for col in range(8):
+            if (row + col) % 2 == 1:
+                parts.append(f'<rect x="{col * SQUARE_SIZE}" y="{row * SQUARE_SIZE}" '
+                             f'width="{SQUARE_SIZE}" height="{SQUARE_SIZE}" fill="{DARK_SQUARE}"/>')
+
+    parts.append(f'<g font-size="{SQUARE_SIZE - 2}" text-anchor="middle" '
+                 f'font-family="DejaVu Sans, Segoe UI Symbol, sans-serif">')
+    for row, rank in enumerate(placement.split('/')):
+        col = 0
+        for char in rank:
+            if char.isdigit():
+                col += int(char)
+                continue
+            x = col * SQUARE_SIZE + SQUARE_SIZE // 2
+            y = row * SQUARE_SIZE + SQUARE_SIZE - 4
+            if char.isupper():
+                style = 'fill="#fff" stroke="#000" stroke-width="0.8"'
+            else:
+                style = 'fill="#000"'
+            parts.append(f'<text x="{x}" y="{y}" {style}>{PIECE_GLYPHS[char.lower()]}</text>')
+            col += 1
+    parts.append('</g></svg>')
+    return ''.join(parts)
+
+
+@lru_cache(maxsize=THUMB_CACHE_SIZE)
+def get_thumbnail(placement):
+    """
+    Restituisce (svg in bytes, etag) per una disposizione valida.
+    Il risultato resta nel cache LRU: le miniature più usate non vengono ridisegnate.
+    """
+    svg = render_svg(placement).encode('utf-8')
+    etag = hashlib.sha1(svg).hexdigest()[:20]
+    return svg, etag
+
+
+def get_cache_stats():
+    """Statistiche del cache LRU delle miniature."""
+    info = get_thumbnail.cache_info()
+    return {'hits': info.hits, 'misses': info.misses,
+            'size': info.currsize, 'max_size': info.maxsize}
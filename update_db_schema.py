@@ -1,20 +1,815 @@
+import contextlib
+import io
+import os
+import shutil
 import sqlite3
+import sys
+import tempfile
 
-DB_NAME = 'chess_tutor.db'
+import db_manager
+import positions
+
+# ----------------------------------------------------------------------
+# MIGRAZIONI VERSIONATE DELLO SCHEMA
+# La versione applicata è salvata in PRAGMA user_version: all'avvio si
+# eseguono solo le migrazioni mancanti, quindi un DB già aggiornato costa
+# una sola lettura.
+# ----------------------------------------------------------------------
+
+def _column_names(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def _create_problems_table(cursor):
+    """v1: tabella base 'problems' (come il vecchio db_setup.setup_database)."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS problems (
+        id INTEGER PRIMARY KEY,
+        fen TEXT NOT NULL,
+        solution_moves TEXT,
+        tags TEXT,
+        last_reviewed REAL,
+        next_review REAL NOT NULL,
+        ease_factor REAL NOT NULL,
+        interval_days INTEGER NOT NULL,
+        review_count INTEGER NOT NULL
+    )
+    """)
+
+
+def _add_metadata_columns(cursor):
+    """v2: dati storici e lista personalizzata (sostituisce add_list_column)."""
+    new_columns = [
+        ("white_player", "TEXT"),
+        ("black_player", "TEXT"),
+        ("game_year", "INTEGER"),
+        ("tournament", "TEXT"),
+        ("winner", "INTEGER"),
+        ("custom_list", "TEXT"),
+    ]
+    # I DB creati a mano possono avere già alcune colonne
+    existing = _column_names(cursor, "problems")
+    for name, col_type in new_columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE problems ADD COLUMN {name} {col_type}")
+
+
+def _add_review_indexes(cursor):
+    """v3: indici per la coda di revisione e per l'elenco delle liste."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problems_next_review ON problems(next_review)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problems_list_next_review ON problems(custom_list, next_review)")
+
+
+def _add_review_log(cursor):
+    """v4: storico append-only delle revisioni e riepiloghi giornalieri."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS review_log (
+        id INTEGER PRIMARY KEY,
+        problem_id INTEGER NOT NULL,
+        reviewed_at REAL NOT NULL,
+        rating TEXT NOT NULL,
+        quality INTEGER NOT NULL,
+        prev_ease_factor REAL,
+        prev_interval_days INTEGER,
+        prev_review_count INTEGER,
+        prev_next_review REAL,
+        new_ease_factor REAL NOT NULL,
+        new_interval_days INTEGER NOT NULL,
+        new_review_count INTEGER NOT NULL,
+        new_next_review REAL NOT NULL,
+        time_to_answer_ms INTEGER,
+        custom_list TEXT
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_log_problem ON review_log(problem_id, reviewed_at)")
+
+    # Una riga per (giorno, lista): aggiornata nella stessa transazione della valutazione
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS review_rollup_daily (
+        day TEXT NOT NULL,
+        custom_list TEXT NOT NULL DEFAULT '',
+        reviews INTEGER NOT NULL DEFAULT 0,
+        correct INTEGER NOT NULL DEFAULT 0,
+        n_wrong INTEGER NOT NULL DEFAULT 0,
+        n_difficult INTEGER NOT NULL DEFAULT 0,
+        n_medium INTEGER NOT NULL DEFAULT 0,
+        n_easy INTEGER NOT NULL DEFAULT 0,
+        recall_reviews INTEGER NOT NULL DEFAULT 0,
+        recall_correct INTEGER NOT NULL DEFAULT 0,
+        timed_reviews INTEGER NOT NULL DEFAULT 0,
+        total_time_ms INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, custom_list)
+    ) WITHOUT ROWID
+    """)
+
+
+def _add_tag_index(cursor):
+    """
+    v5: indice invertito dei tag (tags / problem_tags). I trigger lo tengono
+    allineato alla colonna JSON problems.tags per ogni INSERT / UPDATE / DELETE,
+    quindi vale anche per l'importazione in blocco.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS tags (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    """)
+    # PK (tag_id, problem_id): "problemi con questo tag"; l'indice inverso serve ai conteggi per tag
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS problem_tags (
+        tag_id INTEGER NOT NULL,
+        problem_id INTEGER NOT NULL,
+        PRIMARY KEY (tag_id, problem_id)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problem_tags_problem ON problem_tags(problem_id, tag_id)")
+
+    # Corpo comune ai trigger: aggiunge i tag di NEW
+    add_new_tags = """
+        INSERT OR IGNORE INTO tags (name)
+            SELECT value FROM json_each(CASE WHEN json_valid(NEW.tags) THEN NEW.tags ELSE '[]' END)
+            WHERE type = 'text' AND value != '';
+        INSERT OR IGNORE INTO problem_tags (tag_id, problem_id)
+            SELECT tags.id, NEW.id FROM json_each(CASE WHEN json_valid(NEW.tags) THEN NEW.tags ELSE '[]' END) AS j
+            JOIN tags ON tags.name = j.value;
+    """
+    # Toglie i legami di OLD e i tag rimasti senza problemi
+    remove_old_tags = """
+        DELETE FROM problem_tags WHERE problem_id = OLD.id;
+        DELETE FROM tags
+            WHERE name IN (SELECT value FROM json_each(CASE WHEN json_valid(OLD.tags) THEN OLD.tags ELSE '[]' END))
+            AND NOT EXISTS (SELECT 1 FROM problem_tags WHERE problem_tags.tag_id = tags.id);
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_tags_insert AFTER INSERT ON problems BEGIN
+        {add_new_tags}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_tags_update AFTER UPDATE OF tags ON problems
+    WHEN OLD.tags IS NOT NEW.tags BEGIN
+        {remove_old_tags}
+        {add_new_tags}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_tags_delete AFTER DELETE ON problems BEGIN
+        {remove_old_tags}
+    END
+    """)
+
+    # Popola l'indice con i problemi già presenti
+    cursor.execute("""
+    INSERT OR IGNORE INTO tags (name)
+        SELECT DISTINCT j.value FROM problems, json_each(problems.tags) AS j
+        WHERE json_valid(problems.tags) AND j.type = 'text' AND j.value != ''
+    """)
+    cursor.execute("""
+    INSERT OR IGNORE INTO problem_tags (tag_id, problem_id)
+        SELECT tags.id, problems.id FROM problems, json_each(problems.tags) AS j
+        JOIN tags ON tags.name = j.value
+        WHERE json_valid(problems.tags)
+    """)
+
+
+# Colonne di problems indicizzate per la ricerca testuale
+FTS_COLUMNS = ("white_player", "black_player", "tournament", "tags", "custom_list")
+
+
+def _add_search_index(cursor):
+    """
+    v6: indice full-text FTS5 (tabella "external content": i testi restano in
+    problems, l'indice contiene solo i token) tenuto allineato dai trigger.
+    """
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"NEW.{c}" for c in FTS_COLUMNS)
+    old_values = ", ".join(f"OLD.{c}" for c in FTS_COLUMNS)
+
+    # remove_diacritics: "Réti" si trova anche cercando "reti"
+    cursor.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS problems_fts USING fts5(
+        {columns},
+        content='problems', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_fts_insert AFTER INSERT ON problems BEGIN
+        INSERT INTO problems_fts (rowid, {columns}) VALUES (NEW.id, {new_values});
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_fts_delete AFTER DELETE ON problems BEGIN
+        INSERT INTO problems_fts (problems_fts, rowid, {columns}) VALUES ('delete', OLD.id, {old_values});
+    END
+    """)
+    # Solo quando cambia un campo indicizzato: le valutazioni SM-2 non toccano l'indice
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_fts_update AFTER UPDATE OF {columns} ON problems BEGIN
+        INSERT INTO problems_fts (problems_fts, rowid, {columns}) VALUES ('delete', OLD.id, {old_values});
+        INSERT INTO problems_fts (rowid, {columns}) VALUES (NEW.id, {new_values});
+    END
+    """)
+    cursor.execute("INSERT INTO problems_fts (problems_fts) VALUES ('rebuild')")
+
+
+def _add_position_keys(cursor):
+    """
+    v7: chiave canonica della posizione (hash Zobrist, vedi positions.py)
+    calcolata in Python per i problemi esistenti, a blocchi di id.
+    """
+    if "position_key" not in _column_names(cursor, "problems"):
+        cursor.execute("ALTER TABLE problems ADD COLUMN position_key INTEGER")
+
+    last_id = 0
+    while True:
+        cursor.execute("SELECT id, fen FROM problems WHERE id > ? ORDER BY id LIMIT 10000", (last_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        cursor.executemany("UPDATE problems SET position_key = ? WHERE id = ?",
+                           [(positions.position_key(fen), problem_id) for problem_id, fen in rows])
+        last_id = rows[-1][0]
+
+    # Non UNIQUE: i duplicati già presenti restano (vedi "python positions.py")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problems_position_key ON problems(position_key)")
+
+
+# Ricostruzione del catalogo com'era alla v8 (dalla v9 vale LIST_CATALOG_REBUILD_SQL).
+# I problemi senza lista stanno sotto il nome ''.
+_LIST_CATALOG_V8_SQL = (
+    "DELETE FROM lists",
+    """INSERT INTO lists (name, total, ease_sum)
+       SELECT COALESCE(custom_list, ''), COUNT(*), SUM(ease_factor) FROM problems
+       GROUP BY COALESCE(custom_list, '')""",
+    "DELETE FROM list_due_days",
+    """INSERT INTO list_due_days (list_name, day, count)
+       SELECT COALESCE(custom_list, ''), CAST(next_review / 86400 AS INTEGER), COUNT(*) FROM problems
+       GROUP BY COALESCE(custom_list, ''), CAST(next_review / 86400 AS INTEGER)""",
+)
+
+
+def _add_list_catalog(cursor):
+    """
+    v8: catalogo delle liste con totale e somma degli ease_factor, più un
+    istogramma delle scadenze per giorno (UTC) di ogni lista. I trigger lo
+    aggiornano a ogni inserimento, valutazione, spostamento o eliminazione:
+    "quanti in scadenza ora" si ricava sommando i giorni passati, senza
+    leggere i problemi (vedi db_manager.get_list_catalog).
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS lists (
+        name TEXT PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0,
+        ease_sum REAL NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS list_due_days (
+        list_name TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (list_name, day)
+    ) WITHOUT ROWID
+    """)
+
+    add_new = """
+        INSERT INTO lists (name, total, ease_sum) VALUES (COALESCE(NEW.custom_list, ''), 1, NEW.ease_factor)
+            ON CONFLICT (name) DO UPDATE SET total = total + 1, ease_sum = ease_sum + excluded.ease_sum;
+        INSERT INTO list_due_days (list_name, day, count)
+            VALUES (COALESCE(NEW.custom_list, ''), CAST(NEW.next_review / 86400 AS INTEGER), 1)
+            ON CONFLICT (list_name, day) DO UPDATE SET count = count + 1;
+    """
+    remove_old = """
+        UPDATE lists SET total = total - 1, ease_sum = ease_sum - OLD.ease_factor
+            WHERE name = COALESCE(OLD.custom_list, '');
+        DELETE FROM lists WHERE name = COALESCE(OLD.custom_list, '') AND total <= 0;
+        UPDATE list_due_days SET count = count - 1
+            WHERE list_name = COALESCE(OLD.custom_list, '') AND day = CAST(OLD.next_review / 86400 AS INTEGER);
+        DELETE FROM list_due_days
+            WHERE list_name = COALESCE(OLD.custom_list, '') AND day = CAST(OLD.next_review / 86400 AS INTEGER)
+            AND count <= 0;
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_lists_insert AFTER INSERT ON problems BEGIN
+        {add_new}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_lists_delete AFTER DELETE ON problems BEGIN
+        {remove_old}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_lists_update
+    AFTER UPDATE OF custom_list, next_review, ease_factor ON problems
+    WHEN OLD.custom_list IS NOT NEW.custom_list
+      OR OLD.next_review IS NOT NEW.next_review
+      OR OLD.ease_factor IS NOT NEW.ease_factor
+    BEGIN
+        {remove_old}
+        {add_new}
+    END
+    """)
+    for sql in _LIST_CATALOG_V8_SQL:
+        cursor.execute(sql)
+
+
+# Ricostruzione completa del catalogo delle liste (migrazione v9 e --rebuild-lists):
+# totali per lista, più problemi iniziati, somma degli ease e istogramma delle
+# scadenze per (utente, lista). I problemi senza lista stanno sotto il nome ''.
+LIST_CATALOG_REBUILD_SQL = (
+    """UPDATE user_problem_state
+       SET list_name = (SELECT COALESCE(p.custom_list, '') FROM problems p WHERE p.id = problem_id)
+       WHERE list_name IS NOT (SELECT COALESCE(p.custom_list, '') FROM problems p WHERE p.id = problem_id)""",
+    "DELETE FROM lists",
+    """INSERT INTO lists (name, total)
+       SELECT COALESCE(custom_list, ''), COUNT(*) FROM problems
+       GROUP BY COALESCE(custom_list, '')""",
+    "DELETE FROM user_list_stats",
+    """INSERT INTO user_list_stats (user_id, list_name, started, ease_sum)
+       SELECT user_id, list_name, COUNT(*), SUM(ease_factor) FROM user_problem_state
+       GROUP BY user_id, list_name""",
+    "DELETE FROM user_list_due_days",
+    """INSERT INTO user_list_due_days (user_id, list_name, day, count)
+       SELECT user_id, list_name, CAST(next_review / 86400 AS INTEGER), COUNT(*) FROM user_problem_state
+       GROUP BY user_id, list_name, CAST(next_review / 86400 AS INTEGER)""",
+)
+
+
+def _add_user_state(cursor):
+    """
+    v9: utenti e stato SM-2 per utente. La pianificazione passa da problems a
+    user_problem_state, che ha una riga solo per i problemi che l'utente ha già
+    valutato: gli altri sono "nuovi" per lui, quindi un utente che si aggiunge
+    a una banca di 200k problemi non scrive nulla finché non inizia a ripassare.
+    Lo stato esistente passa all'utente 1 e le colonne SM-2 escono da problems.
+    users.new_frontier: tutti i problemi con id <= new_frontier sono già iniziati
+    (la ricerca dei nuovi parte da lì, vedi db_manager.get_review_queue_ids).
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL,
+        email TEXT,
+        created_at REAL NOT NULL,
+        new_frontier INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    # list_name è una copia di problems.custom_list ('' = senza lista): anche la
+    # coda filtrata per lista si legge in ordine da un indice
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS user_problem_state (
+        user_id INTEGER NOT NULL,
+        problem_id INTEGER NOT NULL,
+        list_name TEXT NOT NULL DEFAULT '',
+        last_reviewed REAL,
+        next_review REAL NOT NULL,
+        ease_factor REAL NOT NULL,
+        interval_days INTEGER NOT NULL,
+        review_count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, problem_id)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_state_user_next_review ON user_problem_state(user_id, next_review)")
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_state_user_list_next_review
+                      ON user_problem_state(user_id, list_name, next_review)""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_state_problem ON user_problem_state(problem_id)")
+
+    # Lo stato attuale diventa quello dell'utente 1, ma solo per i problemi già
+    # toccati: quelli mai ripassati (né spostati dallo scheduler) restano nuovi
+    cursor.execute("""
+    INSERT OR IGNORE INTO user_problem_state (
+        user_id, problem_id, list_name, last_reviewed, next_review, ease_factor, interval_days, review_count
+    )
+    SELECT ?, id, COALESCE(custom_list, ''), last_reviewed, next_review, ease_factor, interval_days, review_count
+    FROM problems
+    WHERE review_count != ? OR interval_days != ? OR ease_factor != ? OR next_review IS NOT last_reviewed
+    """, (db_manager.DEFAULT_USER_ID, db_manager.INITIAL_REVIEW_COUNT,
+          db_manager.INITIAL_INTERVAL, db_manager.INITIAL_EASE_FACTOR))
+
+    # --- Catalogo per utente: iniziati, somma degli ease e scadenze per giorno ---
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS user_list_stats (
+        user_id INTEGER NOT NULL,
+        list_name TEXT NOT NULL,
+        started INTEGER NOT NULL DEFAULT 0,
+        ease_sum REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, list_name)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS user_list_due_days (
+        user_id INTEGER NOT NULL,
+        list_name TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, list_name, day)
+    ) WITHOUT ROWID
+    """)
+
+    add_new = """
+        INSERT INTO user_list_stats (user_id, list_name, started, ease_sum)
+            VALUES (NEW.user_id, NEW.list_name, 1, NEW.ease_factor)
+            ON CONFLICT (user_id, list_name) DO UPDATE SET
+                started = started + 1, ease_sum = ease_sum + excluded.ease_sum;
+        INSERT INTO user_list_due_days (user_id, list_name, day, count)
+            VALUES (NEW.user_id, NEW.list_name, CAST(NEW.next_review / 86400 AS INTEGER), 1)
+            ON CONFLICT (user_id, list_name, day) DO UPDATE SET count = count + 1;
+    """
+    remove_old = """
+        UPDATE user_list_stats SET started = started - 1, ease_sum = ease_sum - OLD.ease_factor
+            WHERE user_id = OLD.user_id AND list_name = OLD.list_name;
+        DELETE FROM user_list_stats WHERE user_id = OLD.user_id AND list_name = OLD.list_name AND started <= 0;
+        UPDATE user_list_due_days SET count = count - 1
+            WHERE user_id = OLD.user_id AND list_name = OLD.list_name
+            AND day = CAST(OLD.next_review / 86400 AS INTEGER);
+        DELETE FROM user_list_due_days
+            WHERE user_id = OLD.user_id AND list_name = OLD.list_name
+            AND day = CAST(OLD.next_review / 86400 AS INTEGER) AND count <= 0;
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_state_lists_insert AFTER INSERT ON user_problem_state BEGIN
+        {add_new}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_state_lists_delete AFTER DELETE ON user_problem_state BEGIN
+        {remove_old}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_state_lists_update
+    AFTER UPDATE OF list_name, next_review, ease_factor ON user_problem_state
+    WHEN OLD.list_name IS NOT NEW.list_name
+      OR OLD.next_review IS NOT NEW.next_review
+      OR OLD.ease_factor IS NOT NEW.ease_factor
+    BEGIN
+        {remove_old}
+        {add_new}
+    END
+    """)
+
+    # --- Problemi per tag: i nuovi di un tag sono il totale meno quelli iniziati ---
+    if "problem_count" not in _column_names(cursor, "tags"):
+        cursor.execute("ALTER TABLE tags ADD COLUMN problem_count INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_problem_tags_count_insert AFTER INSERT ON problem_tags BEGIN
+        UPDATE tags SET problem_count = problem_count + 1 WHERE id = NEW.tag_id;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_problem_tags_count_delete AFTER DELETE ON problem_tags BEGIN
+        UPDATE tags SET problem_count = problem_count - 1 WHERE id = OLD.tag_id;
+    END
+    """)
+    cursor.execute("""
+    UPDATE tags SET problem_count = (SELECT COUNT(*) FROM problem_tags pt WHERE pt.tag_id = tags.id)
+    """)
+
+    # --- Lo stato segue il problema (eliminazione e cambio di lista) ---
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_state_delete AFTER DELETE ON problems BEGIN
+        DELETE FROM user_problem_state WHERE problem_id = OLD.id;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_state_list AFTER UPDATE OF custom_list ON problems
+    WHEN COALESCE(OLD.custom_list, '') IS NOT COALESCE(NEW.custom_list, '')
+    BEGIN
+        UPDATE user_problem_state SET list_name = COALESCE(NEW.custom_list, '') WHERE problem_id = NEW.id;
+    END
+    """)
+
+    # --- Il catalogo 'lists' tiene solo i totali: le scadenze ora sono per utente ---
+    for trigger in ("trg_problems_lists_insert", "trg_problems_lists_delete", "trg_problems_lists_update"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS list_due_days")
+    if "ease_sum" in _column_names(cursor, "lists"):
+        cursor.execute("ALTER TABLE lists DROP COLUMN ease_sum")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_lists_insert AFTER INSERT ON problems BEGIN
+        INSERT INTO lists (name, total) VALUES (COALESCE(NEW.custom_list, ''), 1)
+            ON CONFLICT (name) DO UPDATE SET total = total + 1;
+    END
+    """)
+    remove_list = """
+        UPDATE lists SET total = total - 1 WHERE name = COALESCE(OLD.custom_list, '');
+        DELETE FROM lists WHERE name = COALESCE(OLD.custom_list, '') AND total <= 0;
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_lists_delete AFTER DELETE ON problems BEGIN
+        {remove_list}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_lists_update AFTER UPDATE OF custom_list ON problems
+    WHEN COALESCE(OLD.custom_list, '') IS NOT COALESCE(NEW.custom_list, '')
+    BEGIN
+        {remove_list}
+        INSERT INTO lists (name, total) VALUES (COALESCE(NEW.custom_list, ''), 1)
+            ON CONFLICT (name) DO UPDATE SET total = total + 1;
+    END
+    """)
+
+    # --- Colonne SM-2 e relativi indici fuori da problems ---
+    cursor.execute("DROP INDEX IF EXISTS idx_problems_next_review")
+    cursor.execute("DROP INDEX IF EXISTS idx_problems_list_next_review")
+    # Serve ancora per i filtri per lista (elenco, nuovi problemi di una lista)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problems_custom_list ON problems(custom_list)")
+    existing = _column_names(cursor, "problems")
+    for column in ("last_reviewed", "next_review", "ease_factor", "interval_days", "review_count"):
+        if column in existing:
+            cursor.execute(f"ALTER TABLE problems DROP COLUMN {column}")
+
+    # --- Storico e riepiloghi per utente (le righe esistenti sono dell'utente 1) ---
+    if "user_id" not in _column_names(cursor, "review_log"):
+        cursor.execute(f"ALTER TABLE review_log ADD COLUMN user_id INTEGER NOT NULL DEFAULT {db_manager.DEFAULT_USER_ID}")
+    cursor.execute("""
+    CREATE TABLE review_rollup_daily_v9 (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        custom_list TEXT NOT NULL DEFAULT '',
+        reviews INTEGER NOT NULL DEFAULT 0,
+        correct INTEGER NOT NULL DEFAULT 0,
+        n_wrong INTEGER NOT NULL DEFAULT 0,
+        n_difficult INTEGER NOT NULL DEFAULT 0,
+        n_medium INTEGER NOT NULL DEFAULT 0,
+        n_easy INTEGER NOT NULL DEFAULT 0,
+        recall_reviews INTEGER NOT NULL DEFAULT 0,
+        recall_correct INTEGER NOT NULL DEFAULT 0,
+        timed_reviews INTEGER NOT NULL DEFAULT 0,
+        total_time_ms INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, custom_list)
+    ) WITHOUT ROWID
+    """)
+    counters = ("reviews, correct, n_wrong, n_difficult, n_medium, n_easy, "
+                "recall_reviews, recall_correct, timed_reviews, total_time_ms")
+    cursor.execute(f"""
+    INSERT INTO review_rollup_daily_v9 (user_id, day, custom_list, {counters})
+    SELECT ?, day, custom_list, {counters} FROM review_rollup_daily
+    """, (db_manager.DEFAULT_USER_ID,))
+    cursor.execute("DROP TABLE review_rollup_daily")
+    cursor.execute("ALTER TABLE review_rollup_daily_v9 RENAME TO review_rollup_daily")
+
+    for sql in LIST_CATALOG_REBUILD_SQL:
+        cursor.execute(sql)
+
+
+def _add_solution_lines(cursor):
+    """
+    v10: soluzioni precalcolate dal generatore di mosse (vedi movegen.py), in JSON:
+    solution_uci (mosse UCI) e solution_fens (FEN dopo ogni semimossa).
+    Solo le colonne: validare una banca grande richiede minuti, quindi i problemi
+    esistenti restano NULL (la revisione rigioca la SAN come prima) finché non si
+    esegue "python movegen.py backfill", che usa un pool di processi.
+    """
+    existing = _column_names(cursor, "problems")
+    for column in ("solution_uci", "solution_fens"):
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE problems ADD COLUMN {column} TEXT")
+
+
+def _add_frontier_trigger(cursor):
+    """
+    v11: id di problems è un INTEGER PRIMARY KEY senza AUTOINCREMENT, quindi dopo
+    aver eliminato i problemi più recenti SQLite riusa i loro id. Un problema
+    nuovo può così nascere sotto users.new_frontier e restare invisibile nella
+    coda: il trigger abbassa la frontiera a ogni inserimento che la scavalca.
+    Le frontiere già salvate potrebbero essere sbagliate: si azzerano (la prima
+    ricarica della coda le ricalcola).
+    """
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_problems_frontier_insert AFTER INSERT ON problems BEGIN
+        UPDATE users SET new_frontier = NEW.id - 1 WHERE new_frontier >= NEW.id;
+    END
+    """)
+    cursor.execute("UPDATE users SET new_frontier = 0")
+
+
+# (versione, descrizione, funzione) - aggiungere sempre in fondo
+MIGRATIONS = [
+    (1, "Tabella problems", _create_problems_table),
+    (2, "Colonne dati storici e custom_list", _add_metadata_columns),
+    (3, "Indici coda di revisione", _add_review_indexes),
+    (4, "Storico revisioni e riepiloghi giornalieri", _add_review_log),
+    (5, "Indice invertito dei tag", _add_tag_index),
+    (6, "Indice di ricerca full-text (FTS5)", _add_search_index),
+    (7, "Chiave canonica della posizione", _add_position_keys),
+    (8, "Catalogo delle liste con contatori", _add_list_catalog),
+    (9, "Utenti e stato SM-2 per utente", _add_user_state),
+    (10, "Soluzioni precalcolate (UCI e FEN)", _add_solution_lines),
+    (11, "Frontiera dei problemi nuovi aggiornata agli inserimenti", _add_frontier_trigger),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """Restituisce la versione dello schema registrata nel database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Applica in ordine le migrazioni non ancora eseguite, in un'unica transazione.
+    Restituisce la versione finale dello schema.
+    """
+    if get_schema_version(conn) >= LATEST_VERSION:
+        return LATEST_VERSION
 
-def add_list_column():
-    conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
-    
     try:
-        # Aggiungiamo la colonna per il nome della lista
-        cursor.execute("ALTER TABLE problems ADD COLUMN custom_list TEXT")
-        print("Colonna 'custom_list' aggiunta con successo.")
-    except sqlite3.OperationalError as e:
-        print(f"Errore o colonna già esistente: {e}")
+        # IMMEDIATE: più worker gunicorn che partono insieme migrano uno alla volta
+        cursor.execute("BEGIN IMMEDIATE")
+        current = get_schema_version(conn)
+        for version, description, apply in MIGRATIONS:
+            if version <= current:
+                continue
+            apply(cursor)
+            cursor.execute(f"PRAGMA user_version = {version}")
+            print(f"Migrazione v{version} applicata: {description}")
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Errore durante la migrazione dello schema: {e}")
+        raise
+    return get_schema_version(conn)
+
+
+# ----------------------------------------------------------------------
+# VERIFICA E RICOSTRUZIONE DEL CATALOGO DELLE LISTE
+# ----------------------------------------------------------------------
+
+def rebuild_list_catalog(conn):
+    """
+    Ricalcola da zero il catalogo delle liste (lists e i contatori per utente
+    user_list_stats / user_list_due_days) e restituisce quante righe erano
+    diverse da quelle mantenute dai trigger.
+    """
+    list_names = """
+        SELECT s.user_id, s.problem_id, COALESCE(p.custom_list, '')
+        FROM user_problem_state s JOIN problems p ON p.id = s.problem_id
+    """
+    stored_list_names = "SELECT user_id, problem_id, list_name FROM user_problem_state"
+    expected_lists = """
+        SELECT COALESCE(custom_list, ''), COUNT(*) FROM problems
+        GROUP BY COALESCE(custom_list, '')
+    """
+    stored_lists = "SELECT name, total FROM lists"
+    expected_stats = """
+        SELECT user_id, list_name, COUNT(*), ROUND(SUM(ease_factor), 6) FROM user_problem_state
+        GROUP BY user_id, list_name
+    """
+    stored_stats = "SELECT user_id, list_name, started, ROUND(ease_sum, 6) FROM user_list_stats"
+    expected_days = """
+        SELECT user_id, list_name, CAST(next_review / 86400 AS INTEGER), COUNT(*) FROM user_problem_state
+        GROUP BY user_id, list_name, CAST(next_review / 86400 AS INTEGER)
+    """
+    stored_days = "SELECT user_id, list_name, day, count FROM user_list_due_days"
+    pairs = (
+        (list_names, stored_list_names),
+        (expected_lists, stored_lists),
+        (expected_stats, stored_stats),
+        (expected_days, stored_days),
+    )
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        differences = 0
+        for expected, stored in pairs:
+            # Righe mancanti o sbagliate in un verso o nell'altro
+            cursor.execute(f"SELECT COUNT(*) FROM ({expected} EXCEPT {stored})")
+            differences += cursor.fetchone()[0]
+            cursor.execute(f"SELECT COUNT(*) FROM ({stored} EXCEPT {expected})")
+            differences += cursor.fetchone()[0]
+        for sql in LIST_CATALOG_REBUILD_SQL:
+            cursor.execute(sql)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Errore durante la ricostruzione del catalogo delle liste: {e}")
+        raise
+    db_manager.invalidate_lists()
+    return differences
+
+
+# ----------------------------------------------------------------------
+# VERIFICA DEI PIANI DI ESECUZIONE
+# ----------------------------------------------------------------------
+
+def _query_plan(conn, sql, params):
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return [row[3] for row in rows]
+
+
+def check_query_plans(conn):
+    """
+    Verifica con EXPLAIN QUERY PLAN che le query calde usino gli indici.
+    Restituisce la lista degli errori (vuota se tutto è a posto).
+    """
+    # (nome, (sql, parametri), indice atteso, ordinamento temporaneo ammesso)
+    checks = [
+        ("coda di revisione (tutte le liste)",
+         db_manager._review_query(1, None), "idx_state_user_next_review", False),
+        ("coda di revisione (lista filtrata)",
+         db_manager._review_query(1, "Esempio"), "idx_state_user_list_next_review", False),
+        # Problemi mai valutati: in ordine di id, ciascuno controllato sulla chiave primaria dello stato
+        ("problemi nuovi (tutte le liste)",
+         db_manager._new_problems_query(1, None, limit=20), "USING PRIMARY KEY (user_id=? AND problem_id=?)", False),
+        ("problemi nuovi (lista filtrata)",
+         db_manager._new_problems_query(1, "Esempio", limit=20), "idx_problems_custom_list", False),
+        ("elenco liste",
+         (db_manager.UNIQUE_LISTS_SQL, ()), "lists", False),
+        # I problemi con un tag sono pochi: vanno ordinati, ma trovati dall'indice
+        ("coda di revisione per tag",
+         db_manager._review_query(1, None, tags=["Esempio"]), "USING PRIMARY KEY (tag_id=?)", True),
+    ]
+
+    errors = []
+    for name, (sql, params), expected_index, temp_sort_ok in checks:
+        plan = _query_plan(conn, sql, params)
+        plan_text = " | ".join(plan)
+        if expected_index not in plan_text:
+            errors.append(f"{name}: indice {expected_index} non usato ({plan_text})")
+        elif "USE TEMP B-TREE" in plan_text and not temp_sort_ok:
+            errors.append(f"{name}: ordinamento senza indice ({plan_text})")
+    return errors
+
+
+# ----------------------------------------------------------------------
+# VERIFICA DELLA FRONTIERA DEI PROBLEMI NUOVI
+# ----------------------------------------------------------------------
+
+def check_new_frontier():
+    """
+    Verifica di regressione su un database temporaneo: problemi 1-4, i primi tre
+    valutati, la ricarica della coda porta la frontiera a 3; eliminati il 4 e il 3,
+    il problema inserito dopo riprende l'id 3 e deve comparire in coda.
+    Restituisce la lista degli errori (vuota se tutto è a posto).
+    """
+    saved_db_name = db_manager.DB_NAME
+    folder = tempfile.mkdtemp()
+    db_manager.DB_NAME = os.path.join(folder, "frontier_check.db")
+    try:
+        conn = db_manager.create_connection()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                migrate(conn)
+            conn.execute("INSERT OR IGNORE INTO users (id, username, password_hash, created_at) VALUES (1, 'check', '-', 0)")
+            conn.commit()
+        finally:
+            conn.close()
+
+        fens = ["k7/8/8/8/8/8/8/K6R w - - 0 1", "k7/8/8/8/8/8/8/K5R1 w - - 0 1",
+                "k7/8/8/8/8/8/8/K4R2 w - - 0 1", "k7/8/8/8/8/8/8/K3R3 w - - 0 1"]
+        ids = [db_manager.insert_new_problem(fen, ["Rh8#"], []) for fen in fens]
+        for problem_id in ids[:3]:
+            db_manager.update_problem_review(1, problem_id, "Facile")
+        db_manager.get_review_queue_ids(1)
+        db_manager.delete_problem(ids[3])
+        db_manager.delete_problem(ids[2])
+        new_id = db_manager.insert_new_problem("k7/8/8/8/8/8/8/K2R4 w - - 0 1", ["Rd8#"], [])
+
+        errors = []
+        queue, _ = db_manager.get_review_queue_ids(1)
+        if new_id not in queue:
+            errors.append(f"problema nuovo {new_id} (id riusato) assente dalla coda {queue}")
+        new_count = db_manager.get_due_counts(1)["new"]
+        if len(queue) != new_count:
+            errors.append(f"la coda ha {len(queue)} problemi ma i nuovi sono {new_count}")
+        return errors
+    finally:
+        db_manager.DB_NAME = saved_db_name
+        db_manager._pool.close_all()
+        db_manager.invalidate_problems()
+        db_manager.invalidate_lists()
+        shutil.rmtree(folder, ignore_errors=True)
 
-    conn.commit()
-    conn.close()
 
 if __name__ == "__main__":
-    add_list_column()
\ No newline at end of file
+    conn = db_manager.create_connection()
+    if conn is None:
+        sys.exit(1)
+    try:
+        version = migrate(conn)
+        print(f"Schema alla versione {version}.")
+
+        if "--rebuild-lists" in sys.argv:
+            differences = rebuild_list_catalog(conn)
+            print(f"Catalogo delle liste ricostruito ({differences} righe non coerenti corrette).")
+
+        if "--check" in sys.argv:
+            errors = check_query_plans(conn) + check_new_frontier()
+            for error in errors:
+                print(f"ERRORE: {error}")
+            if errors:
+                sys.exit(1)
+            print("Piani di esecuzione OK: le query di revisione usano gli indici.")
+            print("Frontiera dei problemi nuovi OK: gli id riusati tornano in coda.")
+    finally:
+        conn.close()
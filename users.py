@@ -0,0 +1,96 @@
+import argparse
+import getpass
+import os
+import sys
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+import db_manager
+
+# ----------------------------------------------------------------------
+# GESTIONE DEGLI UTENTI
+# Ogni utente ha il proprio stato SM-2 (user_problem_state) sulla banca
+# problemi condivisa. Un utente nuovo non costa nulla finché non ripassa:
+# tutti i problemi sono "nuovi" per lui senza che venga scritta una riga.
+# ----------------------------------------------------------------------
+
+DEFAULT_ADMIN_USERNAME = 'admin'
+DEFAULT_ADMIN_PASSWORD = 'password_scacchi'
+
+
+def add_user(username, password, email=None, user_id=None):
+    """Crea un utente con la password indicata (salvata come hash). Restituisce l'ID o None."""
+    return db_manager.create_user(username, generate_password_hash(password), email, user_id=user_id)
+
+
+def authenticate(username, password):
+    """Restituisce l'utente (dizionario) se username e password sono corretti, altrimenti None."""
+    user = db_manager.get_user_by_username(username or '')
+    if user is None or not check_password_hash(user['password_hash'], password or ''):
+        return None
+    return user
+
+
+def ensure_default_user():
+    """
+    Al primo avvio (nessun utente) crea l'amministratore con ID DEFAULT_USER_ID,
+    che eredita lo stato SM-2 migrato dalla v9. Credenziali da .env
+    (ADMIN_USERNAME, ADMIN_PASSWORD, RECEIVER_EMAIL), con i vecchi valori di default.
+    """
+    if db_manager.get_users():
+        return None
+    return add_user(os.getenv('ADMIN_USERNAME', DEFAULT_ADMIN_USERNAME),
+                    os.getenv('ADMIN_PASSWORD', DEFAULT_ADMIN_PASSWORD),
+                    os.getenv('RECEIVER_EMAIL'),
+                    user_id=db_manager.DEFAULT_USER_ID)
+
+
+def _ask_password():
+    password = getpass.getpass("Password: ")
+    if password != getpass.getpass("Ripeti la password: "):
+        print("Le password non coincidono.")
+        sys.exit(1)
+    return password
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Gestione degli utenti.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help="Aggiunge un utente (la password viene chiesta)")
+    add.add_argument('username')
+    add.add_argument('--email', help="Indirizzo a cui inviare il codice 2FA")
+
+    passwd = commands.add_parser('passwd', help="Cambia password e/o email di un utente")
+    passwd.add_argument('username')
+    passwd.add_argument('--email', help="Nuovo indirizzo (senza --email si cambia la password)")
+
+    commands.add_parser('list', help="Elenca gli utenti")
+    args = parser.parse_args()
+
+    # Porta lo schema all'ultima versione (crea la tabella users se manca)
+    conn = db_manager.create_connection()
+    if conn is None:
+        sys.exit(1)
+    try:
+        import update_db_schema
+        update_db_schema.migrate(conn)
+    finally:
+        conn.close()
+
+    if args.command == 'add':
+        user_id = add_user(args.username, _ask_password(), args.email)
+        if user_id is None:
+            sys.exit(1)
+        print(f"Utente '{args.username}' creato con ID {user_id}.")
+    elif args.command == 'passwd':
+        user = db_manager.get_user_by_username(args.username)
+        if user is None:
+            print(f"Utente '{args.username}' non trovato.")
+            sys.exit(1)
+        password_hash = None if args.email else generate_password_hash(_ask_password())
+        db_manager.update_user(user['id'], password_hash=password_hash, email=args.email)
+        print(f"Utente '{args.username}' aggiornato.")
+    else:
+        for user in db_manager.get_users():
+            print(f"#{user['id']:<5} {user['username']:<20} {user['email'] or '-'}")